@@ -1,8 +1,89 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
 from unfold.admin import ModelAdmin
-from .models import Category, Product
+from unfold.contrib.filters.admin import AutocompleteSelectFilter
+from unfold.widgets import UnfoldAdminDecimalFieldWidget, UnfoldAdminIntegerFieldWidget
+from . import aggregates, bulk, tracking
+from .filters import ProductFilterBackend
+from .models import Category, Job, Product
+
+
+# Tables up to this size are counted exactly, with a bounded COUNT
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_row_count(model, using):
+    """Row count of a table that does not scan it: exact for small tables, approximate above EXACT_COUNT_LIMIT."""
+    rows = model._default_manager.using(using)[:EXACT_COUNT_LIMIT + 1].count()
+    if rows <= EXACT_COUNT_LIMIT:
+        return rows
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return max(row[0], rows)
+    # The highest id, read from the primary key index; counts deleted rows too
+    return max(model._default_manager.using(using).aggregate(highest=Max('pk'))['highest'] or 0, rows)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator for large tables: an unfiltered list takes its size
+    from `estimate` instead of a COUNT(*) over the whole table. Filtered and
+    searched lists are counted exactly.
+    """
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, estimate=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        if self.estimate is not None and not self.object_list.query.where:
+            return self.estimate()
+        return super().count
+
+
+class LargeTableAdmin(ModelAdmin):
+    """Base admin for tables too large to count: estimated pagination and no second, unfiltered count."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page, estimate=lambda: self.estimated_count(queryset.db),
+        )
+
+    def estimated_count(self, using):
+        return estimated_row_count(self.model, using)
+
+
+class ProductBulkEditForm(forms.Form):
+    """Values given to every selected product; empty fields are left unchanged."""
+    price = forms.DecimalField(required=False, max_digits=8, decimal_places=2, min_value=0, widget=UnfoldAdminDecimalFieldWidget)
+    quantity = forms.IntegerField(required=False, min_value=0, widget=UnfoldAdminIntegerFieldWidget)
+    sold_quantity = forms.IntegerField(required=False, min_value=0, widget=UnfoldAdminIntegerFieldWidget)
+    category = forms.ModelChoiceField(Category.objects.all(), required=False)
+
+    def __init__(self, *args, admin_site=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Searched on demand rather than rendering every category
+        category = self.fields['category']
+        category.widget = AutocompleteSelect(Product._meta.get_field('category'), admin_site)
+        category.widget.choices = category.choices
+
+    def changes(self):
+        return {name: value for name, value in self.cleaned_data.items() if value not in (None, '')}
 
 
 # Unregister the default User admin
@@ -11,12 +92,14 @@ admin.site.unregister(User)
 
 # Custom User admin to show last_login
 @admin.register(User)
-class CustomUserAdmin(BaseUserAdmin, ModelAdmin):
+class CustomUserAdmin(BaseUserAdmin, LargeTableAdmin):
     list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff', 'last_login', 'date_joined')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups')
     search_fields = ('email', 'username', 'first_name', 'last_name')  # Email first in search
     readonly_fields = ('last_login', 'date_joined')
-    ordering = ('email',)  # Sort by email by default
+    # Newest first through the primary key; email and the dates have no usable index
+    ordering = ('-id',)
+    sortable_by = ('username',)
 
 
 @admin.register(Category)
@@ -26,8 +109,89 @@ class CategoryAdmin(ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('id', 'name', 'price', 'quantity', 'sold_quantity', 'category')
-    list_filter = ('category',)
-    search_fields = ('name', 'description')
-    list_editable = ('price', 'quantity', 'sold_quantity')
\ No newline at end of file
+    # Rows changed in the list are written together, see changelist_view()
+    list_editable = ('price', 'quantity', 'sold_quantity')
+    list_select_related = ('category',)
+    list_filter = (('category', AutocompleteSelectFilter),)
+    list_filter_submit = True
+    search_fields = ('name',)
+    autocomplete_fields = ('category',)
+    ordering = ('-id',)
+    # Columns with an index (see Product.Meta.indexes)
+    sortable_by = ('id', 'name', 'quantity', 'sold_quantity')
+    actions = ('bulk_edit',)
+
+    def estimated_count(self, using):
+        # Kept exact by the dashboard counters
+        return aggregates.get_totals().product_count
+
+    def get_search_results(self, request, queryset, search_term):
+        # Word-prefix search through the full-text index instead of a LIKE scan
+        if not search_term:
+            return queryset, False
+        return ProductFilterBackend().search(queryset, search_term), False
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'POST' or '_save' not in request.POST:
+            return super().changelist_view(request, extra_context)
+        # save_model() collects the edited rows, written with one UPDATE once the formset is saved
+        request.changelist_edits = {}
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            response = super().changelist_view(request, extra_context)
+            self.save_changelist_edits(request.changelist_edits)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        edits = getattr(request, 'changelist_edits', None)
+        if edits is None:
+            return super().save_model(request, obj, form, change)
+        edits[obj.pk] = {name: getattr(obj, name) for name in form.changed_data}
+
+    def save_changelist_edits(self, edits):
+        if not edits:
+            return
+        # Locked, so that the deltas start from the rows that are overwritten
+        products = Product.objects.select_for_update().in_bulk(edits)
+        changes = []
+        for pk, product in products.items():
+            before = aggregates.snapshot(product)
+            for name, value in edits[pk].items():
+                setattr(product, name, value)
+            changes.append((before, aggregates.snapshot(product)))
+        with tracking.suppressed():
+            bulk.update_rows(products.values(), list(self.list_editable))
+            tracking.product_changes(changes)
+
+    @admin.action(description='Edit selected products')
+    def bulk_edit(self, request, queryset):
+        form = ProductBulkEditForm(request.POST if 'apply' in request.POST else None, admin_site=self.admin_site)
+        if form.is_bound and form.is_valid():
+            changes = form.changes()
+            if not changes:
+                self.message_user(request, 'Nothing to change.', messages.WARNING)
+                return None
+            updated = bulk.assign(queryset, changes)
+            self.message_user(request, f'{updated} product(s) updated.', messages.SUCCESS)
+            return None
+        return TemplateResponse(request, 'admin/api/product/bulk_edit.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Edit selected products',
+            'opts': self.model._meta,
+            'form': form,
+            'media': self.media + form.media,
+            'count': queryset.count(),
+            'action': 'bulk_edit',
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'total', 'user', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    list_select_related = ('user',)
+    readonly_fields = ('result', 'error', 'progress', 'total', 'worker', 'started_at', 'heartbeat_at', 'finished_at')
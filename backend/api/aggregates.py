@@ -0,0 +1,230 @@
+"""
+Precomputed dashboard figures.
+
+Every product write is reduced to a (before, after) pair of snapshots. The
+difference between the two is applied to StockTotals and CategoryTotals with
+F() expressions, so reading the dashboard never scans the product table.
+Code paths that bypass model signals (bulk_create, queryset.update, ...) must
+call apply_changes() themselves; `manage.py rebuild_stats` repairs any drift.
+A product counts as low on stock below its alert level (see api.alerts).
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+
+from . import alerts
+from .models import Category, CategoryTotals, Product, StockTotals
+
+TOTALS_PK = 1
+
+Snapshot = namedtuple('Snapshot', ['id', 'category_id', 'price', 'quantity', 'sold_quantity', 'alert_level'])
+
+STOCK_VALUE = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=2))
+
+
+def snapshot(product):
+    return Snapshot(
+        product.pk, product.category_id, Decimal(str(product.price)), product.quantity, product.sold_quantity, product.alert_level,
+    )
+
+
+def loaded_snapshot(product):
+    """
+    Snapshot of the product as it is stored in the database, or None for a new product.
+    Inside a transaction the row stays locked until the commit, so concurrent writes
+    of the same product apply their deltas one after the other.
+    """
+    if product.pk is None or product._state.adding:
+        return None
+    queryset = Product.objects.filter(pk=product.pk)
+    if transaction.get_connection().in_atomic_block:
+        queryset = queryset.select_for_update()
+    row = queryset.values_list(*Snapshot._fields).first()
+    if row is None:
+        return None
+    return Snapshot(row[0], row[1], Decimal(str(row[2])), *row[3:])
+
+
+def _collect(changes):
+    totals = defaultdict(int)
+    totals['stock_value'] = Decimal(0)
+    buckets = defaultdict(lambda: [0, 0, Decimal(0)])
+    for before, after in changes:
+        for snap, sign in ((before, -1), (after, 1)):
+            if snap is None:
+                continue
+            value = snap.price * snap.quantity
+            totals['product_count'] += sign
+            totals['stock_units'] += sign * snap.quantity
+            totals['stock_value'] += sign * value
+            if snap.quantity < snap.alert_level:
+                totals['low_stock_count'] += sign
+            if snap.quantity == 0:
+                totals['out_of_stock_count'] += sign
+            bucket = buckets[snap.category_id]
+            bucket[0] += sign
+            bucket[1] += sign * snap.quantity
+            bucket[2] += sign * value
+    return totals, buckets
+
+
+def _add(model, lookup, deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    expressions = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**expressions):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.get_or_create(**lookup)
+    except IntegrityError:
+        # The category was deleted concurrently, nothing left to count
+        return
+    model.objects.filter(**lookup).update(**expressions)
+
+
+def apply_changes(changes):
+    """Apply an iterable of (before, after) snapshots; None stands for "does not exist"."""
+    totals, buckets = _collect(changes)
+    uncategorized = buckets.pop(None, (0, 0, 0))
+    totals['uncategorized_count'] = uncategorized[0]
+    totals['uncategorized_units'] = uncategorized[1]
+    totals['uncategorized_value'] = uncategorized[2]
+    with transaction.atomic():
+        _add(StockTotals, {'pk': TOTALS_PK}, totals)
+        for category_id, (count, units, value) in buckets.items():
+            _add(CategoryTotals, {'category_id': category_id}, {
+                'product_count': count,
+                'stock_units': units,
+                'stock_value': value,
+            })
+
+
+def move_to_uncategorized(category_id):
+    """Account for the SET_NULL that happens when a category is deleted."""
+    row = CategoryTotals.objects.filter(category_id=category_id).values(
+        'product_count', 'stock_units', 'stock_value').first()
+    if row is None:
+        return
+    _add(StockTotals, {'pk': TOTALS_PK}, {
+        'uncategorized_count': row['product_count'],
+        'uncategorized_units': row['stock_units'],
+        'uncategorized_value': row['stock_value'],
+    })
+
+
+def refresh_low_stock_count():
+    """Recount the low-stock products after alert levels changed; reads the margin index, not the table."""
+    with transaction.atomic():
+        count = alerts.low_stock().count()
+        if not StockTotals.objects.filter(pk=TOTALS_PK).update(low_stock_count=count):
+            rebuild()
+
+
+def get_totals():
+    totals = StockTotals.objects.filter(pk=TOTALS_PK).first()
+    if totals is None:
+        totals = rebuild()
+    return totals
+
+
+async def aget_totals():
+    totals = await StockTotals.objects.filter(pk=TOTALS_PK).afirst()
+    if totals is None:
+        totals = await sync_to_async(rebuild)()
+    return totals
+
+
+def compute():
+    """Recompute every figure from the product table. Returns (totals, {category_id: figures})."""
+    totals = Product.objects.aggregate(
+        product_count=Count('id'),
+        stock_units=Sum('quantity'),
+        stock_value=Sum(STOCK_VALUE),
+        low_stock_count=Count('id', filter=Q(quantity__lt=F('alert_level'))),
+        out_of_stock_count=Count('id', filter=Q(quantity=0)),
+    )
+    categories = {category_id: {'product_count': 0, 'stock_units': 0, 'stock_value': Decimal(0)}
+                  for category_id in Category.objects.values_list('id', flat=True)}
+    rows = Product.objects.values('category_id').annotate(
+        product_count=Count('id'),
+        stock_units=Sum('quantity'),
+        stock_value=Sum(STOCK_VALUE),
+    ).order_by()
+    totals.update(uncategorized_count=0, uncategorized_units=0, uncategorized_value=Decimal(0))
+    for row in rows:
+        category_id = row.pop('category_id')
+        if category_id is None:
+            totals['uncategorized_count'] = row['product_count']
+            totals['uncategorized_units'] = row['stock_units']
+            totals['uncategorized_value'] = row['stock_value']
+        else:
+            categories[category_id] = row
+    for figures in [totals, *categories.values()]:
+        for field, value in figures.items():
+            figures[field] = _normalize(field, value)
+    return totals, categories
+
+
+def _normalize(field, value):
+    if value is None:
+        value = 0
+    if field.endswith('value'):
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    return value
+
+
+def rebuild():
+    alerts.refresh_levels()
+    totals, categories = compute()
+    with transaction.atomic():
+        StockTotals.objects.update_or_create(pk=TOTALS_PK, defaults=totals)
+        CategoryTotals.objects.exclude(category_id__in=categories.keys()).delete()
+        existing = set(CategoryTotals.objects.values_list('category_id', flat=True))
+        CategoryTotals.objects.bulk_create([
+            CategoryTotals(category_id=category_id)
+            for category_id in categories.keys() - existing
+        ])
+        rows = list(CategoryTotals.objects.all())
+        for row in rows:
+            for field, value in categories[row.category_id].items():
+                setattr(row, field, value)
+        CategoryTotals.objects.bulk_update(rows, ['product_count', 'stock_units', 'stock_value'], batch_size=500)
+    return StockTotals.objects.get(pk=TOTALS_PK)
+
+
+def verify():
+    """Compare the stored figures with a fresh computation and return a list of differences."""
+    totals, categories = compute()
+    problems = []
+    stored = StockTotals.objects.filter(pk=TOTALS_PK).values(*totals.keys()).first()
+    if stored is None:
+        problems.append('stock totals row is missing')
+    else:
+        for field, expected in totals.items():
+            actual = _normalize(field, stored[field])
+            if actual != expected:
+                problems.append(f'totals.{field}: stored {actual}, expected {expected}')
+    stored_categories = {
+        row.pop('category_id'): row
+        for row in CategoryTotals.objects.values('category_id', 'product_count', 'stock_units', 'stock_value')
+    }
+    for category_id, figures in categories.items():
+        row = stored_categories.pop(category_id, None)
+        if row is None:
+            problems.append(f'category {category_id}: totals row is missing')
+            continue
+        for field, expected in figures.items():
+            actual = _normalize(field, row[field])
+            if actual != expected:
+                problems.append(f'category {category_id}.{field}: stored {actual}, expected {expected}')
+    for category_id in stored_categories:
+        problems.append(f'category {category_id}: orphan totals row')
+    stale = alerts.stale_levels()
+    if stale:
+        problems.append(f'{stale} product(s) with an outdated low-stock alert level')
+    return problems
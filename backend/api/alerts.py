@@ -0,0 +1,114 @@
+"""
+Low-stock alerts and best-seller leaderboards.
+
+A product is low on stock while its quantity is below its alert level: its own
+low_stock_threshold, else its category's, else
+STOCK_ALERTS['LOW_STOCK_THRESHOLD']. The level in effect is stored on the
+product (Product.alert_level) when the product is written and when a category
+threshold changes, so "low on stock" is the indexed expression
+quantity - alert_level < 0 and a sale never has to look a threshold up.
+
+Leaderboards rank products by units sold or by revenue (price * sold_quantity),
+for the whole catalogue or within a category. Every list is read one page at a
+time from an index (see Product.Meta.indexes), so its cost does not grow with
+the catalogue. After changing the default threshold, run `manage.py
+rebuild_stats` to store the new levels.
+"""
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from .models import REVENUE, STOCK_MARGIN, Category, Product
+
+UNITS = 'units'
+BY_REVENUE = 'revenue'
+
+# Page orderings; the first key is the cursor position, ties fall back to the offset
+RANKINGS = {
+    UNITS: ('-sold_quantity', '-id'),
+    BY_REVENUE: ('-revenue_rank', '-id'),
+}
+LOW_STOCK_ORDERING = ('stock_margin', 'id')
+
+DEFAULTS = {
+    'LOW_STOCK_THRESHOLD': 5,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'STOCK_ALERTS', {}).get(name, DEFAULTS[name])
+
+
+def level(threshold, category_threshold=None):
+    """Alert level of a product from its own threshold and its category's."""
+    if threshold is not None:
+        return threshold
+    if category_threshold is not None:
+        return category_threshold
+    return get_setting('LOW_STOCK_THRESHOLD')
+
+
+def assign_levels(products):
+    """
+    Set alert_level on product instances about to be written. Categories
+    loaded with the products are used as they are; the thresholds of the
+    others are read with one query.
+    """
+    products = list(products)
+    thresholds = {}
+    missing = set()
+    for product in products:
+        if product.category_id is None:
+            continue
+        if Product.category.is_cached(product) and product.category is not None:
+            thresholds[product.category_id] = product.category.low_stock_threshold
+        else:
+            missing.add(product.category_id)
+    missing -= thresholds.keys()
+    if missing:
+        thresholds.update(Category.objects.filter(pk__in=missing).values_list('pk', 'low_stock_threshold'))
+    for product in products:
+        product.alert_level = level(product.low_stock_threshold, thresholds.get(product.category_id))
+
+
+def refresh_category(category_id, threshold):
+    """Store the level of a category (None: no category) on its products without a threshold of their own."""
+    new_level = level(None, threshold)
+    return (
+        Product.objects.filter(category_id=category_id, low_stock_threshold__isnull=True)
+        .exclude(alert_level=new_level)
+        .update(alert_level=new_level)
+    )
+
+
+def refresh_levels():
+    """Recompute every stored level, e.g. after the default threshold changed. Returns the number of products updated."""
+    updated = (
+        Product.objects.filter(low_stock_threshold__isnull=False)
+        .exclude(alert_level=F('low_stock_threshold'))
+        .update(alert_level=F('low_stock_threshold'))
+    )
+    for category_id, threshold in Category.objects.values_list('pk', 'low_stock_threshold'):
+        updated += refresh_category(category_id, threshold)
+    return updated + refresh_category(None, None)
+
+
+def stale_levels():
+    """Number of products whose stored level does not match their thresholds."""
+    expected = Coalesce('low_stock_threshold', 'category__low_stock_threshold', Value(get_setting('LOW_STOCK_THRESHOLD')))
+    return Product.objects.exclude(alert_level=expected).count()
+
+
+def low_stock(queryset=None):
+    """Products below their alert level; sort with LOW_STOCK_ORDERING to read them most urgent first."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    return queryset.annotate(stock_margin=STOCK_MARGIN).filter(stock_margin__lt=0)
+
+
+def leaderboard(by, queryset=None):
+    """Products that sold at least once, with their revenue; sort with RANKINGS[by]."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset = queryset.annotate(revenue=F('price') * F('sold_quantity'))
+    if by == BY_REVENUE:
+        return queryset.annotate(revenue_rank=REVENUE).filter(revenue_rank__gt=0)
+    return queryset.filter(sold_quantity__gt=0)
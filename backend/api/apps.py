@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import database, fts, metrics, signals  # noqa: F401
+        post_migrate.connect(fts.ensure_after_migrate, sender=self)
+        connection_created.connect(database.configure_sqlite)
+        connection_created.connect(metrics.install_query_recorder)
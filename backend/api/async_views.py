@@ -0,0 +1,259 @@
+"""
+Async read endpoints for ASGI deployments (enabled by settings.ASYNC_READ_VIEWS).
+
+GET and HEAD on the product list and detail, the category list, the stats
+and auth/me are served by coroutines that authenticate the JWT and query
+through Django's async ORM. They return the same JSON, cursors and ETags as
+the DRF views and share their response cache. Every other method is handed
+to the DRF view in a worker thread.
+
+In Django 4.2 the async ORM still runs each query in the thread-sensitive
+sync executor, so queries do not run in parallel; what the async path saves
+is a worker thread per waiting request, and the stats queries are issued
+together instead of one after the other.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import aggregates, caching, changes, fts, history, rows
+from .authentication import ClaimsUser, TimedJWTAuthentication, aget_state, check_state
+from .filters import CategoryOrderingFilter, ProductFilterBackend
+from .metrics import timed
+from .models import Category, Product
+from .pagination import ProductCursorPagination
+from .renderers import FastJSONRenderer
+from .serializer import CategoryStatsSerializer, ProductSerializer, UserSerializer
+from .views import CategoryViewSet, CurrentUserView, ProductViewSet, StatsView, stats_payload, top_categories, top_selling_products
+
+MEDIA_TYPE = 'application/json'
+
+
+class AsyncJWTAuthentication(TimedJWTAuthentication):
+    """
+    JWTAuthentication for the async views. Without a `queryset` the user is
+    built from the token claims like StatelessJWTAuthentication does; with one,
+    it is loaded through the async ORM.
+    """
+
+    async def aauthenticate(self, request, queryset=None):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if queryset is None:
+            return await self.aget_claims_user(validated_token)
+        return await self.aget_user(validated_token, queryset)
+
+    async def aget_claims_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        state, user_roles = await aget_state(user_id)
+        check_state(validated_token, state)
+        return ClaimsUser(user_id, state['username'], user_roles)
+
+    async def aget_user(self, validated_token, queryset=None):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        queryset = self.user_model.objects.all() if queryset is None else queryset
+        try:
+            user = await queryset.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        check_state(validated_token, {'is_active': user.is_active, 'password': get_md5_hash_password(user.password)})
+        return user
+
+
+def render(data, status=200, headers=None, renderer_class=JSONRenderer):
+    with timed('serialization'):
+        content = renderer_class().render(data)
+    return HttpResponse(content, status=status, content_type=MEDIA_TYPE, headers=headers)
+
+
+class AsyncReadView(View):
+    """
+    Base class: subclasses implement `read()`; `fallback` is the DRF view that
+    handles the other methods. `cache_models` enables the shared response cache.
+    """
+    fallback = None
+    cache_models = ()
+    user_queryset = None
+    renderer_class = JSONRenderer
+    authentication = AsyncJWTAuthentication()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # JWT only, like the DRF views
+        view.csrf_exempt = True
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            with timed('auth'):
+                user = await self.authentication.aauthenticate(request, self.user_queryset)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+            labels = [model._meta.label_lower for model in self.cache_models]
+            if labels:
+                key, etag, cached = caching.lookup(request, labels, MEDIA_TYPE)
+                if cached is not None:
+                    return cached
+            drf_request = Request(request)
+            drf_request.user = user
+            response = render(await self.read(drf_request, *args, **kwargs), renderer_class=self.renderer_class)
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+        if labels:
+            response['ETag'] = etag
+            caching.store(key, response)
+        return response
+
+    def handle_exception(self, request, exc):
+        response = exception_handler(exc, {'request': request, 'view': self})
+        headers = None
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers = {'WWW-Authenticate': self.authentication.authenticate_header(request)}
+        return render(response.data, response.status_code, headers)
+
+    async def read(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.fallback)(request, *args, **kwargs)
+
+    post = put = patch = delete = options = delegate
+
+
+class ProductListView(AsyncReadView):
+    fallback = ProductViewSet.as_view({'get': 'list', 'post': 'create'})
+    cache_models = (Product, Category)
+    renderer_class = FastJSONRenderer
+
+    async def read(self, request):
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
+        if 'search' in request.query_params:
+            # Cached after the first call; the check itself reads the schema
+            await sync_to_async(fts.is_available)(connection)
+        queryset = ProductFilterBackend().filter_queryset(request, queryset, None)
+        paginator = ProductCursorPagination()
+        plan = rows.for_request(ProductSerializer, request)
+        if plan is None:
+            page = await paginator.apaginate_queryset(queryset, request)
+            data = ProductSerializer(page, many=True, context={'request': request}).data
+        else:
+            # Same rows as ProductViewSet.list (see api.rows)
+            columns, build = plan
+            queryset = queryset.values(*dict.fromkeys(columns + rows.ordering_columns(paginator)))
+            page = await paginator.apaginate_queryset(queryset, request)
+            with timed('serialization'):
+                data = [build(row) for row in page]
+        return paginator.get_paginated_response(data).data
+
+
+class ProductDetailView(AsyncReadView):
+    fallback = ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+    cache_models = (Product, Category)
+
+    async def read(self, request, pk):
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
+        try:
+            product = await queryset.aget(pk=pk)
+        except (Product.DoesNotExist, ValueError, TypeError):
+            raise exceptions.NotFound()
+        return ProductSerializer(product, context={'request': request}).data
+
+
+class CategoryListView(AsyncReadView):
+    fallback = CategoryViewSet.as_view({'get': 'list', 'post': 'create'})
+    cache_models = (Category, Product)
+    renderer_class = FastJSONRenderer
+
+    async def read(self, request):
+        queryset = CategoryStatsSerializer.setup_eager_loading(Category.objects.all())
+        queryset = CategoryOrderingFilter().filter_queryset(request, queryset, None)
+        plan = rows.for_request(CategoryStatsSerializer, request)
+        if plan is None:
+            categories = [category async for category in queryset]
+            return CategoryStatsSerializer(categories, many=True, context={'request': request}).data
+        columns, build = plan
+        values = [row async for row in queryset.values(*columns)]
+        with timed('serialization'):
+            return [build(row) for row in values]
+
+
+class StatsReadView(AsyncReadView):
+    fallback = StatsView.as_view()
+    cache_models = (Product, Category)
+
+    async def read(self, request):
+        async def collect(queryset):
+            return [row async for row in queryset]
+
+        totals, categories, top_products, evolution = await asyncio.gather(
+            aggregates.aget_totals(),
+            collect(top_categories()),
+            collect(top_selling_products()),
+            history.amonthly_evolution(months=12),
+        )
+        return stats_payload(totals, categories, top_products, evolution)
+
+
+class CurrentUserReadView(AsyncReadView):
+    fallback = CurrentUserView.as_view()
+    # Roles are read from the prefetched groups, so serializing costs no query
+    user_queryset = UserSerializer.setup_eager_loading(User.objects.all())
+
+    async def read(self, request):
+        return UserSerializer(request.user).data
+
+
+class ChangeStreamView(AsyncReadView):
+    """
+    Server-sent events of the change feed (api.changes). EventSource cannot
+    send headers, so the access token may also be given as ?access_token=.
+    Resumes from the Last-Event-ID header, or from ?since=.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            # A WSGI worker would be held for the whole stream
+            return render({'detail': 'The change stream needs the ASGI server; poll changes/ instead.'}, 501)
+        try:
+            with timed('auth'):
+                user = await self.authentication.aauthenticate(request)
+                if user is None and request.GET.get('access_token'):
+                    token = self.authentication.get_validated_token(request.GET['access_token'])
+                    user = await self.authentication.aget_claims_user(token)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+        since = request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+        response = StreamingHttpResponse(
+            changes.stream(int(since) if since.isdigit() else None), content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Ask nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
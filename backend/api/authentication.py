@@ -1,5 +1,16 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import roles
+from .metrics import timed
 
 User = get_user_model()
 
@@ -16,12 +27,141 @@ class EmailBackend(ModelBackend):
             return None
         
         # Check password
-        if user.check_password(password):
+        if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None
+        # The email matched: stop here rather than let ModelBackend look the
+        # value up as a username and hash the password a second time
+        raise PermissionDenied
     
     def get_user(self, user_id):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """JWT authentication for the API that reports its time to the request metrics (see api.metrics)."""
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+
+def state_key(user_id):
+    return f'api:auth:{user_id}'
+
+
+def get_state(user_id):
+    """
+    What a request needs to know about `user_id` besides the token: its
+    username, whether it is active and the hash of its password (tokens are
+    revoked when it changes). Cached for AUTH_STATE_CACHE_TIMEOUT seconds and
+    invalidated when the user is saved or deleted (see api.signals), like the
+    roles (api.roles), which are fetched in the same cache round-trip.
+    Returns (state or None when the user does not exist, roles).
+    """
+    state, user_roles = get_cached_state(user_id)
+    if state is None:
+        state = store_state(user_id, state_query(user_id).first())
+    if user_roles is None and state:
+        user_roles = roles.load_roles(user_id)
+    return state or None, user_roles
+
+
+async def aget_state(user_id):
+    """get_state() for async views, with the queries on a cache miss made through the async ORM."""
+    state, user_roles = get_cached_state(user_id)
+    if state is None:
+        state = store_state(user_id, await state_query(user_id).afirst())
+    if user_roles is None and state:
+        user_roles = await sync_to_async(roles.load_roles)(user_id)
+    return state or None, user_roles
+
+
+def get_cached_state(user_id):
+    keys = [state_key(user_id), roles.cache_key(user_id)]
+    cached = cache.get_many(keys)
+    return cached.get(keys[0]), cached.get(keys[1])
+
+
+def state_query(user_id):
+    return User.objects.filter(pk=user_id).values('username', 'is_active', 'password')
+
+
+def store_state(user_id, row):
+    # A missing user is cached too, as an empty state
+    state = row or {}
+    if state:
+        state['password'] = get_md5_hash_password(state['password'])
+    cache.set(state_key(user_id), state, getattr(settings, 'AUTH_STATE_CACHE_TIMEOUT', 60))
+    return state
+
+
+def invalidate_state(user_ids):
+    cache.delete_many([state_key(user_id) for user_id in user_ids])
+
+
+def check_state(validated_token, state):
+    """The checks JWTAuthentication.get_user() makes on the User row, made on the cached state."""
+    if state is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not state['is_active']:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN and validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != state['password']:
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+
+
+class ClaimsUser:
+    """
+    request.user for StatelessJWTAuthentication: id, username and roles come
+    from the token and the cached state, so permission checks cost no query.
+    Any other attribute (email, save(), ...) loads the User row once and is
+    read from or written to it.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, user_id, username, user_roles):
+        self.__dict__.update(id=user_id, pk=user_id, _username=username, _roles=user_roles, _user=None)
+
+    @property
+    def username(self):
+        return self._username if self._user is None else self._user.username
+
+    def get_user(self):
+        if self._user is None:
+            user = User.objects.get(pk=self.pk)
+            user._roles = self._roles
+            self.__dict__['_user'] = user
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.get_user(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_user(), name, value)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk and getattr(other, 'is_authenticated', False)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.username
+
+
+class StatelessJWTAuthentication(TimedJWTAuthentication):
+    """
+    Authenticates from the token claims plus one cache read: no query on the
+    User table unless the view needs more than the id, username and roles.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        state, user_roles = get_state(user_id)
+        check_state(validated_token, state)
+        return ClaimsUser(user_id, state['username'], user_roles)
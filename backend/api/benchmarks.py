@@ -0,0 +1,940 @@
+"""
+Benchmark scenarios run by `manage.py benchmark`.
+
+Each scenario is a function registered with @scenario(name). It receives the
+parsed command options and returns a list of result rows (dicts). Scenarios
+run against a throwaway test database created by the command, never against
+the configured database.
+"""
+import csv
+import json
+import multiprocessing
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import aggregates
+from .models import Category, Product
+
+SCENARIOS = {}
+
+BENCH_PASSWORD = 'bench-password'
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(label, func, repeat=5, extra=None):
+    """
+    Run func `repeat` times and return a result row with timings in milliseconds.
+    `extra` maps the last return value of func to additional columns.
+    """
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    row = {
+        'case': label,
+        'mean_ms': round(statistics.mean(samples), 2),
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+    }
+    if extra is not None:
+        row.update(extra(result))
+    return row
+
+
+def seed_products(count, categories=10):
+    """Create `count` products spread over `categories` categories, without going through signals."""
+    if Product.objects.count() >= count:
+        return
+    category_ids = [
+        Category.objects.create(name=f'Category {i}').pk
+        for i in range(categories)
+    ]
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}',
+            price=Decimal(i % 1000) + Decimal('0.99'),
+            quantity=i % 50,
+            sold_quantity=i % 17,
+            category_id=category_ids[i % len(category_ids)] if i % 20 else None,
+        )
+        for i in range(Product.objects.count(), count)
+    ], batch_size=1000)
+    aggregates.rebuild()
+
+
+def seed_users(per_role, password=BENCH_PASSWORD):
+    """
+    Create `per_role` users in each role (and as many without a group), all with
+    `password`, hashed once. Returns {role or None: [users]}.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    from .roles import ADMIN, MANAGER, READER
+
+    encoded = make_password(password)
+    users = {}
+    for role in (ADMIN, MANAGER, READER, None):
+        name = (role or 'nogroup').lower()
+        users[role] = []
+        for i in range(per_role):
+            user, created = User.objects.get_or_create(
+                username=f'seed-{name}-{i}', defaults={'email': f'{name}-{i}@seed.local', 'password': encoded},
+            )
+            if created and role:
+                user.groups.add(Group.objects.get_or_create(name=role)[0])
+            users[role].append(user)
+    return users
+
+
+def token_client(user):
+    """APIClient sending a real access token for `user`, so authentication is part of the timings."""
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from .roles import add_claims
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {add_claims(RefreshToken.for_user(user), user).access_token}')
+    return client
+
+
+def api_client(role=None):
+    user, created = User.objects.get_or_create(username=f'bench-{role or "user"}', defaults={'email': f'{role or "user"}@bench.local'})
+    if created and role:
+        user.groups.add(Group.objects.get_or_create(name=role)[0])
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@scenario('product_list')
+def product_list(options):
+    """Unbounded list (previous behaviour) against cursor pages and sparse fieldsets."""
+    from .serializer import ProductSerializer
+
+    seed_products(options['products'])
+    client = api_client()
+    repeat = options['repeat']
+    size = lambda response: {'bytes': len(response.content)}
+
+    def unbounded():
+        data = ProductSerializer(Product.objects.all(), many=True).data
+        return JSONRenderer().render(data)
+
+    def walk_pages():
+        response = client.get('/products/api/v1/products/', {'page_size': 500})
+        total = len(response.content)
+        # Cache hits are plain HttpResponses, so read the link from the body
+        while response.json()['next']:
+            response = client.get(response.json()['next'])
+            total += len(response.content)
+        return total
+
+    return [
+        measure('unbounded list', unbounded, repeat, extra=lambda body: {'bytes': len(body)}),
+        measure('first page (100)', lambda: client.get('/products/api/v1/products/'), repeat, extra=size),
+        measure('first page, ?fields=id,name,price,quantity',
+                lambda: client.get('/products/api/v1/products/', {'fields': 'id,name,price,quantity'}), repeat, extra=size),
+        measure('all pages (500 per page)', walk_pages, repeat, extra=lambda total: {'bytes': total}),
+    ]
+
+
+@scenario('bulk_write')
+def bulk_write(options):
+    """Rows per second through the per-item endpoints against the bulk endpoint."""
+    seed_products(options['products'])
+    client = api_client('Manager')
+    rows = options['batch']
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:rows])
+    items = [{'name': f'Bulk {i}', 'price': '4.99', 'quantity': i % 40} for i in range(rows)]
+    throughput = lambda _: {'rows': rows}
+
+    def per_item_create():
+        for item in items:
+            client.post('/products/api/v1/products/', item, format='json')
+
+    def per_item_update():
+        for i, pk in enumerate(ids):
+            client.patch(f'/products/api/v1/products/{pk}/', {'quantity': i % 30}, format='json')
+
+    results = [
+        measure('per-item POST', per_item_create, 1, extra=throughput),
+        measure('bulk POST', lambda: client.post('/products/api/v1/products/bulk/', items, format='json'), 1, extra=throughput),
+        measure('per-item PATCH', per_item_update, 1, extra=throughput),
+        measure('bulk PATCH', lambda: client.patch(
+            '/products/api/v1/products/bulk/', [{'id': pk, 'quantity': i % 30} for i, pk in enumerate(ids)], format='json',
+        ), 1, extra=throughput),
+    ]
+    for row in results:
+        row['rows_per_s'] = round(row['rows'] / (row['mean_ms'] / 1000))
+    return results
+
+
+@scenario('export')
+def export_catalogue(options):
+    """Time to first byte, total time and peak Python memory of the streaming export."""
+    from .serializer import ProductSerializer
+
+    seed_products(options['products'])
+    client = api_client()
+    results = []
+
+    def unbounded():
+        return JSONRenderer().render(ProductSerializer(Product.objects.select_related('category'), many=True).data)
+
+    def streamed(fmt):
+        def run():
+            start = time.perf_counter()
+            response = client.get(f'/products/api/v1/products/export/{fmt}/')
+            chunks = iter(response.streaming_content)
+            size = len(next(chunks))
+            first_byte = (time.perf_counter() - start) * 1000
+            size += sum(len(chunk) for chunk in chunks)
+            return {'ttfb_ms': round(first_byte, 2), 'bytes': size}
+        return run
+
+    for label, func in [('in-memory list', lambda: {'bytes': len(unbounded())}),
+                        ('streamed csv', streamed('csv')),
+                        ('streamed ndjson', streamed('ndjson'))]:
+        tracemalloc.start()
+        row = measure(label, func, options['repeat'], extra=lambda extra: extra)
+        row['peak_mem_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+        results.append(row)
+    return results
+
+
+@scenario('import')
+def import_catalogue(options):
+    """Throughput and peak memory of the streaming CSV import (new rows, then the same file as updates)."""
+    from .imports import import_products
+
+    rows = options['products']
+    with tempfile.NamedTemporaryFile('w+', suffix='.csv', newline='', encoding='utf-8') as source:
+        writer = csv.writer(source)
+        writer.writerow(['name', 'price', 'quantity', 'sold_quantity', 'category'])
+        for i in range(rows):
+            writer.writerow([f'Imported {i}', f'{i % 500}.50', i % 60, i % 9, f'Supplier category {i % 25}'])
+        source.flush()
+
+        results = []
+        for label in ('import (insert)', 'import (upsert existing)'):
+            source.seek(0)
+            tracemalloc.start()
+            row = measure(label, lambda: import_products(source), 1, extra=lambda report: {
+                'created': report.created, 'updated': report.updated, 'failed': report.failed,
+            })
+            row['peak_mem_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+            row['rows_per_s'] = round(rows / (row['mean_ms'] / 1000))
+            results.append(row)
+    return results
+
+
+@scenario('search')
+def search(options):
+    """
+    Latency of the product filters at a tenth of --products and at --products;
+    indexed filters should barely move while the unindexed icontains scan grows
+    with the table. The response cache is cleared before every request.
+    """
+    from . import caching
+
+    client = api_client()
+    cases = [
+        ('category + min_price', {'category': None, 'min_price': '500'}),
+        ('max_quantity', {'max_quantity': '2'}),
+        ('low_stock', {'low_stock': 'true'}),
+        ('name prefix', {'name': 'Product 4321'}),
+        ('search (fts)', {'search': 'product 4321'}),
+    ]
+
+    def request(params):
+        def run():
+            caching.get_cache().clear()
+            return client.get('/products/api/v1/products/', params)
+        return run
+
+    results = []
+    for size in (max(1, options['products'] // 10), options['products']):
+        seed_products(size)
+        category_id = Category.objects.order_by('pk').values_list('pk', flat=True).first()
+        for label, params in cases:
+            if 'category' in params:
+                params = dict(params, category=category_id)
+            row = measure(label, request(params), options['repeat'], extra=lambda response: {'status': response.status_code})
+            results.append({'products': size, **row})
+        scan = lambda: list(Product.objects.filter(name__icontains='product 4321').order_by('id')[:100])
+        results.append({'products': size, **measure('icontains scan (baseline)', scan, options['repeat'])})
+    return results
+
+
+@scenario('leaderboards')
+def leaderboards(options):
+    """
+    First page of the leaderboards and low-stock lists at a tenth of --products
+    and at --products: the query alone and the endpoint with the response cache
+    cleared. The queries read an index, so their time should not grow with the
+    table; the unindexed revenue sort is the baseline.
+    """
+    from django.db.models import F
+
+    from . import alerts, caching
+
+    client = api_client()
+
+    def query(queryset, ordering):
+        return lambda: list(queryset.order_by(*ordering)[:20])
+
+    def request(path, params):
+        def run():
+            caching.get_cache().clear()
+            return client.get(path, params)
+        return run
+
+    results = []
+    for size in (max(1, options['products'] // 10), options['products']):
+        seed_products(size)
+        category_id = Category.objects.order_by('pk').values_list('pk', flat=True).first()
+        in_category = Product.objects.filter(category_id=category_id)
+        cases = [
+            ('top units', query(alerts.leaderboard(alerts.UNITS), alerts.RANKINGS[alerts.UNITS])),
+            ('top revenue', query(alerts.leaderboard(alerts.BY_REVENUE), alerts.RANKINGS[alerts.BY_REVENUE])),
+            ('top revenue in category', query(alerts.leaderboard(alerts.BY_REVENUE, in_category), alerts.RANKINGS[alerts.BY_REVENUE])),
+            ('low stock', query(alerts.low_stock(), alerts.LOW_STOCK_ORDERING)),
+            ('low stock in category', query(alerts.low_stock(in_category), alerts.LOW_STOCK_ORDERING)),
+            # Same ranking with the operands swapped, which no index matches
+            ('revenue sort (baseline)', query(Product.objects.annotate(revenue=F('sold_quantity') * F('price')), ('-revenue', '-id'))),
+            ('GET leaderboard?by=revenue', request('/products/api/v1/products/leaderboard/', {'by': 'revenue'})),
+            ('GET low-stock', request('/products/api/v1/products/low-stock/', {})),
+        ]
+        for label, func in cases:
+            results.append({'products': size, **measure(label, func, options['repeat'])})
+    return results
+
+
+@scenario('serialization')
+def serialization(options):
+    """
+    Rows serialized per second for a list of --products products: model
+    instances through ProductSerializer and DRF's JSONRenderer (the previous
+    list path) against values() rows (api.rows) and FastJSONRenderer, query
+    included, then the two halves separately. Body sizes plain and gzipped.
+    """
+    from django.utils.text import compress_string
+    from rest_framework.renderers import JSONRenderer
+
+    from . import rows
+    from .renderers import FastJSONRenderer
+    from .serializer import ProductSerializer
+
+    seed_products(options['products'])
+    count = options['products']
+    queryset = ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))[:count]
+    columns, build = rows.plan(ProductSerializer)
+    instances = list(queryset)
+    values = list(queryset.values(*columns))
+    data = [build(row) for row in values]
+
+    cases = [
+        ('serializer + JSONRenderer', lambda: JSONRenderer().render(ProductSerializer(list(queryset), many=True).data)),
+        ('values rows + FastJSONRenderer', lambda: FastJSONRenderer().render([build(row) for row in queryset.values(*columns)])),
+        ('serializer only', lambda: ProductSerializer(instances, many=True).data),
+        ('values rows only', lambda: [build(row) for row in values]),
+        ('JSONRenderer only', lambda: JSONRenderer().render(data)),
+        ('FastJSONRenderer only', lambda: FastJSONRenderer().render(data)),
+    ]
+    results = []
+    for label, func in cases:
+        row = measure(label, func, options['repeat'])
+        row['rows_per_s'] = round(count / (row['mean_ms'] / 1000)) if row['mean_ms'] else None
+        results.append({'rows': count, **row})
+    content = FastJSONRenderer().render(data)
+    results.append({'rows': count, 'case': 'body bytes', 'plain': len(content), 'gzip': len(compress_string(content))})
+    return results
+
+
+@scenario('sales')
+def sales(options):
+    """
+    Sales per second with 1 to 8 threads selling the same product, through the
+    atomic stock update and through the old read-modify-write save(). `lost`
+    counts sales that were acknowledged but are missing from the stock level.
+    """
+    from . import stock
+
+    total = options['batch']
+
+    def atomic_sale(product_id):
+        stock.apply(stock.SALE, [(product_id, 1)])
+
+    def read_modify_write(product_id):
+        product = Product.objects.get(pk=product_id)
+        product.quantity -= 1
+        product.sold_quantity += 1
+        product.save()
+
+    def run(sell, threads):
+        product = Product.objects.create(name=f'Contended {sell.__name__} {threads}', price=Decimal('1.00'), quantity=total)
+        per_thread = total // threads
+        failures = []
+
+        def worker():
+            try:
+                for _ in range(per_thread):
+                    try:
+                        sell(product.pk)
+                    except Exception as exc:
+                        failures.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        elapsed = time.perf_counter() - start
+        product.refresh_from_db()
+        acknowledged = per_thread * threads - len(failures)
+        return {
+            'case': sell.__name__.replace('_', ' '),
+            'threads': threads,
+            'sales': acknowledged,
+            'errors': len(failures),
+            'sales_per_s': round(acknowledged / elapsed),
+            'lost': acknowledged - product.sold_quantity,
+        }
+
+    return [run(sell, threads) for sell in (atomic_sale, read_modify_write) for threads in (1, 4, 8)]
+
+
+@scenario('database')
+def database(options):
+    """
+    Mixed read/write throughput of concurrent worker processes under SQLite's default
+    settings and under the tuned profile (settings.SQLITE_PROFILES), with a new
+    connection per operation (CONN_MAX_AGE=0) or a persistent one. Readers fetch
+    a page of products, writers record a one-unit sale.
+    """
+    from django.conf import settings
+
+    from . import database as db, stock
+
+    seed_products(options['products'])
+    Product.objects.update(quantity=10 ** 6)
+    aggregates.rebuild()
+    ids = list(Product.objects.values_list('pk', flat=True))
+    duration = 3
+    readers = writers = 4
+
+    def read(index):
+        offset = (index * 100) % max(1, len(ids) - 100)
+        list(Product.objects.order_by('id').values(*aggregates.Snapshot._fields)[offset:offset + 100])
+
+    def write(index):
+        stock.apply(stock.SALE, [(ids[index % len(ids)], 1)])
+
+    def worker(operation, kind, seed, deadline, persistent, results):
+        # Runs in a forked process, like a gunicorn worker; never reuse the parent's connection
+        connections['default'].inc_thread_sharing()
+        connections['default'].connection = None
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        index = seed
+        while time.time() < deadline:
+            index += 1
+            try:
+                operation(index)
+                counts[kind] += 1
+            except OperationalError:
+                counts['errors'] += 1
+            if not persistent:
+                connections.close_all()
+        connections.close_all()
+        results.put(counts)
+
+    def run(label, pragmas, persistent):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            connections.close_all()
+            applied = db.current_pragmas(connections['default'])
+            connections.close_all()
+            deadline = time.time() + duration
+            jobs = [(read, 'reads', i * 7919) for i in range(readers)] + [(write, 'writes', i * 104729) for i in range(writers)]
+            processes = [
+                context.Process(target=worker, args=(operation, kind, seed, deadline, persistent, results))
+                for operation, kind, seed in jobs
+            ]
+            for process in processes:
+                process.start()
+            counts = {'reads': 0, 'writes': 0, 'errors': 0}
+            for _ in processes:
+                for key, value in results.get().items():
+                    counts[key] += value
+            for process in processes:
+                process.join()
+        return {
+            'case': label,
+            'journal_mode': applied['journal_mode'],
+            'reads_per_s': round(counts['reads'] / duration),
+            'writes_per_s': round(counts['writes'] / duration),
+            'errors': counts['errors'],
+        }
+
+    tuned = settings.SQLITE_PROFILES['tuned']
+    default = settings.SQLITE_PROFILES['default']
+    return [
+        run('defaults, connection per request', default, persistent=False),
+        run('defaults, persistent connection', default, persistent=True),
+        run('tuned, connection per request', tuned, persistent=False),
+        run('tuned, persistent connection', tuned, persistent=True),
+    ]
+
+
+@scenario('login')
+def login(options):
+    """
+    Logins per second with 1 and 4 concurrent clients at the configured PBKDF2
+    work factor (settings.PASSWORD_HASH_ITERATIONS) and at a tenth of it, plus
+    the queries a login costs. The password hash dominates: it is CPU-bound.
+    """
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.test.utils import CaptureQueriesContext
+
+    per_client = max(1, options['repeat'] * 2)
+
+    def run(iterations, threads):
+        password = make_password(BENCH_PASSWORD)
+        users = [
+            User.objects.update_or_create(
+                username=f'bench-login-{threads}-{i}',
+                defaults={'email': f'login-{threads}-{i}@bench.local', 'password': password},
+            )[0]
+            for i in range(threads)
+        ]
+        failures = []
+
+        def post(client, user):
+            return client.post('/products/api/v1/auth/login/', {'username': user.email, 'password': BENCH_PASSWORD})
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            post(APIClient(), users[0])
+
+        def worker(user):
+            client = APIClient()
+            try:
+                for _ in range(per_client):
+                    if post(client, user).status_code != 200:
+                        failures.append(user.pk)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        elapsed = time.perf_counter() - start
+        done = per_client * threads - len(failures)
+        return {
+            'iterations': iterations,
+            'clients': threads,
+            'logins': done,
+            'errors': len(failures),
+            'logins_per_s': round(done / elapsed, 1),
+            'queries_per_login': len(queries),
+        }
+
+    rows = []
+    for iterations in (settings.PASSWORD_HASH_ITERATIONS, settings.PASSWORD_HASH_ITERATIONS // 10):
+        with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+            rows.extend(run(iterations, threads) for threads in (1, 4))
+    return rows
+
+
+@scenario('register')
+def register(options):
+    """
+    Concurrent signups where every username and email is submitted by two
+    clients at once: the previous check-then-insert registration against the
+    current one (unique indexes, cached Reader group id, one transaction).
+    Runs at a tenth of the PBKDF2 work factor so hashing does not hide the
+    database work. Reports signups per second, queries per signup, errors
+    (a 500 in production) and duplicate accounts.
+    """
+    from django.conf import settings
+    from django.db.models import Count
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework import status
+    from rest_framework.response import Response
+    from rest_framework.test import APIRequestFactory
+    from rest_framework.views import APIView
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from .roles import add_claims
+    from .views import RegisterView
+
+    class CheckThenInsertRegisterView(APIView):
+        """RegisterView.post before it relied on the database for uniqueness."""
+        permission_classes = []
+
+        def post(self, request):
+            username, password, email = (request.data.get(key) for key in ('username', 'password', 'email'))
+            if User.objects.filter(email=email).exists():
+                return Response({'error': 'Email already exists'}, status=status.HTTP_400_BAD_REQUEST)
+            if User.objects.filter(username=username).exists():
+                return Response({'error': 'Username already exists'}, status=status.HTTP_400_BAD_REQUEST)
+            user = User.objects.create_user(username=username, password=password, email=email)
+            reader_group, _ = Group.objects.get_or_create(name='Reader')
+            user.groups.add(reader_group)
+            refresh = add_claims(RefreshToken.for_user(user), user)
+            return Response({
+                'refresh': str(refresh),
+                'access': str(refresh.access_token),
+                'user': {'id': user.id, 'username': user.username, 'email': user.email, 'roles': [g.name for g in user.groups.all()]},
+            }, status=status.HTTP_201_CREATED)
+
+    factory = APIRequestFactory()
+    clients = 4
+    per_client = max(5, options['repeat'] * 4)
+
+    def run(label, view):
+        def post(name):
+            request = factory.post('/products/api/v1/auth/register/', {
+                'username': name, 'email': f'{name}@bench.local', 'password': BENCH_PASSWORD,
+            }, format='json')
+            return view(request).status_code
+
+        post(f'{label}-warmup-0')
+        with CaptureQueriesContext(connections['default']) as queries:
+            post(f'{label}-warmup-1')
+        outcomes = []
+
+        def worker(client):
+            try:
+                for i in range(per_client):
+                    # Clients 0 and 1 (2 and 3) submit the same accounts
+                    try:
+                        outcomes.append(post(f'{label}-{client // 2}-{i}'))
+                    except Exception:
+                        outcomes.append('error')
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(client,)) for client in range(clients)]
+        start = time.perf_counter()
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        elapsed = time.perf_counter() - start
+        accounts = User.objects.filter(username__startswith=f'{label}-').exclude(username__startswith=f'{label}-warmup')
+        return {
+            'case': label,
+            'attempts': len(outcomes),
+            'created': outcomes.count(201),
+            'rejected': outcomes.count(400),
+            'errors': len(outcomes) - outcomes.count(201) - outcomes.count(400),
+            'duplicates': accounts.values('email').annotate(count=Count('id')).filter(count__gt=1).count(),
+            'without_group': accounts.filter(groups__isnull=True).count(),
+            'signups_per_s': round(len(outcomes) / elapsed, 1),
+            'queries_per_signup': len(queries),
+        }
+
+    with override_settings(PASSWORD_HASH_ITERATIONS=settings.PASSWORD_HASH_ITERATIONS // 10):
+        return [
+            run('check_then_insert', CheckThenInsertRegisterView.as_view()),
+            run('unique_constraints', RegisterView.as_view()),
+        ]
+
+
+@scenario('auth')
+def auth(options):
+    """
+    Database round-trips and time spent authenticating a request and checking
+    its role, with the user loaded from the database (TimedJWTAuthentication,
+    the previous default) and built from the token claims plus the cached
+    auth state (StatelessJWTAuthentication), once the caches are warm.
+    """
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from .authentication import StatelessJWTAuthentication, TimedJWTAuthentication
+    from .roles import MANAGER, add_claims, has_role
+
+    user, _ = User.objects.get_or_create(username='bench-auth', defaults={'email': 'auth@bench.local'})
+    user.groups.add(Group.objects.get_or_create(name=MANAGER)[0])
+    token = str(add_claims(RefreshToken.for_user(user), user).access_token)
+    factory = APIRequestFactory()
+    count = options['batch']
+
+    def run(authentication_class):
+        authenticator = authentication_class()
+
+        def request():
+            drf_request = Request(factory.get('/products/api/v1/products/', HTTP_AUTHORIZATION=f'Bearer {token}'), authenticators=[authenticator])
+            return has_role(drf_request.user, MANAGER)
+
+        request()
+        with CaptureQueriesContext(connections['default']) as queries:
+            request()
+        row = measure(authentication_class.__name__, lambda: [request() for _ in range(count)], options['repeat'])
+        row['queries_per_request'] = len(queries)
+        row['us_per_request'] = round(row['mean_ms'] * 1000 / count, 1)
+        return row
+
+    return [run(TimedJWTAuthentication), run(StatelessJWTAuthentication)]
+
+
+@scenario('endpoints')
+def endpoints(options):
+    """
+    Every API endpoint through the whole Django stack, in process and one request
+    at a time: requests per second, latency percentiles and queries per request.
+    --requests requests per endpoint against --products seeded products; the
+    first request of each endpoint is a warm-up and is not counted. Cached
+    reads are measured warm and, with a unique query parameter, cold.
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    from .roles import MANAGER, READER
+
+    seed_products(options['products'])
+    users = seed_users(1)
+    reader, manager = token_client(users[READER][0]), token_client(users[MANAGER][0])
+    anonymous = APIClient()
+    count = options['requests']
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:count + 1])
+    category_id = Category.objects.values_list('id', flat=True).first()
+    created = []
+
+    def create(i):
+        response = manager.post('/products/api/v1/products/', {
+            'name': f'Endpoint {i}', 'price': '19.99', 'quantity': 5, 'category': category_id,
+        }, format='json')
+        created.append(response.json().get('id'))
+        return response
+
+    cases = [
+        ('login', lambda i: anonymous.post('/products/api/v1/auth/login/', {
+            'username': users[READER][0].email, 'password': BENCH_PASSWORD,
+        })),
+        ('register', lambda i: anonymous.post('/products/api/v1/auth/register/', {
+            'username': f'endpoint-{i}-{time.time_ns()}', 'email': f'endpoint-{i}-{time.time_ns()}@bench.local',
+            'password': BENCH_PASSWORD,
+        })),
+        ('auth/me', lambda i: reader.get('/products/api/v1/auth/me/')),
+        ('product list', lambda i: reader.get('/products/api/v1/products/')),
+        ('product list, cold', lambda i: reader.get('/products/api/v1/products/', {'_bench': f'{i}-{time.time_ns()}'})),
+        ('product filter, cold', lambda i: reader.get('/products/api/v1/products/', {'low_stock': 'true', '_bench': f'{i}-{time.time_ns()}'})),
+        ('product detail', lambda i: reader.get(f'/products/api/v1/products/{product_ids[i % len(product_ids)]}/')),
+        ('product create', create),
+        ('product update', lambda i: manager.patch(f'/products/api/v1/products/{created[i % len(created)]}/', {
+            'price': f'{10 + i}.00',
+        }, format='json')),
+        ('product delete', lambda i: manager.delete(f'/products/api/v1/products/{created.pop()}/')),
+        ('category list', lambda i: reader.get('/products/api/v1/categories/')),
+        ('stats', lambda i: reader.get('/products/api/v1/stats/')),
+        ('stats, cold', lambda i: reader.get('/products/api/v1/stats/', {'_bench': f'{i}-{time.time_ns()}'})),
+    ]
+
+    rows = []
+    for label, request in cases:
+        request(count)
+        samples, queries, errors = [], 0, 0
+        for i in range(count):
+            with CaptureQueriesContext(connections['default']) as captured:
+                start = time.perf_counter()
+                response = request(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            queries += len(captured)
+            errors += response.status_code >= 400
+        rows.append({
+            'case': label,
+            'requests': count,
+            'errors': errors,
+            'rps': round(count / (sum(samples) / 1000), 1),
+            'p50_ms': round(percentile(samples, 50), 2),
+            'p95_ms': round(percentile(samples, 95), 2),
+            'p99_ms': round(percentile(samples, 99), 2),
+            'queries_per_request': round(queries / count, 1),
+        })
+    return rows
+
+
+
+# Run in a fresh interpreter by the startup scenario; prints its timings as JSON
+STARTUP_PROBE = """
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from backend.wsgi import application
+boot_ms = (time.perf_counter() - start) * 1000
+
+
+def get(path, **headers):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **headers}
+    setup_testing_defaults(environ)
+    statuses = []
+    start = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    response.close()
+    return (time.perf_counter() - start) * 1000, int(statuses[0].split()[0])
+
+
+token = sys.argv[1]
+first_ms, status = get('/products/api/v1/products/', HTTP_AUTHORIZATION=f'Bearer {token}')
+second_ms, _ = get('/products/api/v1/products/', HTTP_AUTHORIZATION=f'Bearer {token}')
+schema_first_ms, schema_status = get('/api/schema/')
+schema_cached_ms, _ = get('/api/schema/')
+served = schema_status == 200
+print(json.dumps({
+    'boot_ms': boot_ms,
+    'first_request_ms': first_ms,
+    'second_request_ms': second_ms,
+    'schema_first_ms': schema_first_ms if served else None,
+    'schema_cached_ms': schema_cached_ms if served else None,
+    'modules': len(sys.modules),
+    'status': status,
+}))
+"""
+
+
+@scenario('startup')
+def startup(options):
+    """
+    Cold start of a worker per API_PROFILE, each in --repeat fresh processes:
+    importing the WSGI application (settings, apps, middleware), the first
+    and second product list request (the first one loads the URLconf and the
+    views), the schema before and after it is cached (full profile only),
+    and the number of modules loaded. process_ms includes the interpreter.
+    """
+    import os
+    import subprocess
+    import sys
+
+    from django.conf import settings
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from .roles import READER, add_claims
+
+    seed_products(options['products'])
+    user = seed_users(1)[READER][0]
+    token = str(add_claims(RefreshToken.for_user(user), user).access_token)
+    rows = []
+    for profile in ('full', 'slim'):
+        env = dict(
+            os.environ, API_PROFILE=profile, DB_NAME=str(connections['default'].settings_dict['NAME']),
+            # A fresh per-process response cache, and no slow-request log
+            CACHE_BACKEND='locmem', SLOW_REQUEST_MS=str(10 ** 9),
+        )
+        runs = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, '-c', STARTUP_PROBE, token], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            elapsed = (time.perf_counter() - start) * 1000
+            if process.returncode:
+                raise RuntimeError(f'The {profile} probe failed:\n{process.stderr}')
+            runs.append(dict(json.loads(process.stdout.splitlines()[-1]), process_ms=elapsed))
+        row = {'case': profile}
+        for column in ('process_ms', 'boot_ms', 'first_request_ms', 'second_request_ms', 'schema_first_ms', 'schema_cached_ms'):
+            values = [run[column] for run in runs if run[column] is not None]
+            row[column] = round(statistics.mean(values), 2) if values else None
+        row['modules'] = runs[-1]['modules']
+        row['errors'] = sum(run['status'] >= 400 for run in runs)
+        rows.append(row)
+    return rows
+
+
+def render_rows(rows):
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    widths = {col: max(len(col), *(len(str(row.get(col, ''))) for row in rows)) for col in columns}
+    lines = ['  '.join(col.ljust(widths[col]) for col in columns)]
+    lines += ['  '.join(str(row.get(col, '')).ljust(widths[col]) for col in columns) for row in rows]
+    return '\n'.join(lines)
+
+
+def dump(results):
+    return json.dumps(results, indent=2, default=str)
+
+
+# Result columns compared against a baseline, by how they are named
+LOWER_IS_BETTER = ('_ms', '_kb')
+HIGHER_IS_BETTER = ('_per_s', 'rps')
+
+
+def metric_direction(column):
+    """1 when a larger value is a regression, -1 when a smaller one is, None when the column is not a metric."""
+    if column.endswith(LOWER_IS_BETTER) or column.startswith('queries'):
+        return 1
+    if column.endswith(HIGHER_IS_BETTER):
+        return -1
+    return None
+
+
+def compare(baseline, results, threshold):
+    """
+    Compare `results` with `baseline` (both {scenario: rows}), row by row in
+    order. Returns one row per metric with its change in percent; `regression`
+    is set when the metric got worse by more than `threshold` percent.
+    """
+    rows = []
+    for name, current_rows in results.items():
+        for index, (before, after) in enumerate(zip(baseline.get(name, []), current_rows)):
+            label = after.get('case', after.get('path', index))
+            if before.get('case', before.get('path', index)) != label:
+                continue
+            for column, value in after.items():
+                direction = metric_direction(column)
+                old = before.get(column)
+                if direction is None or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                    continue
+                if old:
+                    change = (value - old) / old * 100
+                else:
+                    change = 0.0 if not value else float('inf')
+                rows.append({
+                    'scenario': name,
+                    'case': label,
+                    'metric': column,
+                    'baseline': old,
+                    'current': value,
+                    'change_%': round(change, 1),
+                    'regression': change * direction > threshold,
+                })
+    return rows
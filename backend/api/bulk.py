@@ -0,0 +1,227 @@
+"""
+Batched product writes used by the bulk endpoints.
+
+Each operation validates the whole batch first (categories and existing rows
+are loaded with one query each), then writes the valid rows with
+bulk_create/bulk_update/delete inside a single transaction and reports the
+changes to api.tracking once. In ALL_OR_NOTHING mode a single invalid item
+rejects the whole batch; in BEST_EFFORT mode the valid items are written and
+the invalid ones are reported.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+from . import aggregates, alerts, tracking
+from .models import Category, Product
+from .serializer import ProductSerializer
+
+ALL_OR_NOTHING = 'all_or_nothing'
+BEST_EFFORT = 'best_effort'
+MODES = (ALL_OR_NOTHING, BEST_EFFORT)
+
+BATCH_SIZE = 500
+
+
+class BulkResult:
+    def __init__(self, size):
+        self.items = [{'index': index, 'status': 'pending'} for index in range(size)]
+
+    def ok(self, index, status, product_id):
+        self.items[index] = {'index': index, 'status': status, 'id': product_id}
+
+    def error(self, index, errors):
+        self.items[index] = {'index': index, 'status': 'error', 'errors': errors}
+
+    @property
+    def has_errors(self):
+        return any(item['status'] == 'error' for item in self.items)
+
+    def reject_valid(self):
+        """In all-or-nothing mode nothing is written once one item failed."""
+        for item in self.items:
+            if item['status'] != 'error':
+                item['status'] = 'skipped'
+                item.pop('id', None)
+
+
+def update_rows(products, fields):
+    """
+    Write `fields` of many products with a single executemany() UPDATE.
+    QuerySet.bulk_update() builds a CASE WHEN expression per row and column,
+    which costs milliseconds per row once batches get large.
+    """
+    products = list(products)
+    if not products or not fields:
+        return
+    meta = Product._meta
+    model_fields = [meta.get_field(name) for name in fields]
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        quote(meta.db_table),
+        ', '.join(f'{quote(field.column)} = %s' for field in model_fields),
+        quote(meta.pk.column),
+    )
+    params = [
+        [field.get_db_prep_save(getattr(product, field.attname), connection) for field in model_fields] + [product.pk]
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def is_id(value):
+    # bool is a subclass of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def load_categories(items):
+    ids = set()
+    for item in items:
+        value = item.get('category') if isinstance(item, dict) else None
+        if is_id(value) or (isinstance(value, str) and value.isdigit()):
+            ids.add(int(value))
+    return Category.objects.in_bulk(ids)
+
+
+def serializer_context(items, context=None):
+    context = dict(context or {})
+    context['categories'] = load_categories(items)
+    return context
+
+
+def create(items, mode=ALL_OR_NOTHING, context=None):
+    result = BulkResult(len(items))
+    context = serializer_context(items, context)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = ProductSerializer(data=item, context=context)
+        if serializer.is_valid():
+            valid.append((index, Product(**serializer.validated_data)))
+        else:
+            result.error(index, serializer.errors)
+
+    if result.has_errors and mode == ALL_OR_NOTHING:
+        result.reject_valid()
+        return result
+
+    alerts.assign_levels(product for _, product in valid)
+    with transaction.atomic(), tracking.suppressed():
+        Product.objects.bulk_create([product for _, product in valid], batch_size=BATCH_SIZE)
+        tracking.product_changes((None, aggregates.snapshot(product)) for _, product in valid)
+    for index, product in valid:
+        result.ok(index, 'created', product.pk)
+    return result
+
+
+def update(items, mode=ALL_OR_NOTHING, context=None):
+    """Partially update products; every item must carry the `id` of an existing product."""
+    result = BulkResult(len(items))
+    context = serializer_context(items, context)
+    ids = [item.get('id') for item in items if isinstance(item, dict)]
+    with transaction.atomic():
+        # Locked until the commit, so the rows the deltas start from are the ones overwritten
+        existing = Product.objects.select_for_update().in_bulk([pk for pk in ids if is_id(pk)])
+
+        seen = set()
+        changed = []
+        fields = set()
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else None
+            product = existing.get(pk) if is_id(pk) else None
+            if product is None:
+                result.error(index, {'id': ['A valid product id is required.']})
+                continue
+            if pk in seen:
+                result.error(index, {'id': ['Duplicate product id in batch.']})
+                continue
+            seen.add(pk)
+            serializer = ProductSerializer(product, data=item, partial=True, context=context)
+            if not serializer.is_valid():
+                result.error(index, serializer.errors)
+                continue
+            before = aggregates.snapshot(product)
+            for name, value in serializer.validated_data.items():
+                setattr(product, name, value)
+                fields.add(Product._meta.get_field(name).attname)
+            changed.append((index, before, product))
+
+        if result.has_errors and mode == ALL_OR_NOTHING:
+            result.reject_valid()
+            return result
+
+        if fields & {'category_id', 'low_stock_threshold'}:
+            alerts.assign_levels(product for _, _, product in changed)
+            fields.add('alert_level')
+        with tracking.suppressed():
+            update_rows([product for _, _, product in changed], sorted(fields))
+            tracking.product_changes((before, aggregates.snapshot(product)) for _, before, product in changed)
+    for index, _, product in changed:
+        result.ok(index, 'updated', product.pk)
+    return result
+
+
+def delete(ids, mode=ALL_OR_NOTHING):
+    result = BulkResult(len(ids))
+    with transaction.atomic():
+        snapshots = {
+            row[0]: aggregates.Snapshot(*row)
+            for row in Product.objects.select_for_update().filter(pk__in=[pk for pk in ids if is_id(pk)])
+            .values_list(*aggregates.Snapshot._fields)
+        }
+        seen = set()
+        for index, pk in enumerate(ids):
+            if not is_id(pk) or pk not in snapshots or pk in seen:
+                result.error(index, {'id': ['A valid, unique product id is required.']})
+            else:
+                seen.add(pk)
+                result.ok(index, 'deleted', pk)
+
+        if result.has_errors and mode == ALL_OR_NOTHING:
+            result.reject_valid()
+            return result
+
+        with tracking.suppressed():
+            Product.objects.filter(pk__in=seen).delete()
+            tracking.product_changes((snapshots[pk], None) for pk in seen)
+    return result
+
+
+def assign(queryset, values):
+    """
+    Give every product of `queryset` the same `values` (field name -> value)
+    with a single UPDATE; used by the admin bulk-edit action. Returns the
+    number of products whose values actually changed.
+    """
+    values = {Product._meta.get_field(name).attname: getattr(value, 'pk', value) for name, value in values.items()}
+    queryset = queryset.order_by()
+    updates = dict(values)
+    if 'category_id' in values:
+        # Products without a threshold of their own take the new category's level
+        threshold = Category.objects.filter(pk=values['category_id']).values_list('low_stock_threshold', flat=True).first()
+        category_level = alerts.level(None, threshold)
+        updates['alert_level'] = Coalesce('low_stock_threshold', Value(category_level))
+    with transaction.atomic(), tracking.suppressed():
+        changes = []
+        for row in queryset.select_for_update().values_list(*aggregates.Snapshot._fields, 'low_stock_threshold'):
+            before = aggregates.Snapshot(row[0], row[1], Decimal(str(row[2])), *row[3:6])
+            after = before._replace(**values)
+            if 'category_id' in values:
+                after = after._replace(alert_level=alerts.level(row[6], threshold))
+            if after != before:
+                changes.append((before, after))
+        if changes:
+            queryset.update(**updates)
+            tracking.product_changes(changes)
+    return len(changes)
+
+
+def run(method, items, mode=ALL_OR_NOTHING, context=None):
+    """Apply a bulk request body by its HTTP method: POST creates, PATCH updates, DELETE deletes (ids or {id})."""
+    if method == 'POST':
+        return create(items, mode, context)
+    if method == 'PATCH':
+        return update(items, mode, context)
+    return delete([item.get('id') if isinstance(item, dict) else item for item in items], mode)
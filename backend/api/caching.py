@@ -0,0 +1,126 @@
+"""
+Server-side response cache with strong ETags for the read endpoints.
+
+Every cached response depends on a set of models. Each model has a version
+number in the cache, bumped when a write commits (model signals, bulk paths
+through api.tracking, the admin). The cache key, and therefore the ETag,
+includes the current versions, so a write makes every dependent entry
+unreachable without having to enumerate or delete them.
+
+Note: with a per-process backend (LocMemCache) versions are bumped only in
+the process that handled the write; deployments with several workers should
+use a shared backend (CACHE_BACKEND=file, or any Django cache backend).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('ALIAS')]
+
+
+def version_key(label):
+    return f'api:version:{label}'
+
+
+def get_versions(labels):
+    cache = get_cache()
+    keys = [version_key(label) for label in labels]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # Start from a clock value so a version evicted from the cache never repeats
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump(*models):
+    """Invalidate every cached response that depends on one of `models`, once the write is committed."""
+    # Bumping before the commit would let a concurrent read cache the old rows under the new version
+    labels = [model._meta.label_lower for model in models]
+    transaction.on_commit(lambda: _bump_labels(labels))
+
+
+def _bump_labels(labels):
+    cache = get_cache()
+    for label in labels:
+        try:
+            cache.incr(version_key(label))
+        except ValueError:
+            cache.set(version_key(label), time.time_ns(), timeout=None)
+
+
+def response_key(request, labels, media_type=None):
+    versions = get_versions(labels)
+    parts = [
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        media_type or getattr(request, 'accepted_media_type', ''),
+        ','.join(f'{label}={version}' for label, version in zip(labels, versions)),
+    ]
+    digest = hashlib.sha256('|'.join(parts).encode()).hexdigest()
+    return f'api:response:{digest}', f'"{digest[:32]}"'
+
+
+def etag_matches(request, etag):
+    """If-None-Match check. Weak comparison (RFC 9110): compressed responses carry the weak form of the ETag."""
+    return etag in {tag.removeprefix('W/') for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+
+
+def lookup(request, labels, media_type=None):
+    """Returns (key, etag, response); response is a 304 or a cache hit, else None."""
+    key, etag = response_key(request, labels, media_type)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        cached = get_cache().get(key)
+        if cached is None:
+            return key, etag, None
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    return key, etag, response
+
+
+def store(key, response):
+    get_cache().set(key, (response.content, response['Content-Type']), get_setting('TIMEOUT'))
+
+
+def cached_response(*models):
+    """
+    Cache the rendered output of a DRF GET handler until one of `models`
+    changes, and answer If-None-Match with 304. Authentication and permission
+    checks still run on every request.
+    """
+    labels = [model._meta.label_lower for model in models]
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key, etag, cached = lookup(request, labels)
+            if cached is not None:
+                return cached
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+                response.add_post_render_callback(lambda rendered: store(key, rendered))
+            return response
+        return wrapper
+    return decorator
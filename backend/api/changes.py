@@ -0,0 +1,272 @@
+"""
+Change feed of products and categories.
+
+Every write is stored as a ChangeEvent whose id is a sequence number.
+Clients read the current sequence number, load the full lists once, then
+apply the events that follow it: by polling /products/api/v1/changes/?since=<seq>,
+or over server-sent events at /products/api/v1/changes/stream/ (ASGI only),
+where EventSource resumes from the Last-Event-ID it last received.
+
+Product events are written by api.tracking, in the transaction of the change
+and for the bulk paths too; category events by the category signals. When a
+category is deleted its products lose their category without events of
+their own. Events older than CHANGE_FEED['RETENTION_HOURS'] are purged
+(`manage.py purge_changes`); a client resuming from before the oldest event
+is told to reload.
+
+Readers only move forward, so a later event must never become visible before
+an earlier one. Ids come from the table's autoincrement, and on PostgreSQL or
+MySQL two transactions can commit in the reverse order of their ids: a reader
+that already passed the later id would skip the earlier event. Writers
+therefore update the ChangeCounter row before inserting their events, and
+hold its lock until they commit, so events commit in id order. This
+serializes the transactions that record events (SQLite already runs one
+writer at a time).
+
+Each server process runs a single poller for all of its open streams and
+keeps the latest events in memory, so a stream costs no query while it waits.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import ChangeCounter, ChangeEvent, Product
+
+logger = logging.getLogger(__name__)
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+
+COUNTER_PK = 1
+
+PRODUCT_FIELDS = ('id', 'name', 'price', 'quantity', 'sold_quantity', 'category_id')
+
+DEFAULTS = {
+    'POLL_INTERVAL': 0.5,
+    'HEARTBEAT_SECONDS': 15,
+    'STREAM_MAX_SECONDS': 300,
+    'RETRY_MS': 3000,
+    'BATCH_SIZE': 500,
+    'BUFFER_SIZE': 2000,
+    'RETENTION_HOURS': 24,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CHANGE_FEED', {}).get(name, DEFAULTS[name])
+
+
+def lock_sequence(count):
+    """Count `count` new events on the counter row; its lock is held until the caller's transaction ends."""
+    counter = ChangeCounter.objects.filter(pk=COUNTER_PK)
+    if not counter.update(events=F('events') + count):
+        ChangeCounter.objects.get_or_create(pk=COUNTER_PK)
+        counter.update(events=F('events') + count)
+
+
+def product_data(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'price': str(row['price']),
+        'quantity': row['quantity'],
+        'sold_quantity': row['sold_quantity'],
+        'category': row['category_id'],
+    }
+
+
+def record_products(changes):
+    """Store one event per (before, after) snapshot pair, see api.tracking."""
+    rows = {
+        row['id']: row
+        for row in Product.objects.filter(pk__in=[after.id for _, after in changes if after is not None]).values(*PRODUCT_FIELDS)
+    }
+    now = timezone.now()
+    events = []
+    for before, after in changes:
+        if after is None:
+            action, data = ChangeEvent.DELETED, {'id': before.id}
+        else:
+            action = ChangeEvent.CREATED if before is None else ChangeEvent.UPDATED
+            data = product_data(rows.get(after.id) or {**after._asdict(), 'name': None})
+        data['quantity_delta'] = (after.quantity if after else 0) - (before.quantity if before else 0)
+        data['sold_delta'] = (after.sold_quantity if after else 0) - (before.sold_quantity if before else 0)
+        events.append(ChangeEvent(model=PRODUCT, object_id=data['id'], action=action, data=data, created_at=now))
+    with transaction.atomic():
+        lock_sequence(len(events))
+        ChangeEvent.objects.bulk_create(events, batch_size=get_setting('BATCH_SIZE'))
+
+
+def record_category(category, action):
+    data = None
+    if action != ChangeEvent.DELETED:
+        data = {'id': category.pk, 'name': category.name, 'description': category.description, 'icon': category.icon}
+    with transaction.atomic():
+        lock_sequence(1)
+        ChangeEvent.objects.create(model=CATEGORY, object_id=category.pk, action=action, data=data, created_at=timezone.now())
+
+
+def serialize(event):
+    return {
+        'seq': event.pk,
+        'model': event.model,
+        'action': event.action,
+        'id': event.object_id,
+        'data': event.data,
+        'at': event.created_at.isoformat(),
+    }
+
+
+def latest_seq():
+    return ChangeEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def events_after(seq, limit):
+    return [serialize(event) for event in ChangeEvent.objects.filter(id__gt=seq).order_by('id')[:limit]]
+
+
+def must_reload(since):
+    """True when events after `since` were purged (or `since` was never issued): the client has to reload."""
+    first = ChangeEvent.objects.order_by('id').values_list('id', flat=True).first()
+    if first is None:
+        return since > 0
+    return since < first - 1 or since > latest_seq()
+
+
+alatest_seq = sync_to_async(latest_seq)
+aevents_after = sync_to_async(events_after)
+amust_reload = sync_to_async(must_reload)
+
+
+def page(since=None, limit=None):
+    """
+    Response of the polling endpoint. Without `since` it only returns the
+    current sequence number, to be read before loading the full lists.
+    """
+    limit = min(limit or get_setting('BATCH_SIZE'), get_setting('BATCH_SIZE'))
+    if since is None:
+        return {'last': latest_seq(), 'reset': False, 'events': []}
+    if must_reload(since):
+        return {'last': latest_seq(), 'reset': True, 'events': []}
+    events = events_after(since, limit)
+    return {'last': events[-1]['seq'] if events else since, 'reset': False, 'events': events}
+
+
+def purge(hours=None):
+    """Delete events older than `hours` (default RETENTION_HOURS), always keeping the latest one."""
+    hours = get_setting('RETENTION_HOURS') if hours is None else hours
+    cutoff = timezone.now() - timedelta(hours=hours)
+    latest = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first()
+    return ChangeEvent.objects.filter(created_at__lt=cutoff).exclude(pk=latest).delete()[0]
+
+
+class Feed:
+    """
+    Per-process poller shared by the open streams: one query per
+    POLL_INTERVAL whatever the number of clients. The latest events stay in
+    memory, so a stream only reads the table when it resumes from further back.
+    """
+    def __init__(self):
+        self.loop = None
+
+    def _start(self, loop):
+        self.loop = loop
+        self.latest = None
+        self.recent = deque(maxlen=get_setting('BUFFER_SIZE'))
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task = None
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self._start(loop)
+        self.subscribers += 1
+        if self.task is None:
+            self.task = loop.create_task(self._poll())
+
+    def unsubscribe(self):
+        self.subscribers = max(self.subscribers - 1, 0)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _poll(self):
+        batch_size = get_setting('BATCH_SIZE')
+        while True:
+            try:
+                if self.latest is None:
+                    self.latest = await alatest_seq()
+                events = await aevents_after(self.latest, batch_size)
+            except Exception:
+                logger.exception('Change feed poll failed')
+                events = []
+            if events:
+                self.recent.extend(events)
+                self.latest = events[-1]['seq']
+                changed, self.changed = self.changed, asyncio.Event()
+                changed.set()
+            if len(events) < batch_size:
+                await asyncio.sleep(get_setting('POLL_INTERVAL'))
+
+    async def read_after(self, seq, limit):
+        if self.latest is not None and seq >= self.latest:
+            return []
+        if self.recent and self.recent[0]['seq'] <= seq + 1:
+            return [event for event in self.recent if event['seq'] > seq][:limit]
+        return await aevents_after(seq, limit)
+
+
+FEED = Feed()
+
+
+def sse(data, seq=None, event=None):
+    lines = []
+    if seq is not None:
+        lines.append(f'id: {seq}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+async def stream(since=None, feed=None):
+    """
+    Server-sent events: a `ready` event with the starting sequence number
+    (`reset` is true when the client must reload its lists), then one
+    unnamed event per change. The stream ends after STREAM_MAX_SECONDS and
+    EventSource reconnects from the last id.
+    """
+    feed = feed or FEED
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_setting('STREAM_MAX_SECONDS')
+    batch_size = get_setting('BATCH_SIZE')
+    yield f'retry: {get_setting("RETRY_MS")}\n\n'
+    feed.subscribe()
+    try:
+        reset = since is not None and await amust_reload(since)
+        if since is None or reset:
+            since = await alatest_seq()
+        yield sse({'last': since, 'reset': reset}, seq=since, event='ready')
+        while (remaining := deadline - loop.time()) > 0:
+            changed = feed.changed
+            events = await feed.read_after(since, batch_size)
+            for event in events:
+                yield sse(event, seq=event['seq'])
+            if events:
+                since = events[-1]['seq']
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), min(get_setting('HEARTBEAT_SECONDS'), remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+    finally:
+        feed.unsubscribe()
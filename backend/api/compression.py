@@ -0,0 +1,59 @@
+"""
+Response compression negotiated through Accept-Encoding: brotli when the
+optional `brotli` package is installed and the client accepts it, gzip
+otherwise (Django's GZipMiddleware, with its BREACH mitigation). Server-sent
+events are sent as they are, so each event still reaches the client when it
+is written.
+
+Views whose responses carry tokens (login, registration, refresh, password
+change) are marked with never_compress: a compressed secret sent next to
+input the attacker controls can be recovered from the response sizes
+(BREACH), and the JWTs are not a large part of the traffic anyway.
+"""
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI_QUALITY = 5
+MIN_SIZE = 200
+
+accepts_brotli = re.compile(r'\bbr\b')
+
+
+def never_compress(view):
+    """Send the view's responses uncompressed, see the module docstring."""
+    view.never_compress = True
+    return view
+
+
+def is_excluded(request):
+    match = getattr(request, 'resolver_match', None)
+    return match is not None and getattr(match.func, 'never_compress', False)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream') or is_excluded(request):
+            return response
+        if brotli is None or response.streaming or not accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+        if len(response.content) < MIN_SIZE or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # The bytes differ from the uncompressed representation: the ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
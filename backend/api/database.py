@@ -0,0 +1,31 @@
+"""
+Per-connection database tuning.
+
+Django 4.2 has no connection init hook for SQLite, so the PRAGMAs from
+settings.SQLITE_PRAGMAS are applied from the connection_created signal (see
+ApiConfig.ready). With CONN_MAX_AGE connections are reused across requests,
+so this runs once per connection rather than once per request.
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def current_pragmas(connection, names=('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')):
+    """The PRAGMA values in effect on `connection`, for diagnostics and benchmarks."""
+    with connection.cursor() as cursor:
+        values = {}
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
@@ -0,0 +1,54 @@
+"""
+Streaming export of the product catalogue.
+
+Rows are read with queryset.iterator(chunk_size=...) and encoded one at a time,
+so memory stays flat and the first bytes go out before the last row is read.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Product
+
+COLUMNS = ('id', 'name', 'price', 'quantity', 'sold_quantity', 'category_id', 'category_name')
+VALUES = ('id', 'name', 'price', 'quantity', 'sold_quantity', 'category_id', 'category__name')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def rows(queryset=None, chunk_size=None):
+    queryset = Product.objects.all() if queryset is None else queryset
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    return queryset.order_by('id').values_list(*VALUES).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() hands the encoded line back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+
+def encode_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def encode_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), default=str) + '\n'
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+def stream(fmt, queryset=None, chunk_size=None):
+    return ENCODERS[fmt](rows(queryset, chunk_size))
@@ -0,0 +1,132 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from . import alerts, fts
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+# Sorts after every other character, closing a prefix range
+PREFIX_END = '\U0010ffff'
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class CategoryOrderingFilter(BaseFilterBackend):
+    """
+    `?ordering=` for the category list: the name or one of the stored counters,
+    prefixed with '-' for descending order. Ties are broken by id.
+    """
+    fields = {
+        'name': 'name',
+        'product_count': 'totals__product_count',
+        'stock_units': 'totals__stock_units',
+        'stock_value': 'totals__stock_value',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = request.query_params.get('ordering', '').strip()
+        if not ordering:
+            return queryset.order_by('id')
+        descending = ordering.startswith('-')
+        field = self.fields.get(ordering.lstrip('-'))
+        if field is None:
+            raise serializers.ValidationError({'ordering': [f"Must be one of {', '.join(self.fields)}, optionally prefixed with '-'."]})
+        if descending:
+            return queryset.order_by(f'-{field}', '-id')
+        return queryset.order_by(field, 'id')
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': 'ordering', 'required': False, 'in': 'query',
+            'description': f"Sort by {', '.join(self.fields)}; prefix with '-' for descending",
+            'schema': {'type': 'string'},
+        }]
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Server-side product filtering. Every filter maps to an index: category
+    (+ price), price, quantity, name, the stock margin for `low_stock` and the
+    FTS5 index for `search`.
+    """
+    params = {
+        'category': 'Category id, or "none" for products without a category',
+        'min_price': 'Minimum price (inclusive)',
+        'max_price': 'Maximum price (inclusive)',
+        'min_quantity': 'Minimum quantity in stock (inclusive)',
+        'max_quantity': 'Maximum quantity in stock (inclusive)',
+        'low_stock': 'true: only products below their low-stock alert level',
+        'out_of_stock': 'true: only products with no units left',
+        'name': 'Name prefix (case-insensitive)',
+        'search': 'Full-text search on the name; each word matches as a prefix',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        category = params.get('category')
+        if category:
+            if category.lower() == 'none':
+                queryset = queryset.filter(category__isnull=True)
+            else:
+                queryset = queryset.filter(category_id=self.parse('category', category, serializers.IntegerField()))
+
+        price = serializers.DecimalField(max_digits=8, decimal_places=2)
+        if params.get('min_price'):
+            queryset = queryset.filter(price__gte=self.parse('min_price', params['min_price'], price))
+        if params.get('max_price'):
+            queryset = queryset.filter(price__lte=self.parse('max_price', params['max_price'], price))
+
+        quantity = serializers.IntegerField(min_value=0)
+        if params.get('min_quantity'):
+            queryset = queryset.filter(quantity__gte=self.parse('min_quantity', params['min_quantity'], quantity))
+        if params.get('max_quantity'):
+            queryset = queryset.filter(quantity__lte=self.parse('max_quantity', params['max_quantity'], quantity))
+        if params.get('low_stock', '').lower() in TRUE_VALUES:
+            queryset = alerts.low_stock(queryset)
+        if params.get('out_of_stock', '').lower() in TRUE_VALUES:
+            queryset = queryset.filter(quantity=0)
+
+        if params.get('name'):
+            queryset = self.name_prefix(queryset, params['name'])
+        if params.get('search'):
+            queryset = self.search(queryset, params['search'])
+        return queryset
+
+    def name_prefix(self, queryset, prefix):
+        # A range on lower(name) can use the expression index; istartswith
+        # compiles to LIKE ... ESCAPE, which SQLite always answers with a scan.
+        # lower() only folds ASCII in SQLite, so other prefixes keep istartswith.
+        if not prefix.isascii():
+            return queryset.filter(name__istartswith=prefix)
+        prefix = prefix.lower()
+        return queryset.alias(name_lower=Lower('name')).filter(name_lower__gte=prefix, name_lower__lt=prefix + PREFIX_END)
+
+    def search(self, queryset, text):
+        if not fts.is_available(connection):
+            return queryset.filter(name__icontains=text)
+        query = fts_query(text)
+        if not query:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {fts.TABLE} WHERE {fts.TABLE} MATCH %s', [query]))
+
+    def parse(self, name, value, field):
+        try:
+            return field.run_validation(value)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({name: exc.detail})
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': name, 'required': False, 'in': 'query', 'description': description, 'schema': {'type': 'string'}}
+            for name, description in self.params.items()
+        ]
@@ -0,0 +1,63 @@
+"""
+SQLite FTS5 index on product names, kept in sync by triggers.
+
+SQLite drops a table's triggers whenever a migration rebuilds that table
+(most AlterField/AddField operations do), so ensure_index() is idempotent
+and runs after every `migrate` (see ApiConfig.ready) as well as from
+migration 0006. When it has to recreate missing triggers it also rebuilds
+the index from the product table.
+"""
+from django.db import connections
+
+TABLE = 'api_product_fts'
+
+TRIGGERS = {
+    'api_product_fts_insert': f"""
+        CREATE TRIGGER api_product_fts_insert AFTER INSERT ON api_product BEGIN
+            INSERT INTO {TABLE}(rowid, name) VALUES (new.id, new.name);
+        END""",
+    'api_product_fts_delete': f"""
+        CREATE TRIGGER api_product_fts_delete AFTER DELETE ON api_product BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        END""",
+    'api_product_fts_update': f"""
+        CREATE TRIGGER api_product_fts_update AFTER UPDATE OF name ON api_product BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO {TABLE}(rowid, name) VALUES (new.id, new.name);
+        END""",
+}
+
+_available = {}
+
+
+def ensure_index(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            f"name, content='api_product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_product'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+    _available[connection.alias] = True
+    return True
+
+
+def is_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _available:
+        _available[connection.alias] = TABLE in connection.introspection.table_names()
+    return _available[connection.alias]
+
+
+def ensure_after_migrate(sender, using='default', **kwargs):
+    connection = connections[using]
+    if 'api_product' in connection.introspection.table_names():
+        ensure_index(connection)
@@ -0,0 +1,159 @@
+"""
+Stock movement ledger and its pre-bucketed rollups.
+
+Each product write that changes `quantity` or `sold_quantity` adds a
+StockMovement row and bumps the matching daily and monthly StockRollup rows.
+Any write that changes the stock value (a price change too) refreshes the
+closing figures of the current day and month.
+Dashboards only read rollups; raw movements are pruned by
+`manage.py compact_stock_history` according to settings.STOCK_HISTORY.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import StockMovement, StockRollup, StockTotals
+
+DEFAULTS = {
+    'RAW_RETENTION_DAYS': 90,
+    'DAILY_RETENTION_DAYS': 730,
+    'COMPACT_BATCH_SIZE': 5000,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'STOCK_HISTORY', {}).get(name, DEFAULTS[name])
+
+
+def period_starts(moment):
+    day = timezone.localdate(moment)
+    return {StockRollup.DAY: day, StockRollup.MONTH: day.replace(day=1)}
+
+
+def record_changes(changes, now=None):
+    """Write movements for (before, after) snapshots whose stock changed and update the rollups."""
+    now = now or timezone.now()
+    movements = []
+    value_changed = False
+    for before, after in changes:
+        quantity_before = before.quantity if before else 0
+        quantity_after = after.quantity if after else 0
+        sold_before = before.sold_quantity if before else 0
+        sold_after = after.sold_quantity if after else 0
+        value_before = before.price * quantity_before if before else 0
+        value_after = after.price * quantity_after if after else 0
+        value_changed = value_changed or value_before != value_after
+        if quantity_before == quantity_after and sold_before == sold_after:
+            continue
+        movements.append(StockMovement(
+            product_id=after.id if after else None,
+            quantity_delta=quantity_after - quantity_before,
+            sold_delta=sold_after - sold_before,
+            value_delta=value_after - value_before,
+            quantity_after=quantity_after,
+            created_at=now,
+        ))
+    if not movements and not value_changed:
+        return
+
+    deltas = {
+        'movement_count': len(movements),
+        'units_in': sum(m.quantity_delta for m in movements if m.quantity_delta > 0),
+        'units_out': -sum(m.quantity_delta for m in movements if m.quantity_delta < 0),
+        'units_sold': sum(m.sold_delta for m in movements),
+    }
+    with transaction.atomic():
+        if movements:
+            StockMovement.objects.bulk_create(movements)
+        closing = StockTotals.objects.filter(pk=1).values('stock_units', 'stock_value').first() or {}
+        closing = {'closing_units': closing.get('stock_units', 0), 'closing_value': closing.get('stock_value', 0)}
+        for period, start in period_starts(now).items():
+            _bump(period, start, deltas, closing)
+
+
+def _bump(period, start, deltas, closing):
+    lookup = {'period': period, 'period_start': start}
+    expressions = {field: F(field) + delta for field, delta in deltas.items()}
+    if StockRollup.objects.filter(**lookup).update(**expressions, **closing):
+        return
+    try:
+        with transaction.atomic():
+            StockRollup.objects.create(**lookup, **deltas, **closing)
+        return
+    except IntegrityError:
+        pass
+    StockRollup.objects.filter(**lookup).update(**expressions, **closing)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _evolution_queries(months, today):
+    today = today or timezone.localdate()
+    first = add_months(today.replace(day=1), -(months - 1))
+    rollups = StockRollup.objects.filter(period=StockRollup.MONTH, period_start__gte=first).values_list(
+        'period_start', 'closing_value')
+    previous = StockRollup.objects.filter(period=StockRollup.MONTH, period_start__lt=first).order_by(
+        '-period_start').values_list('closing_value', flat=True)
+    return first, rollups, previous
+
+
+def _evolution(first, months, rollups, previous):
+    evolution = []
+    for offset in range(months):
+        start = add_months(first, offset)
+        value = rollups.get(start, previous)
+        previous = value
+        if value is None:
+            continue
+        evolution.append({
+            'month': calendar.month_abbr[start.month],
+            'period': start.strftime('%Y-%m'),
+            'value': value,
+        })
+    return evolution
+
+
+def monthly_evolution(months=12, today=None):
+    """
+    Closing stock value for each of the last `months` months, oldest first.
+    Months without movements carry the previous closing value forward.
+    """
+    first, rollups, previous = _evolution_queries(months, today)
+    return _evolution(first, months, dict(rollups), previous.first())
+
+
+async def amonthly_evolution(months=12, today=None):
+    """monthly_evolution() through the async ORM."""
+    first, rollups, previous = _evolution_queries(months, today)
+    return _evolution(first, months, {start: value async for start, value in rollups}, await previous.afirst())
+
+
+def compact(now=None, raw_days=None, daily_days=None):
+    """
+    Delete raw movements and daily rollups older than the configured retention.
+    Monthly rollups are kept forever. Returns (movements_deleted, daily_rollups_deleted).
+    """
+    now = now or timezone.now()
+    raw_days = get_setting('RAW_RETENTION_DAYS') if raw_days is None else raw_days
+    daily_days = get_setting('DAILY_RETENTION_DAYS') if daily_days is None else daily_days
+    batch_size = get_setting('COMPACT_BATCH_SIZE')
+
+    movements_deleted = 0
+    cutoff = now - timedelta(days=raw_days)
+    while True:
+        # Delete in bounded batches so the table is never locked for long
+        ids = list(StockMovement.objects.filter(created_at__lt=cutoff).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        movements_deleted += StockMovement.objects.filter(id__in=ids).delete()[0]
+
+    daily_cutoff = timezone.localdate(now) - timedelta(days=daily_days)
+    daily_deleted = StockRollup.objects.filter(period=StockRollup.DAY, period_start__lt=daily_cutoff).delete()[0]
+    return movements_deleted, daily_deleted
@@ -0,0 +1,213 @@
+"""
+Streaming CSV import of products and categories.
+
+The file is read row by row and written in batches: each batch costs one
+query to find the products it updates, one bulk_create, one bulk_update and
+one report to api.tracking. Categories are resolved by name from an
+in-memory map (unknown names are created once). Invalid rows are reported
+with their line number and skipped; they never stop the import.
+
+Recognised columns: name (required), price, quantity, sold_quantity,
+category (or category_name, as written by the export) and an optional id.
+A file that is not UTF-8 CSV stops the import with UnreadableFile, after
+the rows before the faulty line were written.
+"""
+import csv
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from . import aggregates, alerts, bulk, tracking
+from .models import Category, Product
+
+MAX_REPORTED_ERRORS = 1000
+
+UPDATE_FIELDS = ['name', 'price', 'quantity', 'sold_quantity', 'category_id']
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.categories_created = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'categories_created': self.categories_created,
+            'errors': self.errors,
+        }
+
+
+class UnreadableFile(Exception):
+    """The file cannot be read from `line` on; `report` holds what was imported before it."""
+    def __init__(self, line, reason, report):
+        super().__init__(f'Line {line}: {reason}')
+        self.line = line
+        self.report = report
+
+
+def decode_lines(binary, encoding='utf-8-sig'):
+    """Text lines of a binary file, decoded one at a time so that an invalid byte is reported on its line."""
+    for line in binary:
+        yield line.decode(encoding)
+
+
+def _unreadable(reader, exc, report):
+    # DictReader.line_num only moves on complete rows; the csv reader's counts every line it was given
+    line_num = reader.reader.line_num
+    if isinstance(exc, UnicodeDecodeError):
+        # The line that failed to decode never reached the reader
+        return UnreadableFile(line_num + 1, 'not valid UTF-8 text', report)
+    return UnreadableFile(line_num, f'invalid CSV ({exc})', report)
+
+
+class CategoryLookup:
+    """Category name -> id map loaded once; unknown names are created on first use."""
+    def __init__(self, create_missing=True):
+        self.create_missing = create_missing
+        self.by_name = {}
+        for pk, name in Category.objects.values_list('pk', 'name').order_by('-pk'):
+            self.by_name[name.strip().lower()] = pk
+        self.created = 0
+
+    def resolve(self, name):
+        key = name.strip().lower()
+        if key in self.by_name:
+            return self.by_name[key]
+        if not self.create_missing:
+            raise ValidationError(f'Unknown category "{name}".')
+        self.by_name[key] = Category.objects.create(name=name.strip()[:100]).pk
+        self.created += 1
+        return self.by_name[key]
+
+
+def _clean(field_name, value, errors):
+    field = Product._meta.get_field(field_name)
+    try:
+        value = field.clean(value, None)
+    except ValidationError as exc:
+        errors[field_name] = exc.messages
+        return None
+    # Positive integer fields only enforce their lower bound in forms and in the database
+    if isinstance(field, models.PositiveIntegerField) and value < 0:
+        errors[field_name] = ['Ensure this value is greater than or equal to 0.']
+    return value
+
+
+def parse_row(row, categories):
+    """Validate one CSV row; returns (values, errors)."""
+    errors = {}
+    values = {
+        'name': _clean('name', (row.get('name') or '').strip(), errors),
+        'price': _clean('price', (row.get('price') or '').strip() or None, errors),
+        'quantity': _clean('quantity', (row.get('quantity') or '').strip() or None, errors),
+        'sold_quantity': _clean('sold_quantity', (row.get('sold_quantity') or '').strip() or 0, errors),
+        'category_id': None,
+    }
+    category = (row.get('category') or row.get('category_name') or '').strip()
+    if category:
+        try:
+            values['category_id'] = categories.resolve(category)
+        except ValidationError as exc:
+            errors['category'] = exc.messages
+    pk = (row.get('id') or '').strip()
+    values['id'] = int(pk) if pk.isdigit() else None
+    return values, errors
+
+
+def _write_batch(batch, report):
+    with transaction.atomic():
+        # Locked until the batch is written, so the before-snapshots are the rows it overwrites
+        by_id = Product.objects.select_for_update().in_bulk([values['id'] for _, values in batch if values['id']])
+        names = {values['name'] for _, values in batch}
+        by_key = {}
+        for product in Product.objects.select_for_update().filter(name__in=names).order_by('-pk'):
+            by_key[(product.name, product.category_id)] = product
+
+        before = {}
+        to_update = {}
+        to_create = {}
+        for _, values in batch:
+            key = (values['name'], values['category_id'])
+            product = by_id.get(values['id']) or by_key.get(key)
+            if product is None:
+                product = to_create.get(key)
+            if product is None:
+                product = to_create[key] = Product()
+            elif product.pk:
+                before.setdefault(product.pk, aggregates.snapshot(product))
+                to_update[product.pk] = product
+            for field in UPDATE_FIELDS:
+                setattr(product, field, values[field])
+            by_key[key] = product
+
+        alerts.assign_levels([*to_create.values(), *to_update.values()])
+        with tracking.suppressed():
+            Product.objects.bulk_create(to_create.values())
+            bulk.update_rows(to_update.values(), UPDATE_FIELDS + ['alert_level'])
+            tracking.product_changes(
+                [(None, aggregates.snapshot(product)) for product in to_create.values()]
+                + [(before[pk], aggregates.snapshot(product)) for pk, product in to_update.items()]
+            )
+    report.created += len(to_create)
+    report.updated += len(to_update)
+
+
+def import_products(stream, batch_size=None, create_categories=True, progress=None):
+    """
+    Import products from a text stream of CSV data. `progress`, if given, is
+    called with the ImportReport after every batch.
+    """
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+    report = ImportReport()
+    categories = CategoryLookup(create_missing=create_categories)
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise _unreadable(reader, exc, report) from exc
+    if not fieldnames or 'name' not in [name.strip() for name in fieldnames]:
+        report.error(1, {'file': ['The first line must be a header with at least a "name" column.']})
+        return report
+    reader.fieldnames = [name.strip() for name in fieldnames]
+
+    batch = []
+    try:
+        for row in reader:
+            report.rows += 1
+            values, errors = parse_row(row, categories)
+            if errors:
+                report.error(reader.line_num, errors)
+                continue
+            batch.append((reader.line_num, values))
+            if len(batch) >= batch_size:
+                _write_batch(batch, report)
+                batch = []
+                report.categories_created = categories.created
+                if progress:
+                    progress(report)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        unreadable = _unreadable(reader, exc, report)
+    else:
+        unreadable = None
+    if batch:
+        _write_batch(batch, report)
+    report.categories_created = categories.created
+    if unreadable is not None:
+        raise unreadable
+    if progress:
+        progress(report)
+    return report
@@ -0,0 +1,291 @@
+"""
+Database-backed queue for work too slow for a request: CSV imports, catalogue
+exports, large bulk writes and dashboard rebuilds.
+
+The API stores a Job row and answers 202 with it; `manage.py run_jobs` runs
+a pool of worker threads that claim queued jobs with a conditional UPDATE (so
+two workers, even in different processes, never run the same job) and call
+the handler registered for the job's kind. Handlers report progress through
+the job, which clients poll at /products/api/v1/jobs/<id>/. Nothing but the
+database is needed, so this works on a single SQLite node.
+
+Files (uploads waiting to be imported, finished exports) are kept in
+JOBS['FILES_DIR'], which the web and worker processes must share.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.utils import timezone
+
+from . import aggregates, bulk, caching, export, imports
+from .models import Job, Product
+
+logger = logging.getLogger(__name__)
+
+IMPORT = 'import'
+EXPORT = 'export'
+BULK = 'bulk'
+REBUILD_STATS = 'rebuild_stats'
+
+DEFAULTS = {
+    'FILES_DIR': settings.BASE_DIR / 'jobs',
+    'POLL_INTERVAL': 1.0,
+    'PROGRESS_INTERVAL': 0.5,
+    'HEARTBEAT_INTERVAL': 60,
+    'STALE_AFTER': 600,
+    'RETENTION_DAYS': 7,
+}
+
+HANDLERS = {}
+
+
+def get_setting(name):
+    return getattr(settings, 'JOBS', {}).get(name, DEFAULTS[name])
+
+
+def handler(kind):
+    """Register `function(job, progress)` as the runner of `kind`; its return value is the job's result."""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, params=None, user_id=None):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind "{kind}"')
+    return Job.objects.create(kind=kind, params=params or {}, user_id=user_id)
+
+
+def file_path(name):
+    return Path(get_setting('FILES_DIR')) / name
+
+
+def save_upload(upload):
+    """Copy an uploaded file where the workers can read it; returns its name for the job params."""
+    name = f'uploads/{uuid.uuid4().hex}.csv'
+    path = file_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    return name
+
+
+def remove_file(name):
+    try:
+        os.remove(file_path(name))
+    except FileNotFoundError:
+        pass
+
+
+class Progress:
+    """
+    Passed to handlers as progress(done, total=None). Writes to the job row at
+    most every PROGRESS_INTERVAL seconds, and refreshes its heartbeat.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.interval = get_setting('PROGRESS_INTERVAL')
+        self.written_at = 0
+
+    def __call__(self, done, total=None, force=False):
+        now = time.monotonic()
+        if not force and now - self.written_at < self.interval:
+            return
+        self.written_at = now
+        values = {'progress': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            values['total'] = total
+        Job.objects.filter(pk=self.job.pk).update(**values)
+
+
+class Heartbeat(threading.Thread):
+    """
+    Refreshes the heartbeat of a running job every HEARTBEAT_INTERVAL seconds,
+    so that a handler busy in a single long step (a bulk write, a rebuild) is
+    not taken for a dead one by fail_stale().
+    """
+    def __init__(self, job):
+        super().__init__(name=f'job-{job.pk}-heartbeat', daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = get_setting('HEARTBEAT_INTERVAL')
+        try:
+            while not self.stopped.wait(interval):
+                try:
+                    Job.objects.filter(pk=self.job.pk, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning('Could not record the heartbeat of job %s', self.job.pk, exc_info=True)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def claim(worker):
+    """Mark the oldest queued job as running on `worker` and return it, or None if the queue is empty."""
+    while True:
+        pk = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+        # Another worker took it first, try the next one
+
+
+def finish(job, status, result=None, error=''):
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(status=status, result=result, error=error, finished_at=job.finished_at)
+
+
+def run(job):
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = HANDLERS[job.kind](job, Progress(job))
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        finish(job, Job.FAILED, error=f'{type(exc).__name__}: {exc}')
+    else:
+        finish(job, Job.SUCCEEDED, result=result)
+    finally:
+        heartbeat.stop()
+    return job
+
+
+def fail_stale():
+    """Fail running jobs whose worker stopped reporting (killed or crashed); they may have partly run."""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('STALE_AFTER'))
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=Job.FAILED, error='The worker stopped responding.', finished_at=timezone.now(),
+    )
+
+
+def purge():
+    """Delete finished jobs older than RETENTION_DAYS, with their files."""
+    cutoff = timezone.now() - timedelta(days=get_setting('RETENTION_DAYS'))
+    old = Job.objects.filter(status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=cutoff)
+    for kind, params, result in old.values_list('kind', 'params', 'result'):
+        for name in [(params or {}).get('file'), (result or {}).get('file')]:
+            if name:
+                remove_file(name)
+    return old.delete()[0]
+
+
+def work(worker, stop, poll_interval=None, once=False):
+    """Worker thread loop: run jobs until `stop` is set, or until the queue is empty with once=True."""
+    poll_interval = poll_interval or get_setting('POLL_INTERVAL')
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            job = claim(worker)
+            if job is not None:
+                run(job)
+            elif once:
+                return
+            else:
+                stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def start_workers(count, name, poll_interval=None, once=False):
+    """Start `count` worker threads; returns (threads, stop event)."""
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work, args=(f'{name}-{index}', stop, poll_interval, once), name=f'{name}-{index}', daemon=True)
+        for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads, stop
+
+
+@handler(IMPORT)
+def run_import(job, progress):
+    params = job.params
+    path = file_path(params['file'])
+    try:
+        with open(path, 'rb') as stream:
+            # Lines, not rows: close enough for a progress bar
+            total = max(sum(1 for _ in stream) - 1, 0)
+            stream.seek(0)
+            progress(0, total, force=True)
+            report = imports.import_products(
+                imports.decode_lines(stream),
+                batch_size=params.get('batch_size'),
+                create_categories=params.get('create_categories', True),
+                progress=lambda report: progress(min(report.rows, total)),
+            )
+    finally:
+        remove_file(params['file'])
+    progress(report.rows, max(total, report.rows), force=True)
+    return report.as_dict()
+
+
+@handler(EXPORT)
+def run_export(job, progress):
+    fmt = job.params.get('format', 'csv')
+    if fmt not in export.ENCODERS:
+        raise ValueError(f'Unknown export format "{fmt}"')
+    total = aggregates.get_totals().product_count
+    progress(0, total, force=True)
+    name = f'exports/products-{job.pk}.{fmt}'
+    path = file_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            written += 1
+            progress(written)
+            yield row
+
+    partial = path.with_suffix('.part')
+    with open(partial, 'w', encoding='utf-8', newline='') as destination:
+        for line in export.ENCODERS[fmt](counted(export.rows())):
+            destination.write(line)
+    partial.replace(path)
+    progress(written, max(total, written), force=True)
+    return {'format': fmt, 'rows': written, 'size': path.stat().st_size, 'file': name}
+
+
+@handler(BULK)
+def run_bulk(job, progress):
+    params = job.params
+    items = params['items']
+    mode = params.get('mode', bulk.ALL_OR_NOTHING)
+    progress(0, len(items), force=True)
+    result = bulk.run(params['method'], items, mode)
+    progress(len(items), force=True)
+    return {'mode': mode, 'has_errors': result.has_errors, 'results': result.items}
+
+
+@handler(REBUILD_STATS)
+def run_rebuild_stats(job, progress):
+    progress(0, 1, force=True)
+    aggregates.rebuild()
+    caching.bump(Product)
+    problems = aggregates.verify()
+    progress(1, force=True)
+    return {'problems': problems}
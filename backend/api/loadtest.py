@@ -0,0 +1,127 @@
+"""
+HTTP load generator used by `manage.py loadtest`.
+
+Requests are sent from a pool of threads, each with its own keep-alive
+connection, against a running server or against a WSGI (gunicorn) or ASGI
+(uvicorn, with ASYNC_READ_VIEWS=True) server started for the run. The
+timings are client-side, from sending the request to reading the body.
+"""
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .benchmarks import percentile
+
+READ_PATHS = [
+    '/products/api/v1/products/',
+    '/products/api/v1/products/?low_stock=true',
+    '/products/api/v1/categories/',
+    '/products/api/v1/stats/',
+    '/products/api/v1/auth/me/',
+]
+
+SERVERS = {
+    'wsgi': lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--threads', str(threads), '--worker-class', 'gthread', '--log-level', 'warning',
+    ],
+    'asgi': lambda port, workers, threads: [
+        sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning', '--no-access-log',
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(kind, workers=1, threads=8, timeout=30):
+    """Start a gunicorn ('wsgi') or uvicorn ('asgi') server and yield its base URL."""
+    port = free_port()
+    env = dict(os.environ, ASYNC_READ_VIEWS=str(kind == 'asgi'))
+    process = subprocess.Popen(SERVERS[kind](port, workers, threads), cwd=settings.BASE_DIR, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'The {kind} server did not start')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait(timeout=timeout)
+
+
+def run(base_url, path, token, requests=500, concurrency=16, cold=False):
+    """
+    Send `requests` GETs for `path` from `concurrency` threads. With `cold`
+    every request carries a unique query parameter, so none is a cache hit.
+    Returns a result row with rps and latency percentiles in milliseconds.
+    """
+    target = urlsplit(base_url)
+    headers = {'Authorization': f'Bearer {token}'}
+    samples = []
+    errors = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        try:
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                url = path
+                if cold:
+                    url += ('&' if '?' in url else '?') + f'_load={index}-{time.time_ns()}'
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', url, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException) as exc:
+                    connection.close()
+                    errors.append(exc)
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if response.status == 200:
+                        samples.append(elapsed)
+                    else:
+                        errors.append(response.status)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'path': path,
+        'requests': len(samples),
+        'errors': len(errors),
+        'rps': round(len(samples) / elapsed),
+        'p50_ms': round(percentile(samples, 50), 2) if samples else None,
+        'p99_ms': round(percentile(samples, 99), 2) if samples else None,
+    }
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Run performance scenarios against a throwaway database and print the timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all). Available: {", ".join(benchmarks.SCENARIOS)}')
+        parser.add_argument('--products', type=int, default=10000, help='Number of products to seed')
+        parser.add_argument('--batch', type=int, default=1000, help='Rows written per batch by the write scenarios')
+        parser.add_argument('--repeat', type=int, default=5, help='Repetitions per measured case')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint in the endpoints scenario')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+        parser.add_argument('--save-baseline', metavar='FILE', help='Store the results (and the options used) as a baseline')
+        parser.add_argument('--baseline', metavar='FILE', help='Compare the results with a stored baseline; fail on regressions')
+        parser.add_argument('--threshold', type=float, default=20, help='Percentage a metric may worsen before it counts as a regression')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(benchmarks.SCENARIOS)
+        unknown = set(names) - set(benchmarks.SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # A file rather than the default in-memory test database, so that
+                # concurrent scenarios see the same locking as a real deployment
+                connection.settings_dict['TEST'] = dict(connection.settings_dict.get('TEST', {}), NAME=os.path.join(directory, 'benchmark.sqlite3'))
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                # The scenarios time slow requests on purpose; keep the slow-request log quiet
+                with override_settings(REQUEST_METRICS=dict(settings.REQUEST_METRICS, SLOW_REQUEST_MS=float('inf'))):
+                    results = {name: benchmarks.SCENARIOS[name](options) for name in names}
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline:
+                baseline.write(benchmarks.dump({'options': self.run_options(options), 'results': results}))
+
+        if options['json']:
+            self.stdout.write(benchmarks.dump(results))
+        else:
+            for name, rows in results.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(benchmarks.render_rows(rows))
+                self.stdout.write('')
+
+        if options['baseline']:
+            self.check_baseline(options, results)
+
+    def run_options(self, options):
+        return {key: options[key] for key in ('products', 'batch', 'repeat', 'requests')}
+
+    def check_baseline(self, options, results):
+        try:
+            with open(options['baseline']) as baseline:
+                stored = json.load(baseline)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read the baseline: {exc}')
+        if stored.get('options') != self.run_options(options):
+            self.stderr.write(self.style.WARNING(f'The baseline was recorded with other options: {stored.get("options")}'))
+
+        rows = benchmarks.compare(stored.get('results', {}), results, options['threshold'])
+        regressions = [row for row in rows if row['regression']]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with {options["baseline"]} (threshold {options["threshold"]}%)'))
+        self.stdout.write(benchmarks.render_rows(regressions or rows) if rows else 'No comparable results.')
+        if regressions:
+            raise CommandError(f'{len(regressions)} metric(s) regressed by more than {options["threshold"]}%')
+        self.stdout.write(self.style.SUCCESS('No regression.'))
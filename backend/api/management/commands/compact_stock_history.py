@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import history
+
+
+class Command(BaseCommand):
+    help = 'Delete raw stock movements and daily rollups older than the configured retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-days', type=int, help='Keep raw movements for this many days (default: STOCK_HISTORY setting)')
+        parser.add_argument('--daily-days', type=int, help='Keep daily rollups for this many days (default: STOCK_HISTORY setting)')
+
+    def handle(self, *args, **options):
+        movements, daily = history.compact(raw_days=options['raw_days'], daily_days=options['daily_days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {movements} stock movement(s) and {daily} daily rollup(s).'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import imports
+
+
+class Command(BaseCommand):
+    help = 'Import products (and their categories) from a CSV file, upserting in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header line (name, price, quantity, sold_quantity, category, id)')
+        parser.add_argument('--batch-size', type=int, help='Rows written per batch (default: IMPORT_BATCH_SIZE)')
+        parser.add_argument('--no-create-categories', action='store_true', help='Reject rows whose category does not exist')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f'{report.rows} rows read, {report.created} created, {report.updated} updated, {report.failed} failed')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = imports.import_products(
+                    imports.decode_lines(stream),
+                    batch_size=options['batch_size'],
+                    create_categories=not options['no_create_categories'],
+                    progress=progress,
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+        except imports.UnreadableFile as exc:
+            written = exc.report.created + exc.report.updated
+            raise CommandError(f'{exc} ({written} row(s) before it were imported)')
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... and {report.failed - len(report.errors)} more invalid row(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.created + report.updated} of {report.rows} rows '
+            f'({report.categories_created} new categories).'
+        ))
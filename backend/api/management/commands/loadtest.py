@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import benchmarks, loadtest
+
+
+class Command(BaseCommand):
+    help = 'Measure requests per second and p50/p99 latency of the read endpoints over HTTP (WSGI against ASGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help=f'Paths to load (default: {", ".join(loadtest.READ_PATHS)})')
+        parser.add_argument('--server', action='append', choices=sorted(loadtest.SERVERS),
+                            help='Start this server for the run (repeatable); default: use --url')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of a running server')
+        parser.add_argument('--user', required=True, help='Username the requests are authenticated as')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=1, help='Server worker processes')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per WSGI worker')
+        parser.add_argument('--cold', action='store_true', help='Defeat the response cache with a unique query parameter')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named "{options["user"]}"')
+        token = str(RefreshToken.for_user(user).access_token)
+        paths = options['paths'] or loadtest.READ_PATHS
+
+        def load(base_url):
+            return [
+                loadtest.run(base_url, path, token, options['requests'], options['concurrency'], options['cold'])
+                for path in paths
+            ]
+
+        results = {}
+        if options['server']:
+            for kind in options['server']:
+                with loadtest.serve(kind, options['workers'], options['threads']) as base_url:
+                    results[kind] = load(base_url)
+        else:
+            results[options['url']] = load(options['url'])
+
+        if options['json']:
+            self.stdout.write(benchmarks.dump(results))
+            return
+        for name, rows in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(benchmarks.render_rows(rows))
+            self.stdout.write('')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import changes
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed events older than the configured retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Keep events for this many hours (default: CHANGE_FEED setting)')
+
+    def handle(self, *args, **options):
+        deleted = changes.purge(hours=options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change event(s).'))
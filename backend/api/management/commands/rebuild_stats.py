@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed dashboard figures and low-stock alert levels from the product table and verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare the stored figures with a fresh computation, do not write anything',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            aggregates.rebuild()
+            self.stdout.write('Dashboard figures rebuilt.')
+
+        problems = aggregates.verify()
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} dashboard figure(s) out of date, run rebuild_stats to repair')
+        self.stdout.write(self.style.SUCCESS('Dashboard figures are consistent.'))
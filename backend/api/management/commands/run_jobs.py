@@ -0,0 +1,36 @@
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (imports, exports, bulk writes, dashboard rebuilds) in a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Jobs run at the same time')
+        parser.add_argument('--poll', type=float, help='Seconds between queue checks when idle (default: JOBS setting)')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of waiting for jobs')
+
+    def handle(self, *args, **options):
+        stale = jobs.fail_stale()
+        purged = jobs.purge()
+        if stale or purged:
+            self.stdout.write(f'{stale} stale job(s) marked failed, {purged} old job(s) deleted.')
+
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        threads, stop = jobs.start_workers(options['workers'], name, options['poll'], options['once'])
+        self.stdout.write(f'{len(threads)} worker(s) running as {name}.')
+        try:
+            for thread in threads:
+                # join() with a timeout so Ctrl+C is not blocked until the thread ends
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping after the running jobs finish...')
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Fill the configured database with generated categories, products and users in every role (for load tests)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10, help='Categories to create')
+        parser.add_argument('--products', type=int, default=10000, help='Products the catalogue should hold')
+        parser.add_argument('--users', type=int, default=2, help='Users per role (Admin, Manager, Reader, no group)')
+        parser.add_argument('--password', default=benchmarks.BENCH_PASSWORD, help='Password of the generated users')
+
+    def handle(self, *args, **options):
+        benchmarks.seed_products(options['products'], options['categories'])
+        users = benchmarks.seed_users(options['users'], options['password'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Catalogue seeded up to {options["products"]} product(s); '
+            f'{sum(len(group) for group in users.values())} user(s) <role>-<n>@seed.local '
+            f'with the password "{options["password"]}".'
+        ))
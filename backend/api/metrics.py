@@ -0,0 +1,241 @@
+"""
+Per-request performance metrics, exposed in the Prometheus text format.
+
+RequestMetricsMiddleware opens a Sample for every request and stores it in
+a context variable, which follows the request into DRF views, sync_to_async
+threads and async views. The other parts report into it:
+
+- every database connection gets record_query() as an execute wrapper
+  (installed from connection_created, see ApiConfig.ready);
+- serializers and response rendering run inside timed('serialization');
+- JWT authentication runs inside timed('auth').
+
+When the request ends, its wall time, query count and time, serialization
+and auth time and response size are added to histograms labelled by route,
+and requests slower than REQUEST_METRICS['SLOW_REQUEST_MS'] are logged with
+their queries. Histograms live in process memory: with several server
+workers, each worker exposes its own figures.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('api.slow_requests')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_LOG_MAX_QUERIES': 50,
+}
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar('api_request_metrics', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=('route', 'method')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # One counter per bucket, then sum and count
+                series = self.series[labels] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted(self.series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for labels, series in items:
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-1]}')
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Wall time of a request.', TIME_BUCKETS, labels=('route', 'method', 'status'))
+QUERY_COUNT = Histogram('api_request_queries', 'SQL queries per request.', COUNT_BUCKETS)
+QUERY_DURATION = Histogram('api_request_query_duration_seconds', 'Time spent in SQL per request.', TIME_BUCKETS)
+SERIALIZATION_DURATION = Histogram(
+    'api_request_serialization_seconds', 'Time spent in serializers and rendering per request.', TIME_BUCKETS)
+AUTH_DURATION = Histogram('api_request_auth_seconds', 'Time spent authenticating per request.', TIME_BUCKETS)
+RESPONSE_SIZE = Histogram('api_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+
+HISTOGRAMS = [REQUEST_DURATION, QUERY_COUNT, QUERY_DURATION, SERIALIZATION_DURATION, AUTH_DURATION, RESPONSE_SIZE]
+
+
+class Sample:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        # The first queries only, for the slow request log
+        self.queries = []
+        self.max_queries = get_setting('SLOW_LOG_MAX_QUERIES')
+        self.phases = {'serialization': 0.0, 'auth': 0.0}
+        self.active = set()
+
+    def add_query(self, sql, duration):
+        self.query_count += 1
+        self.query_time += duration
+        if len(self.queries) < self.max_queries:
+            self.queries.append((sql, duration))
+
+
+def record_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last entry on exit
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to `phase` of the current request; nested blocks count once."""
+    sample = _current.get()
+    if sample is None or phase in sample.active:
+        yield
+        return
+    sample.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.phases[phase] += time.perf_counter() - start
+        sample.active.discard(phase)
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match.route
+
+
+def finish(sample, request, response):
+    duration = time.perf_counter() - sample.start
+    route = route_of(request)
+    labels = (route, request.method)
+    REQUEST_DURATION.observe((route, request.method, str(response.status_code)), duration)
+    QUERY_COUNT.observe(labels, sample.query_count)
+    QUERY_DURATION.observe(labels, sample.query_time)
+    SERIALIZATION_DURATION.observe(labels, sample.phases['serialization'])
+    AUTH_DURATION.observe(labels, sample.phases['auth'])
+    if not response.streaming:
+        RESPONSE_SIZE.observe(labels, len(response.content))
+
+    if duration * 1000 >= get_setting('SLOW_REQUEST_MS'):
+        queries = '\n'.join(f'  {query_duration * 1000:.1f} ms  {sql}' for sql, query_duration in sample.queries)
+        logger.warning(
+            'Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, serialization %.0f ms, auth %.0f ms\n%s',
+            request.method, request.get_full_path(), route, duration * 1000, sample.query_count,
+            sample.query_time * 1000, sample.phases['serialization'] * 1000, sample.phases['auth'] * 1000, queries,
+        )
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+class RequestMetricsMiddleware:
+    """Collects the metrics above for every request; works under WSGI and ASGI."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_setting('ENABLED')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        sample = Sample()
+        token = _current.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finish(sample, request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        sample = Sample()
+        token = _current.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        finish(sample, request, response)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered by the handler after the view returns
+        render = response.render
+
+        def timed_render():
+            with timed('serialization'):
+                return render()
+        response.render = timed_render
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2025-12-01 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_category_product_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sold_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
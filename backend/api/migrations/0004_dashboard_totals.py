@@ -0,0 +1,74 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Category = apps.get_model('api', 'Category')
+    StockTotals = apps.get_model('api', 'StockTotals')
+    CategoryTotals = apps.get_model('api', 'CategoryTotals')
+
+    totals = StockTotals(pk=1)
+    categories = {pk: CategoryTotals(category_id=pk) for pk in Category.objects.values_list('pk', flat=True)}
+    for category_id, price, quantity in Product.objects.values_list('category_id', 'price', 'quantity').iterator():
+        value = price * quantity
+        totals.product_count += 1
+        totals.stock_units += quantity
+        totals.stock_value += value
+        totals.low_stock_count += quantity < 5
+        totals.out_of_stock_count += quantity == 0
+        if category_id is None:
+            totals.uncategorized_count += 1
+            totals.uncategorized_units += quantity
+            totals.uncategorized_value += value
+        else:
+            row = categories[category_id]
+            row.product_count += 1
+            row.stock_units += quantity
+            row.stock_value += value
+    totals.save()
+    CategoryTotals.objects.bulk_create(categories.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_product_sold_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.IntegerField(default=0)),
+                ('stock_units', models.BigIntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('low_stock_count', models.IntegerField(default=0)),
+                ('out_of_stock_count', models.IntegerField(default=0)),
+                ('uncategorized_count', models.IntegerField(default=0)),
+                ('uncategorized_units', models.BigIntegerField(default=0)),
+                ('uncategorized_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name_plural': 'stock totals',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.IntegerField(default=0)),
+                ('stock_units', models.BigIntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='totals', to='api.category')),
+            ],
+            options={
+                'verbose_name_plural': 'category totals',
+                'indexes': [models.Index(fields=['-stock_value'], name='api_cattotals_value_idx')],
+            },
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def seed_rollups(apps, schema_editor):
+    # Start the history at the current stock level so the chart has a first point
+    StockTotals = apps.get_model('api', 'StockTotals')
+    StockRollup = apps.get_model('api', 'StockRollup')
+    totals = StockTotals.objects.filter(pk=1).first()
+    if totals is None:
+        return
+    today = timezone.localdate()
+    for period, start in (('day', today), ('month', today.replace(day=1))):
+        StockRollup.objects.create(
+            period=period,
+            period_start=start,
+            closing_units=totals.stock_units,
+            closing_value=totals.stock_value,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_dashboard_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_delta', models.IntegerField(default=0)),
+                ('sold_delta', models.IntegerField(default=0)),
+                ('value_delta', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('quantity_after', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('movement_count', models.IntegerField(default=0)),
+                ('units_in', models.BigIntegerField(default=0)),
+                ('units_out', models.BigIntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('closing_units', models.BigIntegerField(default=0)),
+                ('closing_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'ordering': ['period', 'period_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start'), name='api_stockrollup_unique_period'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='api.product'),
+        ),
+        migrations.RunPython(seed_rollups, migrations.RunPython.noop),
+    ]
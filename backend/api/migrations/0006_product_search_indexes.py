@@ -0,0 +1,48 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:54
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def create_fts_index(apps, schema_editor):
+    from api import fts
+    fts.ensure_index(schema_editor.connection)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('api_product_fts_insert', 'api_product_fts_delete', 'api_product_fts_update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS api_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_stock_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='api_product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='api_product_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['quantity'], name='api_product_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sold_quantity'], name='api_product_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='api_product_cat_price_idx'),
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
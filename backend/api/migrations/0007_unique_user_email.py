@@ -0,0 +1,65 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:05
+
+from django.db import migrations
+from django.db.models import Count
+
+INDEX_NAME = 'api_auth_user_email_uniq'
+LISTED_EMAILS = 50
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Refuse to migrate while several accounts share an email: which account keeps
+    it is for an operator to decide, the migration lists them and stops.
+    """
+    User = apps.get_model('auth', 'User')
+    duplicated = list(
+        User.objects.exclude(email='')
+        .values('email')
+        .annotate(accounts=Count('id'))
+        .filter(accounts__gt=1)
+        .order_by('email')
+        .values_list('email', flat=True)
+    )
+    if not duplicated:
+        return
+    lines = []
+    for email in duplicated[:LISTED_EMAILS]:
+        ids = User.objects.filter(email=email).order_by('id').values_list('id', flat=True)
+        lines.append(f'  {email}: user ids {", ".join(map(str, ids))}')
+    if len(duplicated) > LISTED_EMAILS:
+        lines.append(f'  ... and {len(duplicated) - LISTED_EMAILS} more')
+    raise RuntimeError(
+        f'{len(duplicated)} email(s) are used by several accounts and must be made unique before '
+        'emails can be indexed as unique. Change or clear them (admin or shell), then run migrate again:\n'
+        + '\n'.join(lines)
+    )
+
+
+def create_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        # Users created without an email keep an empty one, so only non-empty emails are unique
+        schema_editor.execute(f"CREATE UNIQUE INDEX {INDEX_NAME} ON auth_user (email) WHERE email <> ''")
+    else:
+        # No partial indexes (MySQL): index the lookup, uniqueness is left to the views
+        schema_editor.execute(f'CREATE INDEX {INDEX_NAME} ON auth_user (email)')
+
+
+def drop_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {INDEX_NAME} ON auth_user')
+    else:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_search_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_change_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='categorytotals',
+            index=models.Index(fields=['product_count'], name='api_cattotals_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='categorytotals',
+            index=models.Index(fields=['stock_units'], name='api_cattotals_units_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def fill_alert_levels(apps, schema_editor):
+    # No product or category has a threshold yet: every product takes the default
+    threshold = getattr(settings, 'STOCK_ALERTS', {}).get('LOW_STOCK_THRESHOLD', 5)
+    Product = apps.get_model('api', 'Product')
+    StockTotals = apps.get_model('api', 'StockTotals')
+    if threshold != 5:
+        Product.objects.update(alert_level=threshold)
+        StockTotals.objects.update(low_stock_count=Product.objects.filter(quantity__lt=threshold).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_category_totals_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='alert_level',
+            field=models.PositiveIntegerField(default=5, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.F('sold_quantity')), output_field=models.FloatField()), name='api_product_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('quantity'), '-', models.F('alert_level')), name='api_product_margin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'sold_quantity'], name='api_product_cat_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.F('sold_quantity')), output_field=models.FloatField()), name='api_product_cat_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), django.db.models.expressions.CombinedExpression(models.F('quantity'), '-', models.F('alert_level')), name='api_product_cat_margin_idx'),
+        ),
+        migrations.RunPython(fill_alert_levels, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,21 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.functions import Lower
+
+# Sort keys of the leaderboards and low-stock lists (api.alerts), each backed by an index.
+# Revenue is ranked as a float: a decimal expression is wrapped in a CAST on SQLite that the index cannot match.
+REVENUE = ExpressionWrapper(F('price') * F('sold_quantity'), output_field=FloatField())
+STOCK_MARGIN = F('quantity') - F('alert_level')
+
 
 # Create your models here.
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=50, blank=True) # CSS class or emoji
+    # Low-stock alert level of its products that have none of their own (default: STOCK_ALERTS['LOW_STOCK_THRESHOLD'])
+    low_stock_threshold = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -15,6 +26,155 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField()
     sold_quantity = models.PositiveIntegerField(default=0)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
+    low_stock_threshold = models.PositiveIntegerField(null=True, blank=True)
+    # Threshold in effect: its own, else its category's, else the default; kept by api.alerts
+    alert_level = models.PositiveIntegerField(default=5, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='api_product_name_idx'),
+            models.Index(Lower('name'), name='api_product_name_lower_idx'),
+            models.Index(fields=['quantity'], name='api_product_quantity_idx'),
+            models.Index(fields=['sold_quantity'], name='api_product_sold_idx'),
+            models.Index(fields=['category', 'price'], name='api_product_cat_price_idx'),
+            # Leaderboards and low-stock lists (api.alerts)
+            models.Index(REVENUE, name='api_product_revenue_idx'),
+            models.Index(STOCK_MARGIN, name='api_product_margin_idx'),
+            models.Index(fields=['category', 'sold_quantity'], name='api_product_cat_sold_idx'),
+            models.Index('category', REVENUE, name='api_product_cat_revenue_idx'),
+            models.Index('category', STOCK_MARGIN, name='api_product_cat_margin_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # The signal handlers lock and read the stored row (api.aggregates.loaded_snapshot),
+        # which has to happen in the transaction of the write
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+# Dashboard aggregates, kept up to date by api.aggregates
+class StockTotals(models.Model):
+    """
+    Single row holding the catalogue-wide figures shown on the dashboard.
+    Products without a category are tracked in the uncategorized_* columns.
+    """
+    product_count = models.IntegerField(default=0)
+    stock_units = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    low_stock_count = models.IntegerField(default=0)
+    out_of_stock_count = models.IntegerField(default=0)
+    uncategorized_count = models.IntegerField(default=0)
+    uncategorized_units = models.BigIntegerField(default=0)
+    uncategorized_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'stock totals'
+
+class CategoryTotals(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name='totals')
+    product_count = models.IntegerField(default=0)
+    stock_units = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'category totals'
+        indexes = [
+            models.Index(fields=['-stock_value'], name='api_cattotals_value_idx'),
+            # Category list sorted by its counters (api.filters.CategoryOrderingFilter)
+            models.Index(fields=['product_count'], name='api_cattotals_count_idx'),
+            models.Index(fields=['stock_units'], name='api_cattotals_units_idx'),
+        ]
+
+
+# Stock history, written by api.history
+class StockMovement(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    quantity_delta = models.IntegerField(default=0)
+    sold_delta = models.IntegerField(default=0)
+    value_delta = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    quantity_after = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+class StockRollup(models.Model):
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'Day'), (MONTH, 'Month')]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    movement_count = models.IntegerField(default=0)
+    units_in = models.BigIntegerField(default=0)
+    units_out = models.BigIntegerField(default=0)
+    units_sold = models.BigIntegerField(default=0)
+    closing_units = models.BigIntegerField(default=0)
+    closing_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['period', 'period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start'], name='api_stockrollup_unique_period'),
+        ]
+
+
+# Background jobs, queued by the API and run by `manage.py run_jobs` (see api.jobs)
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='api_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+# Change feed of products and categories, written by api.changes
+class ChangeEvent(models.Model):
+    """One created/updated/deleted event; the id is the sequence number clients resume from."""
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    model = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    data = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+
+class ChangeCounter(models.Model):
+    """
+    Single row counting the change events. Event writers update it first, so
+    its lock orders their commits like the event ids (see api.changes).
+    """
+    events = models.BigIntegerField(default=0)
@@ -0,0 +1,110 @@
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is a `WHERE id > cursor`
+    range scan, so deep pages cost the same as the first one.
+
+    paginate_queryset() is split around the single query it runs, so the async
+    views (api.async_views) can fetch the page with the async ORM and still
+    produce the same cursors and links.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_query = self.get_page_query(queryset, request, view)
+        if page_query is None:
+            return None
+        return self.set_page(list(page_query))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_query = self.get_page_query(queryset, request, view)
+        if page_query is None:
+            return None
+        return self.set_page([obj async for obj in page_query])
+
+    def get_page_query(self, queryset, request, view=None):
+        """The queryset for one page plus one row, or None when pagination is off."""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+        self.page_state = (offset, reverse, current_position)
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            order = self.ordering[0]
+            is_reversed = order.startswith('-')
+            order_attr = order.lstrip('-')
+            if self.cursor.reverse != is_reversed:
+                kwargs = {order_attr + '__lt': current_position}
+            else:
+                kwargs = {order_attr + '__gt': current_position}
+            queryset = queryset.filter(**kwargs)
+
+        # One extra row tells whether a following page exists
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        """Same bookkeeping as CursorPagination.paginate_queryset() once the rows are loaded."""
+        offset, reverse, current_position = self.page_state
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+class RankingCursorPagination(ProductCursorPagination):
+    """Leaderboards and low-stock lists (api.alerts): keyset pages in the ranking order the view sets."""
+    page_size = 20
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return view.ranking_ordering
+
+
+class JobCursorPagination(CursorPagination):
+    """Newest jobs first, by primary key."""
+    ordering = '-id'
+    page_size = 50
@@ -1,17 +1,16 @@
 from rest_framework import permissions
 
+from .roles import ADMIN, MANAGER, has_role
+
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Admin').exists()
+        return has_role(request.user, ADMIN)
 
 class IsManager(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return request.user and (
-            request.user.groups.filter(name='Manager').exists() or 
-            request.user.groups.filter(name='Admin').exists()
-        )
+        return has_role(request.user, MANAGER, ADMIN)
 
 class IsReader(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -0,0 +1,29 @@
+"""
+JSON renderer for the large list responses.
+
+With orjson installed (optional) the output is byte for byte what DRF's
+JSONRenderer writes for the same data: compact, UTF-8, with U+2028 and
+U+2029 escaped. Values orjson cannot encode natively go through DRF's
+encoder. Without orjson, or when an indented response is requested, DRF's
+renderer is used as is.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        plain = orjson is not None and self.compact and not self.ensure_ascii
+        if not plain or data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates and times are left to DRF's encoder, which formats them differently
+            content = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,83 @@
+"""
+Role resolution for the permission classes and serializers.
+
+A user's roles are the names of their groups. They are resolved at most once
+per request (memoized on the user object) and shared between requests through
+the cache for ROLE_CACHE_TIMEOUT seconds; group membership changes invalidate
+the cached entry immediately (see api.signals).
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+ADMIN = 'Admin'
+MANAGER = 'Manager'
+READER = 'Reader'
+
+ROLES_CLAIM = 'roles'
+USERNAME_CLAIM = 'username'
+
+
+def cache_key(user_id):
+    return f'api:roles:{user_id}'
+
+
+def get_roles(user):
+    """Return the frozenset of group names of `user` (empty for anonymous users)."""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles', None)
+    if roles is not None:
+        return roles
+
+    prefetched = getattr(user, '_prefetched_objects_cache', {}).get('groups')
+    if prefetched is not None:
+        roles = frozenset(group.name for group in prefetched)
+    else:
+        roles = cache.get(cache_key(user.pk))
+        if roles is None:
+            roles = load_roles(user.pk)
+    user._roles = roles
+    return roles
+
+
+def load_roles(user_id):
+    """Read the roles of `user_id` from the database and cache them."""
+    return store_roles(user_id, frozenset(Group.objects.filter(user__id=user_id).values_list('name', flat=True)))
+
+
+def store_roles(user_id, roles):
+    cache.set(cache_key(user_id), roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 60))
+    return roles
+
+
+_group_ids = {}
+
+
+def group_id(name):
+    """Primary key of the group `name` (created if missing), kept for the life of the process."""
+    try:
+        return _group_ids[name]
+    except KeyError:
+        _group_ids[name] = Group.objects.get_or_create(name=name)[0].pk
+        return _group_ids[name]
+
+
+def forget_group_ids():
+    """Called when a group is saved or deleted; other processes notice through the foreign key, see RegisterView."""
+    _group_ids.clear()
+
+
+def has_role(user, *names):
+    return not get_roles(user).isdisjoint(names)
+
+
+def invalidate(user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
+
+
+def add_claims(token, user):
+    """Embed the user's name and roles in a simplejwt token so clients and stateless checks can read them."""
+    token[USERNAME_CLAIM] = user.username
+    token[ROLES_CLAIM] = sorted(get_roles(user))
+    return token
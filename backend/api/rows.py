@@ -0,0 +1,157 @@
+"""
+Fast list path: rows are read with values() and turned into the same dicts
+the serializers produce, without a model instance or a serializer call per
+row.
+
+plan() inspects a serializer class once and returns the columns to select
+and a function that builds a row from a values() dict. Plain fields, foreign
+keys, dotted sources and nested serializers of those are supported. Other
+fields (SerializerMethodField, source='*', many=True) raise Unsupported, and
+the view keeps the serializer.
+
+The list views use this path unless settings.FAST_LIST_RESPONSES is off;
+details and writes always go through the serializers.
+"""
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _decimal(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+
+    def convert(value):
+        if isinstance(value, Decimal):
+            return format(value.quantize(exponent), 'f')
+        return field.to_representation(value)
+    return convert
+
+
+# Field types whose to_representation() is a plain conversion
+CONVERTERS = {
+    serializers.IntegerField: lambda field: int,
+    serializers.CharField: lambda field: str,
+    serializers.BooleanField: lambda field: bool,
+    serializers.DecimalField: _decimal,
+}
+
+
+def _converter(field):
+    for cls in type(field).__mro__:
+        if cls in CONVERTERS:
+            return CONVERTERS[cls](field)
+    return field.to_representation
+
+
+def _entries(serializer, prefix):
+    """
+    [(name, column, convert, nested entries)] for the readable fields of
+    `serializer`; `column` is the values() lookup, prefixed for nested ones.
+    """
+    entries = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        unsupported = (serializers.SerializerMethodField, serializers.ManyRelatedField, serializers.ListSerializer)
+        if field.source == '*' or isinstance(field, unsupported):
+            raise Unsupported(f'{type(serializer).__name__}.{name}')
+        column = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.BaseSerializer):
+            # Null when there is no related row
+            entries.append((name, column, None, _entries(field, column + '__')))
+        elif isinstance(field, serializers.RelatedField):
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                raise Unsupported(f'{type(serializer).__name__}.{name}')
+            entries.append((name, column, int, None))
+        else:
+            entries.append((name, column, _converter(field), None))
+    return entries
+
+
+def _columns(entries):
+    for _, column, _, nested in entries:
+        yield column
+        if nested is not None:
+            yield from _columns(nested)
+
+
+def _builder(entries):
+    fields = [
+        (name, column, convert, _builder(nested) if nested is not None else None)
+        for name, column, convert, nested in entries
+    ]
+
+    def build(row):
+        data = {}
+        for name, column, convert, nested in fields:
+            value = row[column]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = nested(row)
+            else:
+                data[name] = convert(value)
+        return data
+    return build
+
+
+@lru_cache(maxsize=None)
+def _serializer_entries(serializer_class):
+    return _entries(serializer_class(), '')
+
+
+@lru_cache(maxsize=None)
+def _plan(serializer_class, fields):
+    entries = _serializer_entries(serializer_class)
+    if fields is not None:
+        entries = [entry for entry in entries if entry[0] in fields]
+    return tuple(dict.fromkeys(_columns(entries))), _builder(entries)
+
+
+def plan(serializer_class, fields=None):
+    """
+    (columns, build) for `serializer_class`, optionally limited to the
+    top-level `fields` (as `?fields=` does). Raises Unsupported.
+    """
+    if fields is not None:
+        # Unknown names are ignored, which also bounds the cache
+        fields = frozenset(fields).intersection(entry[0] for entry in _serializer_entries(serializer_class))
+    return _plan(serializer_class, fields)
+
+
+def requested_fields(request):
+    """The `?fields=` set of a read request, as SparseFieldsetMixin applies it, or None."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    requested = request.query_params.get('fields')
+    if not requested:
+        return None
+    return frozenset(name.strip() for name in requested.split(','))
+
+
+def for_request(serializer_class, request):
+    """(columns, build) for a list request, or None when the serializer has to render it."""
+    if not settings.FAST_LIST_RESPONSES:
+        return None
+    try:
+        return plan(serializer_class, requested_fields(request))
+    except Unsupported:
+        return None
+
+
+def ordering_columns(paginator):
+    """Columns a cursor paginator reads its position from, which must be selected too."""
+    ordering = getattr(paginator, 'ordering', None) or ()
+    if isinstance(ordering, str):
+        ordering = (ordering,)
+    return tuple(name.lstrip('-') for name in ordering)
@@ -0,0 +1,97 @@
+"""
+OpenAPI schema served from a cached artifact.
+
+drf_spectacular introspects every view on each request to /api/schema/. The
+schema only changes with the code, so SchemaView renders it once per process
+and format and serves the same bytes afterwards, with a strong ETag so that
+clients revalidate with a 304.
+
+The schema can also be generated at build time:
+
+    python manage.py spectacular --format openapi-json --file openapi.json
+
+and pointed to with SCHEMA_FILE; the view then reads it instead of
+introspecting the views. The file is used for the default version and
+language; other versions and ?lang= are generated on first use. Only the
+versions in ALLOWED_VERSIONS and the languages in LANGUAGES are kept, other
+query values are generated for the request and not stored.
+
+JWTScheme documents the API's own authentication classes as the bearer
+scheme of simplejwt; drf_spectacular registers it when this module is
+imported, which the URLconf and the spectacular command both do.
+"""
+import hashlib
+import json
+import threading
+
+import yaml
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.settings import api_settings
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.views import SpectacularAPIView
+
+from .caching import etag_matches
+
+# (media type, version, lang): (content, content type, ETag, filename)
+ARTIFACTS = {}
+_lock = threading.Lock()
+
+
+class JWTScheme(SimpleJWTScheme):
+    # StatelessJWTAuthentication is a subclass
+    target_class = 'api.authentication.TimedJWTAuthentication'
+    match_subclasses = True
+
+
+def load_file(path):
+    with open(path, 'rb') as schema_file:
+        content = schema_file.read()
+    if str(path).endswith('.json'):
+        return json.loads(content)
+    return yaml.safe_load(content)
+
+
+class SchemaView(SpectacularAPIView):
+    def _get_schema_response(self, request):
+        if not self.serve_public:
+            # Filtered by the user's permissions, so not shared between requests
+            return super()._get_schema_response(request)
+        version = self.api_version or request.version or self._get_version_parameter(request)
+        lang = request.GET.get('lang') if settings.USE_I18N else None
+        if not self.is_known(version, lang):
+            return super()._get_schema_response(request)
+        key = (request.accepted_media_type, version, lang)
+        artifact = ARTIFACTS.get(key)
+        if artifact is None:
+            with _lock:
+                artifact = ARTIFACTS.get(key) or self.build(request, version, lang)
+                ARTIFACTS[key] = artifact
+        content, content_type, etag, filename = artifact
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        response['ETag'] = etag
+        return response
+
+    def is_known(self, version, lang):
+        """Whether the schema of `version` and `lang` may be stored: they come from the query string."""
+        if version not in (None, api_settings.DEFAULT_VERSION) and version not in (api_settings.ALLOWED_VERSIONS or ()):
+            return False
+        return not lang or lang in dict(settings.LANGUAGES)
+
+    def build(self, request, version, lang):
+        schema_file = getattr(settings, 'SCHEMA_FILE', None)
+        if schema_file and version is None and not lang:
+            data = load_file(schema_file)
+        else:
+            data = super()._get_schema_response(request).data
+        renderer = request.accepted_renderer
+        content = renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        return content, content_type, etag, self._get_filename(request, version)
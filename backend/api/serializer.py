@@ -1,16 +1,65 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Product, Category
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .models import Product, Category, Job
+from .metrics import timed
+from .roles import add_claims, get_roles
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedRepresentationMixin:
+    """Counts to_representation() towards the request's serialization time (see api.metrics)."""
+    def to_representation(self, instance):
+        with timed('serialization'):
+            return super().to_representation(instance)
+
+class SparseFieldsetMixin:
+    """
+    Lets read requests pick the columns they need with `?fields=id,name,price`.
+    Unknown names are ignored; nested serializers always render in full.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        wanted = {name.strip() for name in requested.split(',')}
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
+
+class EagerLoadingMixin:
+    """
+    Serializers list the relations they render in Meta.select_related and
+    Meta.prefetch_related; views apply them with setup_eager_loading() so a
+    list costs a constant number of queries whatever its length.
+    """
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        meta = getattr(cls, 'Meta', None)
+        select = getattr(meta, 'select_related', ())
+        prefetch = getattr(meta, 'prefetch_related', ())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+class UserSerializer(TimedRepresentationMixin, EagerLoadingMixin, serializers.ModelSerializer):
     roles = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'roles']
+        prefetch_related = ('groups',)
 
     def get_roles(self, obj):
-        return [g.name for g in obj.groups.all()]
+        return sorted(get_roles(obj))
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
 
 class RegisterSerializer(serializers.Serializer):
     username = serializers.CharField(required=True)
@@ -25,14 +74,75 @@ class UpdateProfileSerializer(serializers.Serializer):
     current_password = serializers.CharField(required=False, write_only=True)
     new_password = serializers.CharField(required=False, write_only=True)
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedRepresentationMixin, EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class CategoryStatsSerializer(CategorySerializer):
+    """Category with its product figures, read from the counters in api.aggregates (no aggregate query)."""
+    product_count = serializers.IntegerField(source='totals.product_count', read_only=True)
+    stock_units = serializers.IntegerField(source='totals.stock_units', read_only=True)
+    stock_value = serializers.DecimalField(source='totals.stock_value', max_digits=20, decimal_places=2, read_only=True)
+
+    class Meta(CategorySerializer.Meta):
+        select_related = ('totals',)
+
+class PreloadedCategoryField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks categories up in context['categories'] ({pk: Category}) when the view
+    preloaded them, so validating a batch of products does not query per row.
+    """
+    def to_internal_value(self, data):
+        categories = self.context.get('categories')
+        if categories is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return categories[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class ProductSerializer(TimedRepresentationMixin, EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     category_details = CategorySerializer(source='category', read_only=True)
+    serializer_related_field = PreloadedCategoryField
     
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        select_related = ('category',)
+
+class ProductRankingSerializer(ProductSerializer):
+    """Leaderboard entry; `revenue` (price * sold_quantity) is annotated by api.alerts.leaderboard."""
+    revenue = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
+
+class StockLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class StockQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=1)
+
+class StockOrderSerializer(serializers.Serializer):
+    lines = StockLineSerializer(many=True, allow_empty=False)
+
+class JobSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'progress', 'total', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if isinstance(data['result'], dict) and 'file' in data['result']:
+            # Served by the download action, not by path
+            data['result'] = {key: value for key, value in data['result'].items() if key != 'file'}
+        return data
+
+class JobRequestSerializer(serializers.Serializer):
+    """Jobs that can be queued directly; imports and bulk writes are queued by their endpoints with ?background=true."""
+    kind = serializers.ChoiceField(choices=['export', 'rebuild_stats'])
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
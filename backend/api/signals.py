@@ -0,0 +1,107 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import aggregates, alerts, authentication, caching, changes, roles, tracking
+from .models import Category, CategoryTotals, ChangeEvent, Product
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    alerts.assign_levels([instance])
+    if tracking.is_suppressed():
+        return
+    instance._snapshot_before_save = aggregates.loaded_snapshot(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw or tracking.is_suppressed():
+        return
+    before = getattr(instance, '_snapshot_before_save', None)
+    tracking.product_changes([(before, aggregates.snapshot(instance))])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product(sender, instance, **kwargs):
+    # Runs in the transaction of the delete, see aggregates.loaded_snapshot()
+    if tracking.is_suppressed():
+        return
+    instance._snapshot_before_delete = aggregates.loaded_snapshot(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    if tracking.is_suppressed():
+        return
+    before = getattr(instance, '_snapshot_before_delete', None) or aggregates.snapshot(instance)
+    tracking.product_changes([(before, None)])
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_threshold(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._threshold_before_save = (
+        Category.objects.filter(pk=instance.pk).values_list('low_stock_threshold', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CategoryTotals.objects.get_or_create(category=instance)
+    if not created and not raw and getattr(instance, '_threshold_before_save', None) != instance.low_stock_threshold:
+        # Its products without a threshold of their own move to the new level
+        if alerts.refresh_category(instance.pk, instance.low_stock_threshold):
+            aggregates.refresh_low_stock_count()
+            caching.bump(Product)
+    if not raw:
+        # After the totals, like product writes: the change counter is always locked last
+        changes.record_category(instance, ChangeEvent.CREATED if created else ChangeEvent.UPDATED)
+    caching.bump(Category)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Its products are about to be moved to "no category" by SET_NULL
+    aggregates.move_to_uncategorized(instance.pk)
+    instance._levels_changed = alerts.refresh_category(instance.pk, None)
+
+
+@receiver(post_delete, sender=Category)
+def category_removed(sender, instance, **kwargs):
+    if getattr(instance, '_levels_changed', 0):
+        aggregates.refresh_low_stock_count()
+    changes.record_category(instance, ChangeEvent.DELETED)
+    caching.bump(Category, Product)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            instance.__dict__.pop('_roles', None)
+            roles.invalidate([instance.pk])
+    elif action == 'pre_clear':
+        roles.invalidate(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        roles.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    roles.forget_group_ids()
+    if instance.pk:
+        roles.invalidate(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Recording a login changes nothing the token checks read
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        authentication.invalidate_state([instance.pk])
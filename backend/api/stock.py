@@ -0,0 +1,84 @@
+"""
+Atomic stock movements: sales and restocks.
+
+Each order line becomes a single UPDATE with F() expressions, so concurrent
+tills never overwrite each other's changes the way a read-modify-write PUT
+does. A sale only touches the row while `quantity >= n`; if any line of an
+order cannot be served, the whole order is rolled back. Lines are applied in
+product id order so two orders on the same products lock rows in the same
+order. The new levels are read back with one query and reported to
+api.tracking as (before, after) snapshots.
+"""
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import F
+
+from . import aggregates, tracking
+from .models import Product
+
+SALE = 'sale'
+RESTOCK = 'restock'
+
+
+class StockError(Exception):
+    """Raised when an order cannot be applied; `lines` maps product ids to the reason."""
+    def __init__(self, lines, missing=()):
+        super().__init__(lines)
+        self.lines = lines
+        self.missing = set(missing)
+
+
+def merge_lines(lines):
+    """(product_id, quantity) pairs -> {product_id: total quantity}, in product id order."""
+    merged = {}
+    for product_id, quantity in lines:
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return OrderedDict(sorted(merged.items()))
+
+
+def apply(kind, lines):
+    """
+    Sell or restock `lines` ((product_id, quantity) pairs) in one transaction.
+    Returns the new {'id', 'quantity', 'sold_quantity'} of every product touched.
+    """
+    lines = merge_lines(lines)
+    with transaction.atomic():
+        failed = []
+        for product_id, quantity in lines.items():
+            products = Product.objects.filter(pk=product_id)
+            if kind == SALE:
+                updated = products.filter(quantity__gte=quantity).update(
+                    quantity=F('quantity') - quantity, sold_quantity=F('sold_quantity') + quantity,
+                )
+            else:
+                updated = products.update(quantity=F('quantity') + quantity)
+            if not updated:
+                failed.append(product_id)
+
+        if failed:
+            available = dict(Product.objects.filter(pk__in=failed).values_list('pk', 'quantity'))
+            raise StockError({
+                product_id: (
+                    f'Only {available[product_id]} in stock, {lines[product_id]} requested.'
+                    if product_id in available else 'Product not found.'
+                )
+                for product_id in failed
+            }, missing=[product_id for product_id in failed if product_id not in available])
+
+        rows = Product.objects.filter(pk__in=lines).order_by('pk').values_list(*aggregates.Snapshot._fields)
+        changes = []
+        for row in rows:
+            after = aggregates.Snapshot(*row)
+            quantity = lines[after.id]
+            if kind == SALE:
+                before = after._replace(quantity=after.quantity + quantity, sold_quantity=after.sold_quantity - quantity)
+            else:
+                before = after._replace(quantity=after.quantity - quantity)
+            changes.append((before, after))
+        tracking.product_changes(changes)
+
+    return [
+        {'id': after.id, 'quantity': after.quantity, 'sold_quantity': after.sold_quantity}
+        for _, after in changes
+    ]
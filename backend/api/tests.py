@@ -1,3 +1,1524 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.admin import helpers
+from django.contrib.auth.hashers import make_password
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from drf_spectacular.drainage import GENERATOR_STATS
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import aggregates, alerts, async_views, authentication, benchmarks, changes, compression, database, export, history, jobs, metrics, pagination, roles, rows, schema, stock, views
+from .models import Category, CategoryTotals, ChangeCounter, ChangeEvent, Job, Product, StockMovement, StockRollup, StockTotals
+from .permissions import IsAdmin, IsManager
+from .roles import add_claims, get_roles
+
+# Query budgets per request, including what JWT authentication reads on a cache miss
+PRODUCT_LIST_QUERY_BUDGET = 3
+CATEGORY_LIST_QUERY_BUDGET = 3
+CURRENT_USER_QUERY_BUDGET = 3
+
+
+class QueryBudgetMixin:
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(len(context), budget, f'{len(context)} queries executed, budget is {budget}:\n{queries}')
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Lists must cost a constant number of queries, whatever the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.user.groups.add(Group.objects.create(name='Reader'))
+
+    def setUp(self):
+        cache.clear()
+        # What JWT authentication reads is cached after the first request
+        authentication.get_state(self.user.pk)
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def create_products(self, count):
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(5)]
+        for i in range(count):
+            Product.objects.create(
+                name=f'Product {i}', price=Decimal('9.99'), quantity=i, category=categories[i % len(categories)],
+            )
+
+    def test_product_list_query_count_is_constant(self):
+        self.create_products(2)
+        with CaptureQueriesContext(connection) as small_queries:
+            small = self.client.get('/products/api/v1/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_products(60)
+        with CaptureQueriesContext(connection) as large_queries:
+            large = self.client.get('/products/api/v1/products/')
+        self.assertEqual(len(small.data['results']), 2)
+        self.assertEqual(len(large.data['results']), 62)
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_product_list_within_budget(self):
+        self.create_products(30)
+        with self.assertMaxQueries(PRODUCT_LIST_QUERY_BUDGET):
+            response = self.client.get('/products/api/v1/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('name', response.data['results'][0]['category_details'])
+
+    def test_category_list_within_budget(self):
+        self.create_products(10)
+        with self.assertMaxQueries(CATEGORY_LIST_QUERY_BUDGET):
+            response = self.client.get('/products/api/v1/categories/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_current_user_within_budget(self):
+        with self.assertMaxQueries(CURRENT_USER_QUERY_BUDGET):
+            response = self.client.get('/products/api/v1/auth/me/')
+        self.assertEqual(response.data['roles'], ['Reader'])
+
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.admin_group = Group.objects.create(name='Admin')
+        cls.user = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.user.groups.add(cls.manager_group)
+
+    def setUp(self):
+        cache.clear()
+
+    def post_request(self, user):
+        request = APIRequestFactory().post('/products/api/v1/products/')
+        request.user = user
+        request.method = 'POST'
+        return request
+
+    def test_permission_checks_are_free_once_roles_are_cached(self):
+        get_roles(User.objects.get(pk=self.user.pk))
+        user = User.objects.get(pk=self.user.pk)
+        request = self.post_request(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsManager().has_permission(request, None))
+            self.assertFalse(IsAdmin().has_permission(request, None))
+
+    def test_roles_are_resolved_once_per_request(self):
+        request = self.post_request(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(1):
+            IsManager().has_permission(request, None)
+            IsAdmin().has_permission(request, None)
+
+    def test_membership_change_invalidates_cached_roles(self):
+        get_roles(User.objects.get(pk=self.user.pk))
+        self.user.groups.add(self.admin_group)
+        self.assertEqual(get_roles(User.objects.get(pk=self.user.pk)), {'Manager', 'Admin'})
+        self.admin_group.user_set.clear()
+        self.assertEqual(get_roles(User.objects.get(pk=self.user.pk)), {'Manager'})
+
+    def test_login_token_carries_roles(self):
+        response = APIClient().post('/products/api/v1/auth/login/', {'username': 'manager@example.com', 'password': 'secret'})
+        self.assertEqual(AccessToken(response.data['access'])['roles'], ['Manager'])
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.category = Category.objects.create(name='Tools')
+        cls.product = Product.objects.create(name='Hammer', price=Decimal('12.00'), quantity=4, category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_etag_and_conditional_get(self):
+        first = self.client.get('/products/api/v1/products/')
+        self.assertIn('ETag', first)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/products/api/v1/products/')
+        self.assertEqual(cached.content, first.content)
+        not_modified = self.client.get('/products/api/v1/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_product_write_invalidates_lists_and_stats(self):
+        products = self.client.get('/products/api/v1/products/')
+        stats = self.client.get('/products/api/v1/stats/')
+        self.product.quantity = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertNotEqual(self.client.get('/products/api/v1/products/')['ETag'], products['ETag'])
+        fresh_stats = self.client.get('/products/api/v1/stats/')
+        self.assertNotEqual(fresh_stats['ETag'], stats['ETag'])
+        self.assertEqual(fresh_stats.json()['metrics']['out_of_stock_count'], 1)
+
+    def test_versions_move_when_the_write_commits(self):
+        etag = self.client.get('/products/api/v1/products/')['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.save()
+            self.assertEqual(self.client.get('/products/api/v1/products/')['ETag'], etag)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.client.get('/products/api/v1/products/')['ETag'], etag)
+
+    def test_category_rename_invalidates_nested_product_data(self):
+        self.client.get('/products/api/v1/products/')
+        self.category.name = 'Hand tools'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        response = self.client.get('/products/api/v1/products/')
+        self.assertEqual(response.json()['results'][0]['category_details']['name'], 'Hand tools')
+
+
+class ProductFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.fruit = Category.objects.create(name='Fruit')
+        Product.objects.create(name='Red apple', price=Decimal('2.50'), quantity=10, category=cls.fruit)
+        Product.objects.create(name='Green pear', price=Decimal('1.00'), quantity=0, category=cls.fruit)
+        cls.dessert = Product.objects.create(name='Crème brûlée', price=Decimal('3.00'), quantity=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, **params):
+        response = self.client.get('/products/api/v1/products/', params)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_field_filters(self):
+        self.assertEqual(self.names(category=self.fruit.pk, min_price='2'), ['Red apple'])
+        self.assertEqual(self.names(category='none'), ['Crème brûlée'])
+        self.assertEqual(self.names(low_stock='true'), ['Green pear', 'Crème brûlée'])
+        self.assertEqual(self.names(out_of_stock='1'), ['Green pear'])
+        self.assertEqual(self.names(min_quantity=1, max_quantity=3), ['Crème brûlée'])
+        self.assertEqual(self.names(name='GREEN'), ['Green pear'])
+
+    def test_invalid_value_is_rejected(self):
+        response = self.client.get('/products/api/v1/products/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_price', response.json())
+
+    def test_search_matches_word_prefixes_and_follows_writes(self):
+        self.assertEqual(self.names(search='app'), ['Red apple'])
+        self.assertEqual(self.names(search='gr pe'), ['Green pear'])
+        self.assertEqual(self.names(search='creme'), ['Crème brûlée'])
+        self.dessert.name = 'Lemon tart'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dessert.save()
+        self.assertEqual(self.names(search='tar'), ['Lemon tart'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dessert.delete()
+        self.assertEqual(self.names(search='tar'), [])
+
+
+class StockMovementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='till', email='till@example.com', password='secret')
+        cls.user.groups.add(Group.objects.create(name='Manager'))
+        cls.apple = Product.objects.create(name='Apple', price=Decimal('2.00'), quantity=5)
+        cls.pear = Product.objects.create(name='Pear', price=Decimal('3.00'), quantity=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sale_returns_new_levels(self):
+        response = self.client.post(f'/products/api/v1/products/{self.apple.pk}/sale/', {'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'], [{'id': self.apple.pk, 'quantity': 3, 'sold_quantity': 2}])
+        self.assertEqual(aggregates.get_totals().stock_units, 4)
+
+    def test_order_is_all_or_nothing(self):
+        lines = [{'product': self.apple.pk, 'quantity': 1}, {'product': self.pear.pk, 'quantity': 2}]
+        response = self.client.post('/products/api/v1/products/sale/', {'lines': lines}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([error['product'] for error in response.json()['errors']], [self.pear.pk])
+        self.apple.refresh_from_db()
+        self.assertEqual(self.apple.quantity, 5)
+
+    def test_restock_merges_lines(self):
+        lines = [{'product': self.pear.pk, 'quantity': 2}, {'product': self.pear.pk, 'quantity': 3}]
+        response = self.client.post('/products/api/v1/products/restock/', {'lines': lines}, format='json')
+        self.assertEqual(response.json()['products'], [{'id': self.pear.pk, 'quantity': 6, 'sold_quantity': 0}])
+        self.assertEqual(aggregates.verify(), [])
+
+
+class ConcurrentSaleTests(TransactionTestCase):
+    """Many threads selling the same product must neither lose updates nor oversell."""
+    threads = 6
+    attempts = 15
+
+    def sell(self, product_id, sold):
+        try:
+            for _ in range(self.attempts):
+                while True:
+                    try:
+                        stock.apply(stock.SALE, [(product_id, 1)])
+                        sold.append(1)
+                    except stock.StockError:
+                        pass
+                    except OperationalError:
+                        # The in-memory test database uses shared-cache table locks, which
+                        # fail at once instead of waiting like a file database does
+                        time.sleep(0.001)
+                        continue
+                    break
+        finally:
+            connections.close_all()
+
+    def run_sales(self, quantity):
+        product = Product.objects.create(name='Contended', price=Decimal('1.00'), quantity=quantity)
+        sold = []
+        workers = [threading.Thread(target=self.sell, args=(product.pk, sold)) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        product.refresh_from_db()
+        return product, len(sold)
+
+    def test_no_lost_updates(self):
+        product, sold = self.run_sales(500)
+        self.assertEqual(sold, self.threads * self.attempts)
+        self.assertEqual((product.quantity, product.sold_quantity), (500 - sold, sold))
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_no_overselling(self):
+        product, sold = self.run_sales(30)
+        self.assertEqual(sold, 30)
+        self.assertEqual((product.quantity, product.sold_quantity), (0, 30))
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_pragmas_are_applied_to_new_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'synchronous': 'normal'}):
+            new_connection = connections.create_connection('default')
+            try:
+                applied = database.current_pragmas(new_connection)
+            finally:
+                new_connection.close()
+        self.assertEqual(applied['busy_timeout'], 1234)
+        self.assertEqual(applied['synchronous'], 1)  # NORMAL
+
+
+@override_settings(RESPONSE_CACHE={'TIMEOUT': 0})
+class AsyncReadViewTests(TestCase):
+    """The async read views must answer exactly like the DRF views they shadow (rendered, not cached)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.user.groups.add(Group.objects.create(name='Reader'))
+        category = Category.objects.create(name='Tools')
+        cls.products = [
+            Product.objects.create(name=f'Tool {i}', price=Decimal('5.00'), quantity=i, sold_quantity=i, category=category)
+            for i in range(3)
+        ]
+        cls.token = str(RefreshToken.for_user(cls.user).access_token)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    def sync_get(self, path, params=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return client.get(path, params)
+
+    async def assertSameResponse(self, view, path, params=None, **kwargs):
+        expected = await sync_to_async(self.sync_get)(path, params)
+        response = await view(self.factory.get(path, params, headers={'Authorization': f'Bearer {self.token}'}), **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.get('ETag'), expected.get('ETag'))
+        return response
+
+    async def test_product_list_and_cursor_links(self):
+        view = async_views.ProductListView.as_view()
+        response = await self.assertSameResponse(view, '/products/api/v1/products/', {'page_size': 2})
+        next_link = json.loads(response.content)['next']
+        await self.assertSameResponse(view, '/products/api/v1/products/', {'page_size': 2, 'cursor': next_link.split('cursor=')[1].split('&')[0]})
+        await self.assertSameResponse(view, '/products/api/v1/products/', {'min_quantity': 1, 'fields': 'id,name'})
+        await self.assertSameResponse(view, '/products/api/v1/products/', {'min_price': 'x'})
+
+    async def test_detail_categories_stats_and_me(self):
+        pk = self.products[0].pk
+        await self.assertSameResponse(async_views.ProductDetailView.as_view(), f'/products/api/v1/products/{pk}/', pk=str(pk))
+        await self.assertSameResponse(async_views.ProductDetailView.as_view(), '/products/api/v1/products/999/', pk='999')
+        await self.assertSameResponse(async_views.CategoryListView.as_view(), '/products/api/v1/categories/')
+        await self.assertSameResponse(async_views.CategoryListView.as_view(), '/products/api/v1/categories/', {'ordering': '-stock_value'})
+        await self.assertSameResponse(async_views.StatsReadView.as_view(), '/products/api/v1/stats/')
+        await self.assertSameResponse(async_views.CurrentUserReadView.as_view(), '/products/api/v1/auth/me/')
+
+    async def test_requires_authentication(self):
+        response = await async_views.StatsReadView.as_view()(AsyncRequestFactory().get('/products/api/v1/stats/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='secret')
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+        cls.reader = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        Product.objects.create(name='Hammer', price=Decimal('12.00'), quantity=4)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        authentication.get_state(self.admin.pk)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    def test_routes_are_measured_and_exposed(self):
+        self.client.get('/products/api/v1/products/')
+        response = self.client.get('/products/api/v1/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('api_request_duration_seconds_count{route="product-list",method="GET",status="200"} 1', body)
+        # The product page only: authentication was served from the cache
+        self.assertIn('api_request_queries_bucket{route="product-list",method="GET",le="1"} 1', body)
+        serialization = re.search(r'^api_request_serialization_seconds_sum\{route="product-list",method="GET"\} (\S+)$', body, re.M)
+        self.assertGreater(float(serialization[1]), 0)
+        self.assertRegex(body, r'api_request_auth_seconds_sum\{route="product-list",method="GET"\} 0\.0*[1-9]')
+
+    def test_metrics_require_admin(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual(client.get('/products/api/v1/metrics/').status_code, 403)
+
+    @override_settings(REQUEST_METRICS={'SLOW_REQUEST_MS': 0})
+    def test_slow_requests_are_logged_with_queries(self):
+        with self.assertLogs('api.slow_requests', 'WARNING') as logs:
+            self.client.get('/products/api/v1/products/')
+        self.assertIn('product-list', logs.output[0])
+        self.assertIn('api_product', logs.output[0])
+
+    @override_settings(REQUEST_METRICS={'SLOW_REQUEST_MS': 0, 'SLOW_LOG_MAX_QUERIES': 0})
+    def test_only_the_first_queries_are_kept(self):
+        with self.assertLogs('api.slow_requests', 'WARNING') as logs:
+            self.client.get('/products/api/v1/products/')
+        self.assertIn(', 1 queries in', logs.output[0])
+        self.assertNotIn('api_product', logs.output[0])
+
+
+class LoginTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+
+    def login(self, password='secret'):
+        return APIClient().post('/products/api/v1/auth/login/', {'username': 'reader@example.com', 'password': password})
+
+    def test_login_looks_the_user_up_once(self):
+        with self.assertMaxQueries(4) as context:
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        lookups = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT') and 'FROM "auth_user"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_wrong_password_is_rejected(self):
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+
+    def test_non_empty_emails_are_unique(self):
+        User.objects.create_user(username='first', email='')
+        User.objects.create_user(username='second', email='')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='copy', email='reader@example.com')
+
+    def test_hash_iterations_follow_the_setting(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            self.assertTrue(make_password('secret').startswith('pbkdf2_sha256$1000$'))
+            # Hashes made with another work factor are upgraded at the next login
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+class StatelessAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.category = Category.objects.create(name='Tools')
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {add_claims(RefreshToken.for_user(user), user).access_token}')
+        return client
+
+    def test_authentication_reads_the_database_once_per_cache_period(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/products/api/v1/categories/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/products/api/v1/categories/').status_code, 200)
+
+    def test_user_row_is_loaded_only_when_needed(self):
+        self.client.get('/products/api/v1/categories/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/api/v1/auth/me/')
+        self.assertEqual(response.data['email'], 'reader@example.com')
+
+    def test_role_changes_apply_to_issued_tokens(self):
+        payload = {'name': 'Saw', 'price': '10.00', 'quantity': 1, 'category': self.category.pk}
+        self.assertEqual(self.client.post('/products/api/v1/products/', payload).status_code, 403)
+        self.user.groups.add(Group.objects.create(name='Manager'))
+        self.assertEqual(self.client.post('/products/api/v1/products/', payload).status_code, 201)
+
+    def test_password_change_and_deactivation_revoke_tokens(self):
+        self.assertEqual(self.client.get('/products/api/v1/categories/').status_code, 200)
+        self.user.set_password('changed')
+        self.user.save()
+        response = self.client.get('/products/api/v1/categories/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'password_changed')
+
+        client = self.client_for(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get('/products/api/v1/categories/').status_code, 401)
+
+    def test_profile_password_change_returns_new_tokens(self):
+        response = self.client.put('/products/api/v1/auth/profile/', {'current_password': 'secret', 'new_password': 'changed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/products/api/v1/categories/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/products/api/v1/categories/').status_code, 200)
+
+
+class BenchmarkBaselineTests(TestCase):
+    def test_regressions_follow_the_direction_of_each_metric(self):
+        baseline = {'endpoints': [{'case': 'stats', 'requests': 50, 'rps': 100, 'p99_ms': 10.0, 'queries_per_request': 2}]}
+        results = {'endpoints': [{'case': 'stats', 'requests': 50, 'rps': 70, 'p99_ms': 11.0, 'queries_per_request': 4}]}
+        rows = {row['metric']: row for row in benchmarks.compare(baseline, results, threshold=20)}
+        self.assertEqual(set(rows), {'rps', 'p99_ms', 'queries_per_request'})
+        self.assertTrue(rows['rps']['regression'])
+        self.assertFalse(rows['p99_ms']['regression'])
+        self.assertTrue(rows['queries_per_request']['regression'])
+
+    def test_seeded_users_cover_every_role(self):
+        users = benchmarks.seed_users(2, password='secret')
+        self.assertEqual({role: len(group) for role, group in users.items()}, {'Admin': 2, 'Manager': 2, 'Reader': 2, None: 2})
+        self.assertEqual(get_roles(users['Manager'][1]), {'Manager'})
+        self.assertTrue(users[None][0].check_password('secret'))
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='root', email='root@example.com', password='secret')
+        cls.tools = Category.objects.create(name='Tools')
+        cls.garden = Category.objects.create(name='Garden')
+        for i in range(30):
+            Product.objects.create(name=f'Hammer {i}', price=Decimal('5.00'), quantity=i, category=cls.tools if i % 2 else cls.garden)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_unfiltered_product_list_is_not_counted(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/api/product/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 30)
+        self.assertFalse([query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql'] and '"api_product"' in query['sql']])
+        # Categories come with the page, not one query per row
+        self.assertFalse([query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT') and 'FROM "api_category"' in query['sql']])
+
+    def test_filtered_and_searched_lists_are_counted_exactly(self):
+        response = self.client.get('/admin/api/product/', {'category__id__exact': self.tools.pk})
+        self.assertEqual(response.context['cl'].result_count, 15)
+        response = self.client.get('/admin/api/product/', {'q': 'hammer'})
+        self.assertEqual(response.context['cl'].result_count, 30)
+
+    def test_user_list_uses_an_estimated_count(self):
+        users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+        users[0].delete()
+        response = self.client.get('/admin/auth/user/')
+        self.assertEqual(response.status_code, 200)
+        # Small tables are counted, whatever ids were deleted
+        self.assertEqual(response.context['cl'].result_count, 3)
+        with mock.patch('api.admin.EXACT_COUNT_LIMIT', 2):
+            response = self.client.get('/admin/auth/user/')
+        self.assertEqual(response.context['cl'].result_count, users[-1].pk)
+
+    def test_changed_list_rows_are_written_in_one_update(self):
+        products = list(Product.objects.order_by('-id')[:3])
+        data = {'_save': 'Save', 'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 3}
+        for index, product in enumerate(products):
+            data.update({
+                f'form-{index}-id': product.pk, f'form-{index}-price': product.price,
+                f'form-{index}-quantity': product.quantity, f'form-{index}-sold_quantity': product.sold_quantity,
+            })
+        data['form-0-price'] = '9.00'
+        data['form-1-quantity'] = 100
+        data['form-1-sold_quantity'] = 2
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/admin/api/product/', data)
+        self.assertEqual(response.status_code, 302)
+        # One executemany() for both changed rows; the unchanged one is not written
+        updates = [query['sql'] for query in context.captured_queries if 'UPDATE "api_product"' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith('2 times: '))
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[product.pk for product in products]).order_by('-id').values_list('price', 'quantity', 'sold_quantity')),
+            [(Decimal('9.00'), products[0].quantity, 0), (Decimal('5.00'), 100, 2), (Decimal('5.00'), products[2].quantity, 0)],
+        )
+        self.assertEqual(aggregates.verify(), [])
+        self.assertEqual(StockMovement.objects.filter(product=products[1]).count(), 2)
+
+    def test_bulk_edit_writes_the_selection_in_one_update(self):
+        ids = list(Product.objects.filter(category=self.garden).values_list('pk', flat=True))
+        response = self.client.post('/admin/api/product/', {'action': 'bulk_edit', helpers.ACTION_CHECKBOX_NAME: ids})
+        self.assertContains(response, 'Set these values on the 15 selected products')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/admin/api/product/', {
+                'action': 'bulk_edit', helpers.ACTION_CHECKBOX_NAME: ids, 'apply': '1',
+                'price': '7.50', 'category': self.tools.pk,
+            })
+        self.assertEqual(response.status_code, 302)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "api_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Product.objects.filter(category=self.tools, price=Decimal('7.50')).count(), 15)
+        aggregates.verify()
+        self.assertEqual(aggregates.get_totals().product_count, 30)
+
+
+class BackgroundJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='secret')
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+        cls.category = Category.objects.create(name='Tools')
+
+    def setUp(self):
+        cache.clear()
+        files_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(files_dir.cleanup)
+        settings_override = override_settings(JOBS={'FILES_DIR': files_dir.name, 'PROGRESS_INTERVAL': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = benchmarks.token_client(self.manager)
+
+    def run_queue(self):
+        while (job := jobs.claim('test')) is not None:
+            jobs.run(job)
+
+    def poll(self, job_id, client=None):
+        response = (client or self.client).get(f'/products/api/v1/jobs/{job_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_import_runs_in_the_background(self):
+        upload = SimpleUploadedFile('products.csv', b'name,price,quantity,category\nSaw,10.00,3,Tools\nDrill,50.00,1,Garden\n')
+        response = self.client.post('/products/api/v1/products/import/?background=true', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        self.assertTrue(response['Location'].endswith(f'/products/api/v1/jobs/{response.data["id"]}/'))
+        self.assertFalse(Product.objects.exists())
+
+        self.run_queue()
+        job = self.poll(response.data['id'])
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual((job['progress'], job['total']), (2, 2))
+        self.assertEqual(job['result']['created'], 2)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertFalse(list((Path(jobs.get_setting('FILES_DIR')) / 'uploads').iterdir()))
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_export_job_file_can_be_downloaded(self):
+        Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=3, category=self.category)
+        response = self.client.post('/products/api/v1/jobs/', {'kind': 'export', 'format': 'csv'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        self.assertEqual(self.client.get(f'/products/api/v1/jobs/{job_id}/download/').status_code, 409)
+
+        self.run_queue()
+        job = self.poll(job_id)
+        self.assertEqual(job['result']['rows'], 1)
+        self.assertNotIn('file', job['result'])
+        response = self.client.get(f'/products/api/v1/jobs/{job_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['id,name,price,quantity,sold_quantity,category_id,category_name', f'{Product.objects.get().pk},Saw,10.00,3,0,{self.category.pk},Tools'])
+
+    def test_bulk_write_runs_in_the_background(self):
+        items = [{'name': f'Nail {i}', 'price': '0.10', 'quantity': 100, 'category': self.category.pk} for i in range(3)]
+        response = self.client.post('/products/api/v1/products/bulk/?background=true', items, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.run_queue()
+        job = self.poll(response.data['id'])
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertFalse(job['result']['has_errors'])
+        self.assertEqual(Product.objects.filter(category=self.category).count(), 3)
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_failures_are_recorded_and_jobs_run_once(self):
+        job = jobs.enqueue(jobs.EXPORT, {'format': 'xml'}, user_id=self.manager.pk)
+        claimed = jobs.claim('first')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(jobs.claim('second'))
+        with self.assertLogs('api.jobs', 'ERROR'):
+            jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('Unknown export format', job.error)
+
+    def test_stale_jobs_are_failed(self):
+        job = jobs.enqueue(jobs.REBUILD_STATS)
+        jobs.claim('gone')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.fail_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_jobs_are_private_and_rebuilds_are_for_admins(self):
+        self.assertEqual(self.client.post('/products/api/v1/jobs/', {'kind': 'rebuild_stats'}).status_code, 403)
+        admin_client = benchmarks.token_client(self.admin)
+        response = admin_client.post('/products/api/v1/jobs/', {'kind': 'rebuild_stats'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(f'/products/api/v1/jobs/{response.data["id"]}/').status_code, 404)
+        self.assertEqual(self.client.get('/products/api/v1/jobs/').data['results'], [])
+
+        self.run_queue()
+        job = self.poll(response.data['id'], admin_client)
+        self.assertEqual((job['status'], job['result']), (Job.SUCCEEDED, {'problems': []}))
+
+
+@override_settings(CHANGE_FEED={'POLL_INTERVAL': 0.01, 'STREAM_MAX_SECONDS': 2})
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.category = Category.objects.create(name='Tools')
+        cls.token = str(add_claims(RefreshToken.for_user(cls.manager), cls.manager).access_token)
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.manager)
+
+    def poll(self, since=None):
+        response = self.client.get('/products/api/v1/changes/', {} if since is None else {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_writes_are_published_in_order(self):
+        since = self.poll()['last']
+        response = self.client.post('/products/api/v1/products/', {'name': 'Saw', 'price': '10.00', 'quantity': 5, 'category': self.category.pk})
+        product_id = response.data['id']
+        self.client.post(f'/products/api/v1/products/{product_id}/sale/', {'quantity': 2})
+        self.client.patch('/products/api/v1/products/bulk/', [{'id': product_id, 'name': 'Big saw'}], format='json')
+        self.client.delete(f'/products/api/v1/products/{product_id}/')
+        self.client.post('/products/api/v1/categories/', {'name': 'Garden'})
+
+        feed = self.poll(since)
+        events = [(event['model'], event['action'], event['data'] and event['data'].get('quantity_delta')) for event in feed['events']]
+        self.assertEqual(events, [
+            ('product', 'created', 5), ('product', 'updated', -2), ('product', 'updated', 0),
+            ('product', 'deleted', -3), ('category', 'created', None),
+        ])
+        self.assertEqual(feed['events'][1]['data']['sold_delta'], 2)
+        self.assertEqual(feed['events'][2]['data']['name'], 'Big saw')
+        self.assertEqual(feed['last'], feed['events'][-1]['seq'])
+        self.assertEqual(self.poll(feed['last'])['events'], [])
+        # Every event writer went through the counter row
+        self.assertEqual(ChangeCounter.objects.get().events, ChangeEvent.objects.count())
+
+    def test_resuming_before_the_retained_events_asks_for_a_reload(self):
+        Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=5)
+        since = self.poll()['last']
+        Product.objects.create(name='Drill', price=Decimal('50.00'), quantity=1)
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(changes.purge(), 2)
+        self.assertEqual(self.poll(since - 1)['reset'], True)
+        self.assertEqual(self.poll(since)['reset'], False)
+        self.assertEqual(self.poll(since + 100)['reset'], True)
+
+    async def read_stream(self, since, until):
+        events = changes.stream(since)
+        chunks = []
+        try:
+            async for chunk in events:
+                chunks.append(chunk)
+                if until(chunks):
+                    break
+        finally:
+            await events.aclose()
+        return ''.join(chunks)
+
+    async def test_stream_sends_changes_and_resumes_from_the_last_id(self):
+        since = await changes.alatest_seq()
+
+        async def write():
+            await asyncio.sleep(0.05)
+            await sync_to_async(Product.objects.create)(name='Saw', price=Decimal('10.00'), quantity=5)
+
+        writer = asyncio.ensure_future(write())
+        body = await self.read_stream(None, lambda chunks: '"action":"created"' in chunks[-1])
+        await writer
+        self.assertIn('event: ready', body)
+        self.assertIn(f'"last":{since}', body)
+        self.assertIn(f'id: {since + 1}', body)
+
+        # Reconnecting from the last id replays what followed it
+        await sync_to_async(Product.objects.create)(name='Drill', price=Decimal('50.00'), quantity=1)
+        body = await self.read_stream(since + 1, lambda chunks: '"name":"Drill"' in chunks[-1])
+        self.assertNotIn('"name":"Saw"', body)
+        self.assertEqual(changes.FEED.subscribers, 0)
+
+    async def test_stream_view_authentication(self):
+        factory = AsyncRequestFactory()
+        view = async_views.ChangeStreamView.as_view()
+        response = await view(factory.get('/products/api/v1/changes/stream/', {'access_token': self.token}))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        response = await view(factory.get('/products/api/v1/changes/stream/', headers={'Authorization': f'Bearer {self.token}'}))
+        self.assertEqual(response.status_code, 200)
+        response = await view(factory.get('/products/api/v1/changes/stream/'))
+        self.assertEqual(response.status_code, 401)
+        response = await sync_to_async(self.client.get)('/products/api/v1/changes/stream/')
+        self.assertEqual(response.status_code, 501)
+
+
+class RegistrationTests(QueryBudgetMixin, TestCase):
+    url = '/products/api/v1/auth/register/'
+
+    def setUp(self):
+        cache.clear()
+        roles.forget_group_ids()
+        self.client = APIClient()
+
+    def register(self, username, email):
+        return self.client.post(self.url, {'username': username, 'email': email, 'password': 'secret'})
+
+    def test_registration_inserts_the_user_and_its_group_only(self):
+        self.assertEqual(self.register('first', 'first@example.com').status_code, 201)
+        # Savepoint, user, membership, release: no existence checks, no group lookup
+        with self.assertMaxQueries(4) as context:
+            response = self.register('second', 'second@example.com')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')])
+        self.assertEqual(response.data['user']['roles'], ['Reader'])
+        self.assertEqual(get_roles(User.objects.get(username='second')), {'Reader'})
+
+        # The new user's state and roles are already cached: only the category list is read
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get('/products/api/v1/categories/').status_code, 200)
+
+    def test_duplicates_are_rejected_by_the_database(self):
+        self.register('taken', 'taken@example.com')
+        response = self.register('taken', 'other@example.com')
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'Username already exists'}))
+        response = self.register('other', 'taken@example.com')
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'Email already exists'}))
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(self.register('other', 'other@example.com').status_code, 201)
+
+    def test_conflicts_are_told_apart_by_constraint(self):
+        def postgres_error(constraint):
+            exc = IntegrityError(f'duplicate key value violates unique constraint "{constraint}"\nKey (username)=(email)')
+            # psycopg's error, with its diagnostics
+            exc.__cause__ = Exception()
+            exc.__cause__.diag = mock.Mock(constraint_name=constraint)
+            return exc
+        self.assertTrue(views.is_email_conflict(postgres_error('api_auth_user_email_uniq')))
+        self.assertFalse(views.is_email_conflict(postgres_error('auth_user_username_key')))
+        self.assertTrue(views.is_email_conflict(IntegrityError('UNIQUE constraint failed: auth_user.email')))
+        self.assertFalse(views.is_email_conflict(IntegrityError('UNIQUE constraint failed: auth_user.username')))
+
+
+class RegistrationGroupTests(TransactionTestCase):
+    def test_stale_cached_group_id_is_refreshed(self):
+        roles.forget_group_ids()
+        reader = roles.group_id('Reader')
+        # Deleted by another process: this one still has the id cached
+        Group.objects.filter(pk=reader).delete()
+        roles._group_ids['Reader'] = reader
+        response = APIClient().post('/products/api/v1/auth/register/', {'username': 'new', 'email': 'new@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(User.objects.get(username='new').groups.values_list('name', flat=True)), ['Reader'])
+        self.assertEqual(User.objects.count(), 1)
+
+
+class CategoryStatsTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.tools = Category.objects.create(name='Tools')
+        cls.garden = Category.objects.create(name='Garden')
+        cls.empty = Category.objects.create(name='Empty')
+        Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=3, category=cls.tools)
+        Product.objects.create(name='Drill', price=Decimal('50.00'), quantity=2, category=cls.tools)
+        Product.objects.create(name='Rake', price=Decimal('20.00'), quantity=10, category=cls.garden)
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.manager)
+
+    def figures(self, **params):
+        response = self.client.get('/products/api/v1/categories/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['name'], row['product_count'], row['stock_units'], row['stock_value']) for row in response.data]
+
+    def test_categories_carry_their_counters(self):
+        self.assertEqual(self.figures(), [('Tools', 2, 5, '130.00'), ('Garden', 1, 10, '200.00'), ('Empty', 0, 0, '0.00')])
+        response = self.client.get(f'/products/api/v1/categories/{self.garden.pk}/')
+        self.assertEqual(response.data['stock_value'], '200.00')
+
+    def test_counters_follow_product_writes(self):
+        self.figures()
+        saw = Product.objects.get(name='Saw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/products/api/v1/products/{saw.pk}/sale/', {'quantity': 3})
+            self.client.patch(f'/products/api/v1/products/{saw.pk}/', {'category': self.garden.pk})
+        self.assertEqual(self.figures()[:2], [('Tools', 1, 2, '100.00'), ('Garden', 2, 10, '200.00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/products/api/v1/categories/{self.tools.pk}/')
+        self.assertEqual(self.figures(), [('Garden', 2, 10, '200.00'), ('Empty', 0, 0, '0.00')])
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_ordering_by_counters_costs_one_query(self):
+        self.figures()
+        cache.clear()
+        authentication.get_state(self.manager.pk)
+        with self.assertMaxQueries(1) as context:
+            self.assertEqual([row[0] for row in self.figures(ordering='-stock_value')], ['Garden', 'Tools', 'Empty'])
+        self.assertNotIn('GROUP BY', context.captured_queries[0]['sql'])
+        self.assertEqual([row[0] for row in self.figures(ordering='product_count')], ['Empty', 'Garden', 'Tools'])
+        self.assertEqual([row[0] for row in self.figures(ordering='-name')], ['Tools', 'Garden', 'Empty'])
+        self.assertEqual(self.client.get('/products/api/v1/categories/', {'ordering': 'price'}).status_code, 400)
+
+
+class StockAlertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.tools = Category.objects.create(name='Tools')
+        cls.garden = Category.objects.create(name='Garden', low_stock_threshold=20)
+        cls.saw = Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=4, sold_quantity=30, category=cls.tools)
+        cls.drill = Product.objects.create(name='Drill', price=Decimal('80.00'), quantity=6, sold_quantity=5, category=cls.tools)
+        cls.rake = Product.objects.create(name='Rake', price=Decimal('20.00'), quantity=10, sold_quantity=12, category=cls.garden)
+        cls.hose = Product.objects.create(
+            name='Hose', price=Decimal('15.00'), quantity=8, category=cls.garden, low_stock_threshold=2,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.manager)
+
+    def names(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def test_levels_follow_product_and_category_thresholds(self):
+        levels = dict(Product.objects.values_list('name', 'alert_level'))
+        self.assertEqual(levels, {'Saw': 5, 'Drill': 5, 'Rake': 20, 'Hose': 2})
+        self.assertEqual(self.names('/products/api/v1/products/low-stock/'), ['Rake', 'Saw'])
+        self.assertEqual(aggregates.get_totals().low_stock_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/products/api/v1/categories/{self.tools.pk}/', {'low_stock_threshold': 8})
+            self.client.patch(f'/products/api/v1/products/{self.rake.pk}/', {'category': self.tools.pk})
+        self.assertEqual(self.names('/products/api/v1/products/low-stock/'), ['Saw', 'Drill'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/products/api/v1/categories/{self.tools.pk}/')
+        self.assertEqual(self.names('/products/api/v1/products/low-stock/'), ['Saw'])
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_bulk_paths_store_levels(self):
+        self.client.post('/products/api/v1/products/bulk/', [
+            {'name': 'Shears', 'price': '9.00', 'quantity': 15, 'category': self.garden.pk},
+        ], format='json')
+        self.client.patch('/products/api/v1/products/bulk/', [{'id': self.drill.pk, 'low_stock_threshold': 7}], format='json')
+        with override_settings(STOCK_ALERTS={'LOW_STOCK_THRESHOLD': 1}):
+            self.assertEqual(aggregates.verify(), ['1 product(s) with an outdated low-stock alert level'])
+            aggregates.rebuild()
+            self.assertEqual(aggregates.verify(), [])
+        self.assertEqual(
+            self.names('/products/api/v1/products/low-stock/', category=self.garden.pk), ['Rake', 'Shears'],
+        )
+        self.assertEqual(self.names('/products/api/v1/products/low-stock/', category=self.tools.pk), ['Drill'])
+
+    def test_leaderboards(self):
+        self.assertEqual(self.names('/products/api/v1/products/leaderboard/'), ['Saw', 'Rake', 'Drill'])
+        response = self.client.get('/products/api/v1/products/leaderboard/', {'by': 'revenue', 'page_size': 2})
+        self.assertEqual([(row['name'], row['revenue']) for row in response.data['results']], [('Drill', '400.00'), ('Saw', '300.00')])
+        self.assertEqual(self.names(response.data['next']), ['Rake'])
+        self.assertEqual(self.names('/products/api/v1/products/leaderboard/', by='revenue', category=self.garden.pk), ['Rake'])
+        self.assertEqual(self.client.get('/products/api/v1/products/leaderboard/', {'by': 'price'}).status_code, 400)
+
+    def test_lists_read_an_index(self):
+        queries = [
+            alerts.leaderboard(alerts.UNITS).order_by(*alerts.RANKINGS[alerts.UNITS]),
+            alerts.leaderboard(alerts.BY_REVENUE).order_by(*alerts.RANKINGS[alerts.BY_REVENUE]),
+            alerts.leaderboard(alerts.BY_REVENUE, Product.objects.filter(category=self.tools)).order_by(*alerts.RANKINGS[alerts.BY_REVENUE]),
+            alerts.low_stock().order_by(*alerts.LOW_STOCK_ORDERING),
+            alerts.low_stock(Product.objects.filter(category=self.tools)).order_by(*alerts.LOW_STOCK_ORDERING),
+        ]
+        for queryset in queries:
+            plan = queryset[:20].explain()
+            self.assertIn('USING INDEX api_product_', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class FastListTests(TestCase):
+    """Lists built from values() rows must be byte for byte what the serializers render."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.reader.groups.add(Group.objects.create(name='Reader'))
+        tools = Category.objects.create(name='Outils', icon='🔧', low_stock_threshold=3)
+        empty = Category.objects.create(name='Vide', description='Line\u2028separator')
+        empty.totals.delete()
+        Product.objects.create(name='Scie "égoïne"', price=Decimal('12.5'), quantity=2, sold_quantity=4, category=tools)
+        Product.objects.create(name='Marteau\u2029', price=Decimal('7.00'), quantity=9, category=tools, low_stock_threshold=10)
+        Product.objects.create(name='Sans catégorie', price=Decimal('0.99'), quantity=0)
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.reader)
+
+    def get(self, path, params=None, **headers):
+        cache.clear()
+        return self.client.get(path, params, **headers)
+
+    def assertSameBytes(self, path, params=None):
+        response = self.get(path, params)
+        with override_settings(FAST_LIST_RESPONSES=False):
+            expected = self.get(path, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_same_bytes_as_the_serializers(self):
+        self.assertIn(b'\\u2029', self.assertSameBytes('/products/api/v1/products/').content)
+        self.assertSameBytes('/products/api/v1/products/', {'fields': 'id,category_details,price,unknown'})
+        self.assertSameBytes('/products/api/v1/products/', {'low_stock': 'true'})
+        response = self.assertSameBytes('/products/api/v1/products/', {'page_size': 2})
+        self.assertSameBytes(response.data['next'])
+        self.assertSameBytes('/products/api/v1/categories/')
+        self.assertSameBytes('/products/api/v1/categories/', {'ordering': '-stock_value', 'fields': 'name,stock_value'})
+
+    def test_plan(self):
+        from .serializer import ProductSerializer, UserSerializer
+
+        with self.assertRaises(rows.Unsupported):
+            rows.plan(UserSerializer)
+        columns, build = rows.plan(ProductSerializer, frozenset({'category_details', 'price'}))
+        self.assertEqual(columns, (
+            'category', 'category__id', 'category__name', 'category__description', 'category__icon',
+            'category__low_stock_threshold', 'price',
+        ))
+        row = dict.fromkeys(columns)
+        row['price'] = Decimal('1.5')
+        self.assertEqual(build(row), {'category_details': None, 'price': '1.50'})
+
+    def test_compression_follows_accept_encoding(self):
+        plain = self.get('/products/api/v1/products/')
+        response = self.client.get('/products/api/v1/products/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(self.client.get('/products/api/v1/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get('/products/api/v1/products/', HTTP_ACCEPT_ENCODING='br')
+        if compression.brotli is None:
+            self.assertNotIn('Content-Encoding', response)
+        else:
+            self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    def test_responses_with_tokens_are_not_compressed(self):
+        response = self.client.post(
+            '/products/api/v1/auth/register/', {'username': 'new', 'email': 'new@example.com', 'password': 'secret'},
+            HTTP_ACCEPT_ENCODING='gzip, br',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(len(response.content), compression.MIN_SIZE)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('access', response.json())
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        schema.ARTIFACTS.clear()
+        self.addCleanup(schema.ARTIFACTS.clear)
+
+    def get(self, **extra):
+        with GENERATOR_STATS.silence():
+            return self.client.get('/api/schema/', **extra)
+
+    def test_generated_once_and_revalidated(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.oai.openapi'))
+        self.assertIn(b'/products/api/v1/products/', response.content)
+
+        with mock.patch.object(SchemaGenerator, 'get_schema') as get_schema:
+            again = self.get()
+            not_modified = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        get_schema.assert_not_called()
+        self.assertEqual(again.content, response.content)
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        as_json = self.get(HTTP_ACCEPT='application/vnd.oai.openapi+json')
+        self.assertEqual(as_json['Content-Type'], 'application/vnd.oai.openapi+json')
+        self.assertNotEqual(as_json['ETag'], response['ETag'])
+
+    def test_documents_jwt_authentication(self):
+        GENERATOR_STATS.reset()
+        data = json.loads(self.get(HTTP_ACCEPT='application/vnd.oai.openapi+json').content)
+        self.assertEqual(data['components']['securitySchemes']['jwtAuth']['scheme'], 'bearer')
+        self.assertEqual(data['paths']['/products/api/v1/products/']['get']['security'], [{'jwtAuth': []}])
+        self.assertFalse([warning for warning in GENERATOR_STATS._warn_cache if 'authenticator' in warning])
+
+    def test_only_known_versions_and_languages_are_stored(self):
+        self.assertEqual(self.get(QUERY_STRING='lang=fr').status_code, 200)
+        self.assertEqual(self.get(QUERY_STRING='lang=xx-random').status_code, 200)
+        self.assertEqual(self.get(QUERY_STRING='version=random').status_code, 200)
+        self.assertEqual([key[1:] for key in schema.ARTIFACTS], [(None, 'fr')])
+
+    def test_served_from_the_build_artifact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            with GENERATOR_STATS.silence():
+                call_command('spectacular', '--format', 'openapi-json', '--file', path)
+            with override_settings(SCHEMA_FILE=path), mock.patch.object(SchemaGenerator, 'get_schema') as get_schema:
+                response = self.get(HTTP_ACCEPT='application/vnd.oai.openapi+json')
+            get_schema.assert_not_called()
+            with open(path) as schema_file:
+                self.assertEqual(json.loads(response.content), json.load(schema_file))
+
+
+# Run with API_PROFILE=slim in a fresh interpreter
+SLIM_PROBE = """
+import json, sys
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+client = Client()
+print(json.dumps({
+    'apps': settings.INSTALLED_APPS,
+    'status': {path: client.get(path).status_code for path in ('/products/api/v1/products/', '/admin/', '/api/schema/')},
+    'loaded': [name for name in ('unfold', 'drf_spectacular.openapi', 'drf_spectacular.views') if name in sys.modules],
+}))
+"""
+
+
+class SlimProfileTests(SimpleTestCase):
+    def test_api_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, API_PROFILE='slim', DB_NAME=os.path.join(directory, 'db.sqlite3'), DJANGO_SETTINGS_MODULE='backend.settings')
+            process = subprocess.run([sys.executable, '-c', SLIM_PROBE], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        result = json.loads(process.stdout)
+        self.assertIn('api', result['apps'])
+        self.assertNotIn('django.contrib.admin', result['apps'])
+        self.assertEqual(result['status'], {'/products/api/v1/products/': 401, '/admin/': 404, '/api/schema/': 404})
+        self.assertEqual(result['loaded'], [])
+
+
+class AggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tools = Category.objects.create(name='Tools')
+        cls.garden = Category.objects.create(name='Garden')
+        cls.saw = Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=4, category=cls.tools)
+        cls.rake = Product.objects.create(name='Rake', price=Decimal('20.00'), quantity=0, category=cls.garden)
+
+    def category_figures(self, category):
+        return CategoryTotals.objects.values_list('product_count', 'stock_units', 'stock_value').get(category=category)
+
+    def test_deltas_follow_saves_and_deletes(self):
+        totals = aggregates.get_totals()
+        self.assertEqual((totals.product_count, totals.stock_units, totals.stock_value), (2, 4, Decimal('40.00')))
+        self.assertEqual((totals.low_stock_count, totals.out_of_stock_count), (2, 1))
+
+        self.saw.quantity, self.saw.price, self.saw.category = 10, Decimal('12.50'), self.garden
+        self.saw.save()
+        Product.objects.create(name='Hose', price=Decimal('5.00'), quantity=2)
+        self.rake.delete()
+        totals = aggregates.get_totals()
+        self.assertEqual((totals.product_count, totals.stock_units, totals.stock_value), (2, 12, Decimal('135.00')))
+        self.assertEqual((totals.low_stock_count, totals.out_of_stock_count), (1, 0))
+        self.assertEqual((totals.uncategorized_count, totals.uncategorized_units), (1, 2))
+        self.assertEqual(self.category_figures(self.tools), (0, 0, Decimal('0.00')))
+        self.assertEqual(self.category_figures(self.garden), (1, 10, Decimal('125.00')))
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_stale_instances_apply_the_stored_row(self):
+        first, second = Product.objects.get(pk=self.saw.pk), Product.objects.get(pk=self.saw.pk)
+        first.quantity = 7
+        first.save()
+        # Loaded before the first save: its delta starts from the stored row, not from 4
+        second.quantity = 1
+        second.save()
+        Product.objects.get(pk=self.saw.pk).delete()
+        self.assertEqual(aggregates.get_totals().stock_units, 0)
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_verify_reports_drift(self):
+        StockTotals.objects.update(stock_units=99)
+        CategoryTotals.objects.filter(category=self.tools).update(product_count=3)
+        self.assertEqual(aggregates.verify(), [
+            'totals.stock_units: stored 99, expected 4',
+            f'category {self.tools.pk}.product_count: stored 3, expected 1',
+        ])
+        aggregates.rebuild()
+        self.assertEqual(aggregates.verify(), [])
+
+
+class BulkWriteTests(TestCase):
+    url = '/products/api/v1/products/bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.tools = Category.objects.create(name='Tools')
+        cls.saw = Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=4, category=cls.tools)
+        cls.drill = Product.objects.create(name='Drill', price=Decimal('80.00'), quantity=6)
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.manager)
+
+    def statuses(self, response):
+        return [item['status'] for item in response.data['results']]
+
+    def test_create_is_all_or_nothing_by_default(self):
+        items = [{'name': 'Hammer', 'price': '12.00', 'quantity': 3, 'category': self.tools.pk}, {'name': 'Nails'}]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), ['skipped', 'error'])
+        self.assertFalse(Product.objects.filter(name='Hammer').exists())
+
+        response = self.client.post(self.url + '?mode=best_effort', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(self.statuses(response), ['created', 'error'])
+        self.assertEqual(Product.objects.get(pk=response.data['results'][0]['id']).category, self.tools)
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_update_and_delete(self):
+        response = self.client.patch(self.url, [
+            {'id': self.saw.pk, 'quantity': 9},
+            {'id': self.drill.pk, 'price': '75.00', 'category': self.tools.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), ['updated', 'updated'])
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('quantity', 'category')), [(9, self.tools.pk), (6, self.tools.pk)])
+        self.assertEqual(aggregates.get_totals().stock_value, Decimal('540.00'))
+
+        response = self.client.delete(self.url, [self.saw.pk, {'id': self.drill.pk}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_rejects_invalid_ids(self):
+        response = self.client.patch(self.url + '?mode=best_effort', [
+            {'id': True, 'quantity': 1}, {'id': self.saw.pk, 'quantity': 2}, {'id': self.saw.pk, 'quantity': 3}, {'quantity': 4},
+        ], format='json')
+        self.assertEqual(self.statuses(response), ['error', 'updated', 'error', 'error'])
+        response = self.client.delete(self.url, [True, self.drill.pk], format='json')
+        self.assertEqual(self.statuses(response), ['error', 'skipped'])
+        self.assertEqual(Product.objects.get(pk=self.saw.pk).quantity, 2)
+        self.assertTrue(Product.objects.filter(pk=self.drill.pk).exists())
+        self.assertEqual(self.client.post(self.url, {'name': 'Saw'}, format='json').status_code, 400)
+
+
+class ImportTests(TestCase):
+    url = '/products/api/v1/products/import/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = benchmarks.token_client(self.manager)
+
+    def upload(self, content):
+        return self.client.post(self.url, {'file': SimpleUploadedFile('products.csv', content)}, format='multipart')
+
+    def test_rows_are_created_and_reported(self):
+        response = self.upload('﻿name,price,quantity,category\nSaw,10.00,3,Tools\n"Drill, cordless",50.00,x,Tools\n'.encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['failed']), (2, 1, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+        self.assertEqual(Product.objects.get().category.name, 'Tools')
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_invalid_encoding_is_a_bad_request(self):
+        response = self.upload('name,price,quantity\nSaw,10.00,3\nSäge,12.00,1\n'.encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['line'], response.data['rows'], response.data['created']), (3, 1, 1))
+        self.assertIn('UTF-8', response.data['error'])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Saw'])
+
+    def test_malformed_csv_is_a_bad_request(self):
+        response = self.upload(b'name,price,quantity\nSaw,10.00,3\n' + b'x' * 200000 + b',50.00,1\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['line'], 3)
+        self.assertIn('invalid CSV', response.data['error'])
+
+    def test_command_reports_the_unreadable_line(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csv_file:
+            csv_file.write('name,price,quantity\nSäge,12.00,1\nSaw,10.00,3\n'.encode('latin-1'))
+            csv_file.flush()
+            with self.assertRaisesMessage(CommandError, 'Line 2: not valid UTF-8 text (0 row(s) before it were imported)'):
+                call_command('import_products', csv_file.name, stdout=StringIO())
+        self.assertFalse(Product.objects.exists())
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(JOBS={'HEARTBEAT_INTERVAL': 0.05})
+    def test_long_steps_keep_the_job_alive(self):
+        beats = []
+
+        def slow_step(job, progress):
+            # No progress reported while the step runs
+            start = Job.objects.get(pk=job.pk).heartbeat_at
+            time.sleep(0.5)
+            beats.append(Job.objects.get(pk=job.pk).heartbeat_at > start)
+            return {}
+
+        with mock.patch.dict(jobs.HANDLERS, {'slow': slow_step}):
+            job = jobs.enqueue('slow')
+            jobs.run(jobs.claim('test'))
+        self.assertEqual(beats, [True])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.SUCCEEDED)
+
+
+class StockHistoryTests(TestCase):
+    def setUp(self):
+        # Migration 0005 seeds the rollups of the day it runs
+        StockRollup.objects.all().delete()
+
+    def rollup_figures(self):
+        return set(StockRollup.objects.values_list(
+            'movement_count', 'units_in', 'units_out', 'units_sold', 'closing_units', 'closing_value',
+        ))
+
+    def test_writes_feed_the_day_and_month_rollups(self):
+        product = Product.objects.create(name='Apple', price=Decimal('2.50'), quantity=4)
+        product.quantity, product.sold_quantity = 1, 3
+        product.save()
+        product.name = 'Green apple'
+        product.save()
+        self.assertEqual(list(StockMovement.objects.order_by('id').values_list('quantity_delta', 'sold_delta', 'value_delta')), [
+            (4, 0, Decimal('10.00')), (-3, 3, Decimal('-7.50')),
+        ])
+        self.assertEqual(sorted(StockRollup.objects.values_list('period', flat=True)), [StockRollup.DAY, StockRollup.MONTH])
+        self.assertEqual(self.rollup_figures(), {(2, 4, 3, 3, 1, Decimal('2.50'))})
+
+        # No movement, but the closing value follows the price
+        product.price = Decimal('10.00')
+        product.save()
+        self.assertEqual(StockMovement.objects.count(), 2)
+        self.assertEqual(self.rollup_figures(), {(2, 4, 3, 3, 1, Decimal('10.00'))})
+
+        product.delete()
+        self.assertEqual(set(StockRollup.objects.values_list('movement_count', 'units_out', 'closing_units', 'closing_value')), {
+            (3, 4, 0, Decimal('0.00')),
+        })
+
+    def test_record_changes_ignores_writes_that_change_no_figure(self):
+        product = Product.objects.create(name='Apple', price=Decimal('2.50'), quantity=0)
+        before = aggregates.snapshot(product)
+        history.record_changes([(before, before._replace(price=Decimal('3.00')))])
+        self.assertFalse(StockRollup.objects.exists())
+
+    def test_monthly_evolution_carries_values_forward(self):
+        for start, value in [(date(2025, 12, 1), '50.00'), (date(2026, 1, 1), '100.00'), (date(2026, 3, 1), '300.00')]:
+            StockRollup.objects.create(period=StockRollup.MONTH, period_start=start, closing_value=Decimal(value))
+        StockRollup.objects.create(period=StockRollup.DAY, period_start=date(2026, 2, 10), closing_value=Decimal('999.00'))
+        evolution = history.monthly_evolution(months=4, today=date(2026, 4, 15))
+        self.assertEqual([(row['period'], row['value']) for row in evolution], [
+            ('2026-01', Decimal('100.00')), ('2026-02', Decimal('100.00')),
+            ('2026-03', Decimal('300.00')), ('2026-04', Decimal('300.00')),
+        ])
+        self.assertEqual(evolution[0]['month'], 'Jan')
+        # A window starting after the first rollup starts from the one before it
+        self.assertEqual(history.monthly_evolution(months=1, today=date(2026, 2, 1))[0]['value'], Decimal('100.00'))
+        self.assertEqual(history.monthly_evolution(months=2, today=date(2025, 11, 5)), [])
+
+    @override_settings(STOCK_HISTORY={'COMPACT_BATCH_SIZE': 1})
+    def test_compact_applies_the_retention(self):
+        now = timezone.now()
+        today = timezone.localdate(now)
+        for days in (100, 95, 10):
+            StockMovement.objects.create(quantity_delta=1, created_at=now - timedelta(days=days))
+        StockRollup.objects.create(period=StockRollup.DAY, period_start=today - timedelta(days=800))
+        StockRollup.objects.create(period=StockRollup.DAY, period_start=today - timedelta(days=10))
+        StockRollup.objects.create(period=StockRollup.MONTH, period_start=date(2020, 1, 1))
+
+        self.assertEqual(history.compact(now), (2, 1))
+        self.assertEqual(StockMovement.objects.count(), 1)
+        self.assertEqual(StockRollup.objects.filter(period=StockRollup.DAY).count(), 1)
+        self.assertTrue(StockRollup.objects.filter(period=StockRollup.MONTH, period_start=date(2020, 1, 1)).exists())
+        self.assertEqual(history.compact(now, raw_days=0, daily_days=0), (1, 1))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.tools = Category.objects.create(name='Hand, "power" tools')
+        cls.saw = Product.objects.create(name='Saw', price=Decimal('10.00'), quantity=3, sold_quantity=1, category=cls.tools)
+        cls.rope = Product.objects.create(name='Rope, 10 m\nblue "nylon"', price=Decimal('4.50'), quantity=0)
+
+    def setUp(self):
+        self.client = benchmarks.token_client(self.manager)
+
+    def download(self, fmt):
+        response = self.client.get(f'/products/api/v1/products/export/{fmt}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="products.{fmt}"')
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_quotes_and_counts_rows(self):
+        response, body = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows, [
+            list(export.COLUMNS),
+            [str(self.saw.pk), 'Saw', '10.00', '3', '1', str(self.tools.pk), 'Hand, "power" tools'],
+            [str(self.rope.pk), 'Rope, 10 m\nblue "nylon"', '4.50', '0', '0', '', ''],
+        ])
+        self.assertIn('"Hand, ""power"" tools"', body)
+
+    def test_ndjson_has_one_object_per_product(self):
+        response, body = self.download('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.splitlines()
+        self.assertEqual(len(lines), Product.objects.count())
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': self.saw.pk, 'name': 'Saw', 'price': '10.00', 'quantity': 3, 'sold_quantity': 1,
+             'category_id': self.tools.pk, 'category_name': 'Hand, "power" tools'},
+            {'id': self.rope.pk, 'name': 'Rope, 10 m\nblue "nylon"', 'price': '4.50', 'quantity': 0, 'sold_quantity': 0,
+             'category_id': None, 'category_name': None},
+        ])
+
+    def test_command_writes_the_same_output(self):
+        _, body = self.download('csv')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.csv')
+            call_command('export_products', '--output', path, '--chunk-size', '1')
+            with open(path, encoding='utf-8', newline='') as output:
+                self.assertEqual(output.read(), body)
+        stdout = StringIO()
+        call_command('export_products', '--format', 'ndjson', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), self.download('ndjson')[1])
+
+
+class ProductPaginationTests(TestCase):
+    url = '/products/api/v1/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.ids = [Product.objects.create(name=f'Product {i}', price=Decimal('1.00'), quantity=i).pk for i in range(7)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursors_walk_the_list_in_id_order(self):
+        first = self.page(self.url, page_size=3)
+        self.assertIsNone(first['previous'])
+        second = self.page(first['next'])
+        last = self.page(second['next'])
+        self.assertEqual([[row['id'] for row in page['results']] for page in (first, second, last)], [
+            self.ids[:3], self.ids[3:6], self.ids[6:],
+        ])
+        self.assertIsNone(last['next'])
+        # A row inserted meanwhile neither shifts nor repeats the pages already read
+        Product.objects.create(name='Late', price=Decimal('1.00'), quantity=1)
+        cache.clear()
+        self.assertEqual([row['id'] for row in self.page(last['previous'])['results']], self.ids[3:6])
+        self.assertEqual(len(self.page(second['next'])['results']), 2)
+
+    def test_page_size_bounds(self):
+        paginator = pagination.ProductCursorPagination()
+        factory = APIRequestFactory()
+        sizes = {
+            value: paginator.get_page_size(Request(factory.get(self.url, {'page_size': value})))
+            for value in ('2', '0', '-1', 'many', '5000')
+        }
+        self.assertEqual(sizes, {'2': 2, '0': 100, '-1': 100, 'many': 100, '5000': 500})
+        self.assertEqual(len(self.page(self.url, page_size=2)['results']), 2)
+        self.assertEqual(len(self.page(self.url, page_size=5000)['results']), 7)
+
+    def test_fields_selects_the_columns(self):
+        page = self.page(self.url, fields='id,name', page_size=2)
+        self.assertEqual(page['results'], [{'id': self.ids[0], 'name': 'Product 0'}, {'id': self.ids[1], 'name': 'Product 1'}])
+        self.assertEqual(set(self.page(page['next'])['results'][0]), {'id', 'name'})
+        self.assertIn('category_details', self.page(self.url, page_size=1)['results'][0])
@@ -0,0 +1,40 @@
+"""
+Single entry point for propagating product writes to derived data: the
+dashboard figures, the stock history, the change feed and the response cache.
+
+Model signals call product_changes() for ordinary saves and deletes; bulk code
+paths that bypass signals must call it with the snapshots they wrote. Inside
+`with suppressed():` the signal handlers do nothing, so a bulk operation can
+use the ORM (e.g. queryset.delete()) and report all of its changes at once.
+"""
+import threading
+from contextlib import contextmanager
+
+from . import aggregates, caching, changes as change_feed, history
+from .models import Product
+
+_state = threading.local()
+
+
+@contextmanager
+def suppressed():
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def is_suppressed():
+    return getattr(_state, 'suppressed', False)
+
+
+def product_changes(changes):
+    changes = list(changes)
+    if not changes:
+        return
+    aggregates.apply_changes(changes)
+    history.record_changes(changes)
+    change_feed.record_products(changes)
+    caching.bump(Product)
@@ -1,18 +1,39 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CategoryViewSet, RegisterView, CurrentUserView, StatsView, UpdateProfileView, CustomTokenObtainPairView
+from .views import ProductViewSet, CategoryViewSet, RegisterView, CurrentUserView, StatsView, UpdateProfileView, CustomTokenObtainPairView, MetricsView, JobViewSet, ChangesView
 from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views
+from .compression import never_compress
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 router.register(r'categories', CategoryViewSet)
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
     path("api/v1/", include(router.urls)),
-    path("api/v1/auth/register/", RegisterView.as_view(), name="register"),
-    path("api/v1/auth/login/", CustomTokenObtainPairView.as_view(), name="login"),
-    path("api/v1/auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    # Responses with tokens are never compressed (api.compression)
+    path("api/v1/auth/register/", never_compress(RegisterView.as_view()), name="register"),
+    path("api/v1/auth/login/", never_compress(CustomTokenObtainPairView.as_view()), name="login"),
+    path("api/v1/auth/refresh/", never_compress(TokenRefreshView.as_view()), name="token_refresh"),
     path("api/v1/auth/me/", CurrentUserView.as_view(), name="current_user"),
-    path("api/v1/auth/profile/", UpdateProfileView.as_view(), name="update_profile"),
+    path("api/v1/auth/profile/", never_compress(UpdateProfileView.as_view()), name="update_profile"),
     path("api/v1/stats/", StatsView.as_view(), name="stats"),
-]
\ No newline at end of file
+    path("api/v1/metrics/", MetricsView.as_view(), name="metrics"),
+    path("api/v1/changes/", ChangesView.as_view(), name="changes"),
+    # Async view; answers 501 outside ASGI
+    path("api/v1/changes/stream/", async_views.ChangeStreamView.as_view(), name="change-stream"),
+]
+# Async read path for ASGI deployments; these take precedence over the router's
+# list/detail routes and hand every non-read method back to the DRF views.
+async_urlpatterns = [
+    path("api/v1/products/", async_views.ProductListView.as_view(), name="product-list"),
+    re_path(r"^api/v1/products/(?P<pk>[0-9]+)/$", async_views.ProductDetailView.as_view(), name="product-detail"),
+    path("api/v1/categories/", async_views.CategoryListView.as_view(), name="category-list"),
+    path("api/v1/auth/me/", async_views.CurrentUserReadView.as_view(), name="current_user"),
+    path("api/v1/stats/", async_views.StatsReadView.as_view(), name="stats"),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
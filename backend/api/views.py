@@ -1,25 +1,50 @@
 from django.shortcuts import render
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from django.contrib.auth.models import User, Group, update_last_login
+from rest_framework.reverse import reverse
+from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.db.models import Sum, Count, F
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connection, transaction
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
-from .serializer import ProductSerializer, CategorySerializer, UserSerializer, RegisterSerializer, UpdateProfileSerializer
-from .models import Product, Category
-from .permissions import IsManager, IsAdmin, IsReader
+from .serializer import ProductSerializer, ProductRankingSerializer, CategoryStatsSerializer, UserSerializer, RegisterSerializer, UpdateProfileSerializer, RoleTokenObtainPairSerializer, StockOrderSerializer, StockQuantitySerializer, JobSerializer, JobRequestSerializer
+from .models import Product, Category, CategoryTotals, Job
+from .permissions import IsManager, IsAdmin
+from .pagination import ProductCursorPagination, JobCursorPagination, RankingCursorPagination
+from .filters import CategoryOrderingFilter, ProductFilterBackend
+from .caching import cached_response
+from .metrics import timed
+from .renderers import FastJSONRenderer
+from . import aggregates, alerts, authentication, bulk, changes, export, history, imports, jobs, metrics, roles, rows, stock
+from .roles import ADMIN, READER, add_claims, has_role
 
 # Auth Views
 class CustomTokenObtainPairView(TokenObtainPairView):
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            # request.data['username'] actually contains the email now
-            user = User.objects.get(email=request.data['username'])
-            update_last_login(None, user)
-        return response
+    # The serializer resolves the user once (request.data['username'] holds the
+    # email) and records last_login itself, see SIMPLE_JWT['UPDATE_LAST_LOGIN']
+    serializer_class = RoleTokenObtainPairSerializer
+
+# The unique email index of migration 0007, and the databases it is created on
+EMAIL_INDEX = 'api_auth_user_email_uniq'
+EMAIL_INDEX_VENDORS = ('sqlite', 'postgresql')
+
+
+def is_email_conflict(exc):
+    """Whether an IntegrityError was raised by the unique email index rather than the username one."""
+    diag = getattr(exc.__cause__, 'diag', None)
+    if diag is not None and diag.constraint_name:
+        # PostgreSQL names the constraint
+        return diag.constraint_name == EMAIL_INDEX
+    # SQLite names the column
+    return 'auth_user.email' in str(exc)
+
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -36,22 +61,25 @@ class RegisterView(APIView):
         
         if not username or not password or not email:
             return Response({'error': 'Username, email and password are required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if email already exists
-        if User.objects.filter(email=email).exists():
+
+        # Without a unique email index (MySQL) the check is left to this view
+        if connection.vendor not in EMAIL_INDEX_VENDORS and User.objects.filter(email=email).exists():
             return Response({'error': 'Email already exists'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if User.objects.filter(username=username).exists():
-            return Response({'error': 'Username already exists'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        user = User.objects.create_user(username=username, password=password, email=email)
-        
-        # Default group: Reader
-        reader_group, _ = Group.objects.get_or_create(name='Reader')
-        user.groups.add(reader_group)
-        
-        refresh = RefreshToken.for_user(user)
-        
+
+        # Hashed before the transaction: the database is not locked while the CPU works
+        user = User(username=username, email=User.objects.normalize_email(email), password=make_password(password))
+        try:
+            self.create_reader(user)
+        except IntegrityError as exc:
+            # The unique username and email indexes reject duplicates, even concurrent ones
+            field = 'Email' if is_email_conflict(exc) else 'Username'
+            return Response({'error': f'{field} already exists'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The first authenticated requests of the new user find their state in the cache
+        user._roles = roles.store_roles(user.pk, frozenset({READER}))
+        authentication.store_state(user.pk, {'username': user.username, 'is_active': user.is_active, 'password': user.password})
+        refresh = add_claims(RefreshToken.for_user(user), user)
+
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -59,10 +87,25 @@ class RegisterView(APIView):
                 'id': user.id,
                 'username': user.username,
                 'email': user.email,
-                'roles': [g.name for g in user.groups.all()]
+                'roles': sorted(user._roles),
             }
         }, status=status.HTTP_201_CREATED)
 
+    def create_reader(self, user):
+        """Insert the user and its membership of the default group (Reader) in one transaction."""
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    User.groups.through.objects.create(user_id=user.pk, group_id=roles.group_id(READER))
+                return
+            except IntegrityError as exc:
+                user.pk = None
+                if 'foreign key' not in str(exc).lower() or attempt:
+                    raise
+                # The cached group id is stale: the group was deleted by another process
+                roles.forget_group_ids()
+
 class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -71,15 +114,7 @@ class CurrentUserView(APIView):
         description="Get current authenticated user details"
     )
     def get(self, request):
-        user = request.user
-        return Response({
-            'id': user.id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.email,
-            'roles': [g.name for g in user.groups.all()]
-        })
+        return Response(UserSerializer(request.user).data)
 
 class UpdateProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -112,6 +147,8 @@ class UpdateProfileView(APIView):
 
         # Update email only if it doesn't exist yet
         if email and not user.email:
+            if User.objects.filter(email=email).exists():
+                return Response({'error': 'Email already exists'}, status=status.HTTP_400_BAD_REQUEST)
             user.email = email
 
         # Update password if provided
@@ -122,25 +159,229 @@ class UpdateProfileView(APIView):
 
         user.save()
 
-        return Response({
-            'id': user.id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.email,
-            'roles': [g.name for g in user.groups.all()]
-        })
+        data = UserSerializer(user).data
+        if current_password and new_password:
+            # Changing the password revokes the caller's tokens, hand out new ones
+            refresh = add_claims(RefreshToken.for_user(user), user)
+            data.update(refresh=str(refresh), access=str(refresh.access_token))
+        return Response(data)
 
 # Create your views here.
-class CategoryViewSet(viewsets.ModelViewSet):
-    serializer_class = CategorySerializer
+class EagerLoadingViewMixin:
+    """Applies the relations declared by the serializer (see EagerLoadingMixin) to the queryset."""
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return self.get_serializer_class().setup_eager_loading(queryset)
+
+class ValuesListMixin:
+    """
+    Lists built from values() rows (api.rows) instead of a serializer per
+    object, rendered with orjson when it is installed. The JSON is the same.
+    """
+    # FastJSONRenderer in place of the JSON renderer, the others (browsable API) as configured
+    renderer_classes = [FastJSONRenderer] + [renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if not issubclass(renderer, JSONRenderer)]
+
+    def list(self, request, *args, **kwargs):
+        plan = rows.for_request(self.get_serializer_class(), request)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        columns, build = plan
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*dict.fromkeys(columns + rows.ordering_columns(self.paginator)))
+        page = self.paginate_queryset(queryset)
+        with timed('serialization'):
+            data = [build(row) for row in (queryset if page is None else page)]
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+class CategoryViewSet(EagerLoadingViewMixin, ValuesListMixin, viewsets.ModelViewSet):
+    serializer_class = CategoryStatsSerializer
     queryset = Category.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsManager]
+    filter_backends = [CategoryOrderingFilter]
+
+    # The counters change with every product write
+    @cached_response(Category, Product)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response(Category, Product)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(EagerLoadingViewMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     queryset = Product.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsManager]
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilterBackend]
+    bulk_max_items = 5000
+    bulk_background_max_items = 50000
+
+    @cached_response(Product, Category)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response(Product, Category)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR},
+        description="Stream the whole catalogue with category names as CSV or NDJSON"
+    )
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<fmt>csv|ndjson)', pagination_class=None)
+    def export_catalogue(self, request, fmt):
+        response = StreamingHttpResponse(export.stream(fmt), content_type=export.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+    @extend_schema(
+        request={'multipart/form-data': {'type': 'object', 'properties': {'file': {'type': 'string', 'format': 'binary'}}}},
+        parameters=[
+            OpenApiParameter('batch_size', OpenApiTypes.INT, description="Rows written per batch"),
+            OpenApiParameter('create_categories', OpenApiTypes.BOOL, description="Create unknown categories (default true)"),
+            OpenApiParameter('background', OpenApiTypes.BOOL, description="Queue the import as a job and answer 202 with it"),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 202: JobSerializer},
+        description="Import products from a CSV upload (name, price, quantity, sold_quantity, category, optional id)"
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A CSV file is required in the "file" field'}, status=status.HTTP_400_BAD_REQUEST)
+        batch_size = request.query_params.get('batch_size')
+        batch_size = int(batch_size) if batch_size and batch_size.isdigit() else None
+        create_categories = request.query_params.get('create_categories', 'true').lower() != 'false'
+        if wants_background(request):
+            job = jobs.enqueue(jobs.IMPORT, {
+                'file': jobs.save_upload(upload), 'batch_size': batch_size, 'create_categories': create_categories,
+            }, user_id=request.user.pk)
+            return job_accepted(request, job)
+        try:
+            report = imports.import_products(
+                imports.decode_lines(upload.file),
+                batch_size=batch_size,
+                create_categories=create_categories,
+            )
+        except imports.UnreadableFile as exc:
+            return Response({'error': str(exc), 'line': exc.line, **exc.report.as_dict()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('mode', OpenApiTypes.STR, enum=bulk.MODES, description="all_or_nothing (default) or best_effort"),
+            OpenApiParameter('background', OpenApiTypes.BOOL, description="Queue the batch as a job and answer 202 with it (up to bulk_background_max_items)"),
+        ],
+        request=ProductSerializer(many=True),
+        responses={200: OpenApiTypes.OBJECT, 202: JobSerializer},
+        description="Create (POST), partially update (PATCH, items need an id) or delete (DELETE, list of ids) products in one transaction"
+    )
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        mode = request.query_params.get('mode', bulk.ALL_OR_NOTHING)
+        if mode not in bulk.MODES:
+            return Response({'error': f"mode must be one of {', '.join(bulk.MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of items'}, status=status.HTTP_400_BAD_REQUEST)
+        background = wants_background(request)
+        max_items = self.bulk_background_max_items if background else self.bulk_max_items
+        if len(items) > max_items:
+            return Response({'error': f'At most {max_items} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+        if background:
+            job = jobs.enqueue(jobs.BULK, {'method': request.method, 'mode': mode, 'items': items}, user_id=request.user.pk)
+            return job_accepted(request, job)
+
+        result = bulk.run(request.method, items, mode, self.get_serializer_context())
+        success = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+
+        if not result.has_errors:
+            response_status = success
+        elif mode == bulk.ALL_OR_NOTHING:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({'mode': mode, 'results': result.items}, status=response_status)
+
+    def ranked_page(self, queryset, ordering):
+        self.ranking_ordering = ordering
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter('by', OpenApiTypes.STR, enum=[alerts.UNITS, alerts.BY_REVENUE], description="units (default) or revenue")],
+        responses=ProductRankingSerializer(many=True),
+        description="Best sellers by units sold or revenue, most first; accepts the list filters, e.g. ?category=<id>"
+    )
+    @action(detail=False, methods=['get'], url_path='leaderboard', serializer_class=ProductRankingSerializer, pagination_class=RankingCursorPagination)
+    @cached_response(Product, Category)
+    def leaderboard(self, request):
+        by = request.query_params.get('by', alerts.UNITS)
+        if by not in alerts.RANKINGS:
+            return Response({'error': f"by must be one of {', '.join(alerts.RANKINGS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.ranked_page(alerts.leaderboard(by, self.filter_queryset(self.get_queryset())), alerts.RANKINGS[by])
+
+    @extend_schema(
+        description="Products below their low-stock alert level (own threshold, else the category's, else the default), "
+                    "furthest below first; accepts the list filters, e.g. ?category=<id>"
+    )
+    @action(detail=False, methods=['get'], url_path='low-stock', pagination_class=RankingCursorPagination)
+    @cached_response(Product, Category)
+    def low_stock(self, request):
+        return self.ranked_page(alerts.low_stock(self.filter_queryset(self.get_queryset())), alerts.LOW_STOCK_ORDERING)
+
+    def apply_stock(self, kind, lines, detail=False):
+        try:
+            products = stock.apply(kind, lines)
+        except stock.StockError as exc:
+            if detail and exc.missing:
+                raise Http404
+            errors = [{'product': product_id, 'error': error} for product_id, error in exc.lines.items()]
+            return Response({'errors': errors}, status=status.HTTP_409_CONFLICT)
+        return Response({'products': products})
+
+    def stock_order(self, request, kind):
+        serializer = StockOrderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if len(serializer.validated_data['lines']) > self.bulk_max_items:
+            return Response({'error': f'At most {self.bulk_max_items} lines per order'}, status=status.HTTP_400_BAD_REQUEST)
+        return self.apply_stock(kind, [(line['product'], line['quantity']) for line in serializer.validated_data['lines']])
+
+    def stock_line(self, request, pk, kind):
+        if not str(pk).isdigit():
+            raise Http404
+        serializer = StockQuantitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.apply_stock(kind, [(int(pk), serializer.validated_data['quantity'])], detail=True)
+
+    @extend_schema(
+        request=StockOrderSerializer, responses=OpenApiTypes.OBJECT,
+        description="Sell a multi-line order atomically; 409 and nothing written if a line lacks stock"
+    )
+    @action(detail=False, methods=['post'], url_path='sale')
+    def sale_order(self, request):
+        return self.stock_order(request, stock.SALE)
+
+    @extend_schema(request=StockOrderSerializer, responses=OpenApiTypes.OBJECT, description="Restock a multi-line order atomically")
+    @action(detail=False, methods=['post'], url_path='restock')
+    def restock_order(self, request):
+        return self.stock_order(request, stock.RESTOCK)
+
+    @extend_schema(
+        request=StockQuantitySerializer, responses=OpenApiTypes.OBJECT,
+        description="Sell units of one product; 409 if fewer are in stock"
+    )
+    @action(detail=True, methods=['post'])
+    def sale(self, request, pk=None):
+        return self.stock_line(request, pk, stock.SALE)
+
+    @extend_schema(request=StockQuantitySerializer, responses=OpenApiTypes.OBJECT, description="Add units of one product to the stock")
+    @action(detail=True, methods=['post'])
+    def restock(self, request, pk=None):
+        return self.stock_line(request, pk, stock.RESTOCK)
 
 class StatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -149,64 +390,151 @@ class StatsView(APIView):
         responses=OpenApiTypes.OBJECT,
         description="Get dashboard statistics"
     )
+    @cached_response(Product, Category)
     def get(self, request):
-        # Key Metrics
-        total_products = Product.objects.count()
-        total_stock_value = Product.objects.aggregate(
-            total_value=Sum(F('price') * F('quantity'))
-        )['total_value'] or 0
-        
-        low_stock_count = Product.objects.filter(quantity__lt=5).count()
-        out_of_stock_count = Product.objects.filter(quantity=0).count()
+        return Response(stats_payload(
+            aggregates.get_totals(), top_categories(), top_selling_products(), history.monthly_evolution(months=12),
+        ))
 
-        # Charts Data
-        
-        # 1. Stock by Category (Top 5)
-        category_distribution_query = Product.objects.values('category__name').annotate(
-            count=Count('id'),
-            value=Sum(F('price') * F('quantity'))
-        ).order_by('-value')[:5]  # Limit to top 5 categories
-        
-        category_distribution = [
-            {
-                'category__name': item['category__name'] or 'Uncategorized',
-                'count': item['count'],
-                'value': item['value']
-            }
-            for item in category_distribution_query
-        ]
-
-        # 2. Top Selling Products (Mocked logic if no sales data yet, otherwise use sold_quantity)
-        top_products = Product.objects.order_by('-sold_quantity')[:5]
-        top_products_data = [
-            {
-                'name': p.name,
-                'sold': p.sold_quantity,
-                'revenue': p.sold_quantity * p.price
-            } for p in top_products
-        ]
-
-        # 3. Stock Evolution (Mocked for now as we don't have history)
-        stock_evolution = [
-            {'month': 'Jan', 'value': 4000},
-            {'month': 'Feb', 'value': 3000},
-            {'month': 'Mar', 'value': 2000},
-            {'month': 'Apr', 'value': 2780},
-            {'month': 'May', 'value': 1890},
-            {'month': 'Jun', 'value': 2390},
-            {'month': 'Jul', 'value': 3490},
-        ]
 
-        return Response({
-            'metrics': {
-                'total_products': total_products,
-                'total_stock_value': round(total_stock_value, 2),
-                'low_stock_count': low_stock_count,
-                'out_of_stock_count': out_of_stock_count,
-            },
-            'charts': {
-                'category_distribution': category_distribution,
-                'top_products': top_products_data,
-                'stock_evolution': stock_evolution
-            }
-        })
\ No newline at end of file
+class ChangesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('since', OpenApiTypes.INT, description="Sequence number of the last event applied; omit to get the current one"),
+            OpenApiParameter('limit', OpenApiTypes.INT, description="Events per response (at most CHANGE_FEED['BATCH_SIZE'])"),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description="Product and category changes after a sequence number; reload the lists when `reset` is true. "
+                    "Served as server-sent events at changes/stream/ on ASGI"
+    )
+    def get(self, request):
+        since = request.query_params.get('since')
+        limit = request.query_params.get('limit')
+        if since is not None and not since.isdigit():
+            return Response({'error': 'since must be a sequence number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes.page(
+            since=int(since) if since is not None else None,
+            limit=int(limit) if limit and limit.isdigit() else None,
+        ))
+
+
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    @extend_schema(
+        responses={(200, 'text/plain'): OpenApiTypes.STR},
+        description="Per-route request histograms (time, SQL, serialization, auth, size) in the Prometheus text format"
+    )
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Background jobs (see api.jobs): managers see the jobs they queued, admins every job."""
+    serializer_class = JobSerializer
+    queryset = Job.objects.all()
+    permission_classes = [permissions.IsAuthenticated, IsManager]
+    pagination_class = JobCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if has_role(self.request.user, ADMIN):
+            return queryset
+        return queryset.filter(user_id=self.request.user.pk)
+
+    @extend_schema(
+        request=JobRequestSerializer, responses={202: JobSerializer},
+        description="Queue a catalogue export or (admins) a rebuild of the dashboard figures; poll the job for its progress"
+    )
+    def create(self, request):
+        serializer = JobRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        kind = serializer.validated_data['kind']
+        if kind == jobs.REBUILD_STATS:
+            if not has_role(request.user, ADMIN):
+                return Response({'error': 'Only admins can rebuild the dashboard figures'}, status=status.HTTP_403_FORBIDDEN)
+            params = {}
+        else:
+            params = {'format': serializer.validated_data['format']}
+        return job_accepted(request, jobs.enqueue(kind, params, user_id=request.user.pk))
+
+    @extend_schema(
+        responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR},
+        description="Download the file written by a finished export job"
+    )
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        name = (job.result or {}).get('file') if job.status == Job.SUCCEEDED else None
+        if name is None:
+            return Response({'error': 'This job has no file to download'}, status=status.HTTP_409_CONFLICT)
+        try:
+            stream = open(jobs.file_path(name), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        fmt = job.result['format']
+        return FileResponse(stream, as_attachment=True, filename=f'products.{fmt}', content_type=export.CONTENT_TYPES[fmt])
+
+
+def wants_background(request):
+    return request.query_params.get('background', 'false').lower() == 'true'
+
+
+def job_accepted(request, job):
+    location = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+def top_categories():
+    return CategoryTotals.objects.select_related('category').filter(product_count__gt=0).order_by('-stock_value')[:5]
+
+
+def top_selling_products():
+    return Product.objects.order_by('-sold_quantity')[:5]
+
+
+def stats_payload(totals, categories, top_products, stock_evolution):
+    """Dashboard payload, shared by StatsView and its async counterpart (api.async_views)."""
+    # 1. Stock by Category (Top 5)
+    category_distribution = [
+        {
+            'category__name': row.category.name,
+            'count': row.product_count,
+            'value': row.stock_value
+        }
+        for row in categories
+    ]
+    if totals.uncategorized_count:
+        category_distribution.append({
+            'category__name': 'Uncategorized',
+            'count': totals.uncategorized_count,
+            'value': totals.uncategorized_value
+        })
+        category_distribution = sorted(category_distribution, key=lambda item: item['value'], reverse=True)[:5]
+
+    # 2. Top Selling Products (Mocked logic if no sales data yet, otherwise use sold_quantity)
+    top_products_data = [
+        {
+            'name': p.name,
+            'sold': p.sold_quantity,
+            'revenue': p.sold_quantity * p.price
+        } for p in top_products
+    ]
+
+    return {
+        # Key metrics, precomputed (see api.aggregates)
+        'metrics': {
+            'total_products': totals.product_count,
+            'total_stock_value': round(totals.stock_value, 2),
+            'low_stock_count': totals.low_stock_count,
+            'out_of_stock_count': totals.out_of_stock_count,
+        },
+        'charts': {
+            'category_distribution': category_distribution,
+            'top_products': top_products_data,
+            # 3. Stock Evolution (closing stock value per month, from the history rollups)
+            'stock_evolution': stock_evolution
+        }
+    }
@@ -37,6 +37,7 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 
 INSTALLED_APPS = [
     'unfold',  # Unfold must be before django.contrib.admin
+    'unfold.contrib.filters',  # Autocomplete list filters
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -45,12 +46,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'corsheaders',
     'rest_framework',
-    'coreapi',
     'api',
     'drf_spectacular',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
+    # gzip or brotli per Accept-Encoding; before the middleware that reads or writes the body
+    'api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -61,6 +64,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# API_PROFILE=slim: API-only workers, without the admin, the browsable API, the
+# OpenAPI schema, and the sessions and messages only the admin uses (the API
+# authenticates with JWTs). They import less and boot faster; serve the admin and
+# the docs from a worker with the full profile (default).
+API_PROFILE = os.getenv('API_PROFILE', 'full')
+FULL_PROFILE_APPS = [
+    'unfold',
+    'unfold.contrib.filters',
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'drf_spectacular',
+]
+FULL_PROFILE_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+if API_PROFILE == 'slim':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in FULL_PROFILE_APPS]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in FULL_PROFILE_MIDDLEWARE]
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -85,12 +110,55 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the backend: sqlite (default), postgresql or mysql (the
+# driver, e.g. psycopg, must be installed), or a full Django backend path.
+DB_ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+    'mysql': 'django.db.backends.mysql',
+}
+DB_ENGINE = DB_ENGINES.get(os.getenv('DB_ENGINE', 'sqlite'), os.getenv('DB_ENGINE'))
+
+if DB_ENGINE == DB_ENGINES['sqlite']:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv('DB_NAME', 'stock'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', ''),
+        }
     }
+
+# Keep connections open between requests (seconds; 0 closes them after every request)
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# PRAGMAs applied to every new SQLite connection (see api.database).
+# DB_PROFILE=tuned: WAL lets readers run alongside the writer, busy_timeout makes
+# writers queue instead of failing with "database is locked", synchronous=NORMAL
+# is safe with WAL and skips an fsync per commit, mmap_size serves reads from the
+# page cache. DB_PROFILE=default keeps SQLite's own settings.
+SQLITE_PROFILES = {
+    'default': {
+        'journal_mode': 'delete',
+    },
+    'tuned': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20000')),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    },
 }
+SQLITE_PRAGMAS = SQLITE_PROFILES[os.getenv('DB_PROFILE', 'tuned')]
 
 
 # Password validation
@@ -111,6 +179,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: the first hasher hashes new passwords, the others only verify
+# existing hashes (which are upgraded at the next login). PASSWORD_HASHER picks the
+# preferred one (argon2 and bcrypt need argon2-cffi / bcrypt installed);
+# PASSWORD_HASH_ITERATIONS sets the PBKDF2 work factor, i.e. the CPU cost of each login.
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[os.getenv('PASSWORD_HASHER', 'pbkdf2')]]
+PASSWORD_HASHERS += [hasher for hasher in PASSWORD_HASHER_CHOICES.values() if hasher not in PASSWORD_HASHERS]
+PASSWORD_HASHERS.append('django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher')
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', '600000'))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -143,15 +226,104 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Fallback to default
 ]
 
+# Cache backend: "locmem" (per process), "file" (shared between workers on one node)
+# or the dotted path of any Django cache backend
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.cache') if CACHE_BACKEND == 'file' else 'api'),
+    }
+}
+
+# Cached GET responses (products, categories, stats); writes invalidate them
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300')),
+}
+
+# Serve the read endpoints with the async views in api.async_views. Meant for
+# ASGI deployments, e.g. `uvicorn backend.asgi:application`.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Product and category lists built from values() rows instead of serializers (api.rows)
+FAST_LIST_RESPONSES = os.getenv('FAST_LIST_RESPONSES', 'True') == 'True'
+
+# Per-route request metrics (api.metrics), served to admins at /products/api/v1/metrics/.
+# Requests slower than SLOW_REQUEST_MS are logged with their SQL queries.
+REQUEST_METRICS = {
+    'ENABLED': os.getenv('REQUEST_METRICS', 'True') == 'True',
+    'SLOW_REQUEST_MS': int(os.getenv('SLOW_REQUEST_MS', '500')),
+    'SLOW_LOG_MAX_QUERIES': 50,
+}
+
+# Seconds a user's resolved roles are cached (membership changes invalidate immediately)
+ROLE_CACHE_TIMEOUT = int(os.getenv('ROLE_CACHE_TIMEOUT', '60'))
+
+# Seconds the state JWT authentication checks (active, password, username) is cached
+# per user; saving or deleting the user invalidates it immediately (api.authentication)
+AUTH_STATE_CACHE_TIMEOUT = int(os.getenv('AUTH_STATE_CACHE_TIMEOUT', '60'))
+
+# Rows fetched per database round-trip by the streaming catalogue export
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows written per batch by the CSV product import
+IMPORT_BATCH_SIZE = 1000
+
+# Change feed of products and categories (api.changes), polled at /products/api/v1/changes/
+# or streamed as server-sent events from /products/api/v1/changes/stream/ under ASGI
+CHANGE_FEED = {
+    'POLL_INTERVAL': float(os.getenv('CHANGE_FEED_POLL_INTERVAL', '0.5')),
+    'HEARTBEAT_SECONDS': 15,
+    'STREAM_MAX_SECONDS': int(os.getenv('CHANGE_FEED_STREAM_MAX_SECONDS', '300')),
+    'RETRY_MS': 3000,
+    'BATCH_SIZE': 500,
+    'BUFFER_SIZE': 2000,
+    'RETENTION_HOURS': int(os.getenv('CHANGE_FEED_RETENTION_HOURS', '24')),
+}
+
+# Background jobs (api.jobs), run by `python manage.py run_jobs`. FILES_DIR holds
+# uploads waiting to be imported and finished exports; web and worker processes share it.
+JOBS = {
+    'FILES_DIR': os.getenv('JOB_FILES_DIR', str(BASE_DIR / 'jobs')),
+    'POLL_INTERVAL': float(os.getenv('JOB_POLL_INTERVAL', '1')),
+    'PROGRESS_INTERVAL': 0.5,
+    # Running jobs refresh their heartbeat this often; a job silent for STALE_AFTER seconds is failed
+    'HEARTBEAT_INTERVAL': 60,
+    'STALE_AFTER': int(os.getenv('JOB_STALE_AFTER', '600')),
+    'RETENTION_DAYS': int(os.getenv('JOB_RETENTION_DAYS', '7')),
+}
+
+# Low-stock alerts (api.alerts): the level used for products whose product and category
+# set no threshold. Run `python manage.py rebuild_stats` after changing it.
+STOCK_ALERTS = {
+    'LOW_STOCK_THRESHOLD': int(os.getenv('LOW_STOCK_THRESHOLD', '5')),
+}
+
+# Stock history: raw movements are compacted into daily/monthly rollups
+STOCK_HISTORY = {
+    'RAW_RETENTION_DAYS': int(os.getenv('STOCK_HISTORY_RAW_RETENTION_DAYS', '90')),
+    'DAILY_RETENTION_DAYS': int(os.getenv('STOCK_HISTORY_DAILY_RETENTION_DAYS', '730')),
+    'COMPACT_BATCH_SIZE': 5000,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ]
 }
+if API_PROFILE == 'slim':
+    # JSON only, and DRF's own schema class (drf_spectacular is not loaded)
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['rest_framework.renderers.JSONRenderer']
+    del REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS']
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Stock Management API',
@@ -160,13 +332,20 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Schema generated at build time (`python manage.py spectacular --format openapi-json
+# --file openapi.json`), served by /api/schema/ instead of introspecting the views (api.schema)
+SCHEMA_FILE = os.getenv('SCHEMA_FILE') or None
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': False,
+    # Set last_login from the user the login serializer already resolved
+    'UPDATE_LAST_LOGIN': True,
+    # Tokens carry a hash of the password hash: changing the password revokes them
+    'CHECK_REVOKE_TOKEN': True,
 
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
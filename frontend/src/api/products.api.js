@@ -15,7 +15,16 @@ productsApi.interceptors.request.use(
     (error) => Promise.reject(error)
 );
 
-export const getAllProducts = () => productsApi.get('/');
+// The product list is cursor-paginated: follow the `next` links and return every page as one array
+export const getAllProducts = async (params = {}) => {
+    let response = await productsApi.get('/', { params: { page_size: 500, ...params } });
+    const results = [...response.data.results];
+    while (response.data.next) {
+        response = await productsApi.get(response.data.next);
+        results.push(...response.data.results);
+    }
+    return { ...response, data: results };
+};
 
 export const getProduct = (id) => productsApi.get('/' + id + '/')
 
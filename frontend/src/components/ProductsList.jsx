@@ -14,37 +14,39 @@ export function ProductsList({ searchTerm }) {
   const [categoryFilter, setCategoryFilter] = useState('all');
 
   useEffect(() => {
-    async function loadData() {
+    getAllCategories()
+      .then((res) => setCategories(res.data))
+      .catch((error) => console.error("Failed to load categories", error));
+  }, []);
+
+  // Filtering runs on the server; the search box is debounced so typing does not fire a request per key
+  useEffect(() => {
+    const params = {};
+    if (searchTerm.trim()) params.search = searchTerm.trim();
+    if (categoryFilter !== 'all') params.category = categoryFilter;
+    if (stockFilter === 'in-stock') params.min_quantity = 1;
+    if (stockFilter === 'low-stock') Object.assign(params, { min_quantity: 1, max_quantity: 5 });
+    if (stockFilter === 'out-of-stock') params.out_of_stock = true;
+
+    let cancelled = false;
+    const timer = setTimeout(async () => {
       setIsLoading(true);
       try {
-        const [productsRes, categoriesRes] = await Promise.all([
-          getAllProducts(),
-          getAllCategories()
-        ]);
-        setProducts(productsRes.data);
-        setCategories(categoriesRes.data);
+        const productsRes = await getAllProducts(params);
+        if (!cancelled) setProducts(productsRes.data);
       } catch (error) {
         console.error("Failed to load products", error);
       } finally {
-        setIsLoading(false);
+        if (!cancelled) setIsLoading(false);
       }
-    }
-    loadData();
-  }, []);
-
-  const filteredProducts = products
-    .filter((product) => product.name.toLowerCase().includes(searchTerm.toLowerCase()))
-    .filter((product) => {
-      // Filter by stock status
-      if (stockFilter === 'in-stock' && product.quantity === 0) return false;
-      if (stockFilter === 'low-stock' && (product.quantity > 5 || product.quantity === 0)) return false;
-      if (stockFilter === 'out-of-stock' && product.quantity > 0) return false;
-
-      // Filter by category
-      if (categoryFilter !== 'all' && product.category !== parseInt(categoryFilter)) return false;
+    }, searchTerm ? 250 : 0);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm, stockFilter, categoryFilter]);
 
-      return true;
-    })
+  const filteredProducts = [...products]
     .sort((a, b) => {
       if (sortOrder === 'name') return a.name.localeCompare(b.name);
       if (sortOrder === 'price_asc') return a.price - b.price;
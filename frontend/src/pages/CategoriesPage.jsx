@@ -77,6 +77,9 @@ export function CategoriesPage() {
                                     <div>
                                         <h3 className="font-bold text-lg text-gray-900 dark:text-white">{category.name}</h3>
                                         <p className="text-sm text-gray-500 dark:text-gray-400">{category.description || 'No description'}</p>
+                                        <p className="text-xs text-gray-400 dark:text-zinc-500 mt-1">
+                                            {category.product_count ?? 0} products · {category.stock_units ?? 0} units · {category.stock_value ?? 0}€
+                                        </p>
                                     </div>
                                 </div>
                                 <div className="flex gap-2">
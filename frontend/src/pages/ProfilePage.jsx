@@ -59,8 +59,15 @@ export function ProfilePage() {
                 { headers: { Authorization: `Bearer ${token}` } }
             );
 
+            // A password change revokes the old tokens and returns new ones
+            const { access, refresh, ...profile } = res.data;
+            if (access) {
+                localStorage.setItem('access_token', access);
+                localStorage.setItem('refresh_token', refresh);
+            }
+
             // Update user in context
-            setUser(res.data);
+            setUser(profile);
             toast.success('Profile updated successfully!');
         } catch (error) {
             console.error('Profile update failed', error);